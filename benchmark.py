@@ -0,0 +1,276 @@
+"""Benchmark the proposal rendering pipeline.
+
+Runs the load, replace, save and (when a converter is available) convert
+stages, the ZIP passthrough and compiled-plan renderers and live preview
+updates, against synthetic templates and the real files in templates/, and
+writes the timings as JSON:
+
+    python benchmark.py --paragraphs 500 --density 0.3 --output bench.json
+    python benchmark.py --compare bench.json   # exit 1 on a >20% regression
+"""
+import os
+import sys
+import json
+import time
+import random
+import itertools
+import argparse
+import platform
+import statistics
+import tempfile
+import tracemalloc
+from docx import Document
+from docx.oxml import parse_xml
+
+import pdf_generator
+from pdf_generator import (PLACEHOLDER_PATTERN, TEMPLATE_DIR, docx_bytes_to_pdf, iter_paragraphs,
+                           load_template, render_docx_compiled, render_docx_passthrough,
+                           replace_text_preserve_formatting, save_docx_bytes)
+from pdf_converters import get_converter_pool
+from preview import Preview, PreviewTemplate
+
+TEXT_BOX_XML = (
+    '<w:r xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+    ' xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing"'
+    ' xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main"'
+    ' xmlns:wps="http://schemas.microsoft.com/office/word/2010/wordprocessingShape">'
+    '<w:drawing><wp:anchor distT="0" distB="0" distL="0" distR="0" simplePos="0" relativeHeight="{id}"'
+    ' behindDoc="0" locked="0" layoutInCell="1" allowOverlap="1">'
+    '<wp:simplePos x="0" y="0"/>'
+    '<wp:positionH relativeFrom="column"><wp:posOffset>0</wp:posOffset></wp:positionH>'
+    '<wp:positionV relativeFrom="paragraph"><wp:posOffset>0</wp:posOffset></wp:positionV>'
+    '<wp:extent cx="2000000" cy="500000"/><wp:wrapNone/><wp:docPr id="{id}" name="Text Box {id}"/>'
+    '<a:graphic><a:graphicData uri="http://schemas.microsoft.com/office/word/2010/wordprocessingShape">'
+    '<wps:wsp><wps:cNvSpPr txBox="1"/><wps:spPr><a:xfrm><a:off x="0" y="0"/>'
+    '<a:ext cx="2000000" cy="500000"/></a:xfrm><a:prstGeom prst="rect"><a:avLst/></a:prstGeom></wps:spPr>'
+    '<wps:txbx><w:txbxContent><w:p><w:r><w:t xml:space="preserve">{text}</w:t></w:r></w:p></w:txbxContent></wps:txbx>'
+    '<wps:bodyPr/></wps:wsp></a:graphicData></a:graphic></wp:anchor></w:drawing></w:r>'
+)
+
+FILLER = "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor. "
+
+def build_synthetic_template(path, paragraphs=200, density=0.25, fragmented=0.3,
+                             tables=5, nested_tables=True, text_boxes=5, keys=20, seed=0):
+    """Write a synthetic template and return the placeholder keys it uses"""
+    rng = random.Random(seed)
+    placeholder_keys = [f"{{field_{i}}}" for i in range(keys)]
+    doc = Document()
+
+    def add_text(paragraph):
+        if rng.random() >= density:
+            paragraph.add_run(FILLER)
+            return
+        key = rng.choice(placeholder_keys)
+        paragraph.add_run(FILLER[:30])
+        if rng.random() < fragmented:
+            # Split the placeholder across runs the way Word does after edits
+            cut = rng.randint(1, len(key) - 1)
+            paragraph.add_run(key[:cut])
+            paragraph.add_run(key[cut:]).bold = True
+        else:
+            paragraph.add_run(key)
+        paragraph.add_run(FILLER[30:])
+
+    for _ in range(paragraphs):
+        add_text(doc.add_paragraph())
+
+    for _ in range(tables):
+        table = doc.add_table(rows=3, cols=3)
+        for cell in table._cells:
+            add_text(cell.paragraphs[0])
+        if nested_tables:
+            inner = table.cell(1, 1).add_table(rows=2, cols=2)
+            for cell in inner._cells:
+                add_text(cell.paragraphs[0])
+
+    for i in range(text_boxes):
+        paragraph = doc.add_paragraph()
+        text = FILLER[:20] + rng.choice(placeholder_keys)
+        paragraph._p.append(parse_xml(TEXT_BOX_XML.format(id=1000 + i, text=text)))
+
+    doc.save(path)
+    return placeholder_keys
+
+def template_keys(path):
+    """Placeholder keys present in an existing template"""
+    keys = set()
+    for paragraph in iter_paragraphs(Document(path)):
+        keys.update(PLACEHOLDER_PATTERN.findall(paragraph.text))
+    return sorted(keys)
+
+def _time(fn, iterations):
+    """Run fn repeatedly; return (per-call seconds, last result)"""
+    samples = []
+    result = None
+    for _ in range(iterations):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return samples, result
+
+def _peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def _summary(samples, peak_bytes):
+    mean = statistics.fmean(samples)
+    return {
+        "mean_ms": round(mean * 1000, 3),
+        "median_ms": round(statistics.median(samples) * 1000, 3),
+        "min_ms": round(min(samples) * 1000, 3),
+        "ops_per_s": round(1 / mean, 2) if mean else None,
+        "peak_kb": round(peak_bytes / 1024, 1),
+    }
+
+def benchmark_template(path, keys, iterations=20, convert=False):
+    """Time each rendering stage for one template"""
+    replacements = {key: f"Value for {key[1:-1]}" for key in keys}
+    stages = {}
+
+    pdf_generator.clear_template_cache()
+    samples, _ = _time(lambda: Document(path), iterations)
+    stages["parse"] = _summary(samples, _peak_memory(lambda: Document(path)))
+
+    load_template(path)  # warm the template cache
+    samples, _ = _time(lambda: load_template(path), iterations)
+    stages["load"] = _summary(samples, _peak_memory(lambda: load_template(path)))
+
+    docs = [load_template(path) for _ in range(iterations + 1)]
+    replaced = replace_text_preserve_formatting(docs.pop(), replacements)
+    samples, _ = _time(lambda: replace_text_preserve_formatting(docs.pop(), replacements), iterations)
+    stages["replace"] = _summary(samples, _peak_memory(
+        lambda: replace_text_preserve_formatting(load_template(path), replacements)))
+
+    doc = load_template(path)
+    replace_text_preserve_formatting(doc, replacements)
+    samples, docx_bytes = _time(lambda: save_docx_bytes(doc), iterations)
+    stages["save"] = _summary(samples, _peak_memory(lambda: save_docx_bytes(doc)))
+
+    if convert and get_converter_pool() is not None:
+        samples, _ = _time(lambda: docx_bytes_to_pdf(docx_bytes), max(1, iterations // 5))
+        stages["convert"] = _summary(samples, _peak_memory(lambda: docx_bytes_to_pdf(docx_bytes)))
+
+    def end_to_end():
+        rendered = load_template(path)
+        replace_text_preserve_formatting(rendered, replacements)
+        return save_docx_bytes(rendered)
+    samples, _ = _time(end_to_end, iterations)
+    stages["total"] = _summary(samples, _peak_memory(end_to_end))
+
+    # Load + replace + save in one step, copying untouched ZIP entries raw
+    render_docx_passthrough(path, replacements)  # warm its template cache
+    samples, _ = _time(lambda: render_docx_passthrough(path, replacements), iterations)
+    stages["passthrough"] = _summary(samples, _peak_memory(lambda: render_docx_passthrough(path, replacements)))
+
+    # Splicing values into the template's compiled render plan
+    render_docx_compiled(path, replacements)  # compile (or load) the plan once
+    samples, _ = _time(lambda: render_docx_compiled(path, replacements), iterations)
+    stages["compiled"] = _summary(samples, _peak_memory(lambda: render_docx_compiled(path, replacements)))
+
+    # Patching one edited slot of a live preview
+    if keys:
+        preview = Preview(PreviewTemplate(path))
+        preview.update(replacements)
+        edited = dict(replacements)
+        edits = itertools.count()
+        def edit_preview():
+            edited[keys[0]] = f"Edit {next(edits)}"
+            preview.update(edited)
+            return preview.output
+        samples, _ = _time(edit_preview, iterations)
+        stages["preview"] = _summary(samples, _peak_memory(edit_preview))
+
+    return {
+        "template": os.path.basename(path),
+        "size_kb": round(os.path.getsize(path) / 1024, 1),
+        "placeholders": len(keys),
+        "replaced": replaced,
+        "output_kb": round(len(docx_bytes) / 1024, 1),
+        "stages": stages,
+    }
+
+def compare(current, baseline, threshold):
+    """Print stage ratios against a previous run; return True if anything regressed"""
+    previous = {r["template"]: r["stages"] for r in baseline["results"]}
+    regressed = False
+    for result in current["results"]:
+        old_stages = previous.get(result["template"])
+        if not old_stages:
+            continue
+        for stage, numbers in result["stages"].items():
+            if stage not in old_stages or not old_stages[stage]["median_ms"]:
+                continue
+            ratio = numbers["median_ms"] / old_stages[stage]["median_ms"]
+            flag = ""
+            if ratio > threshold:
+                flag = "  REGRESSION"
+                regressed = True
+            print(f"{result['template']:<40} {stage:<8} {ratio:6.2f}x{flag}", file=sys.stderr)
+    return regressed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark proposal rendering stages")
+    parser.add_argument("--paragraphs", type=int, default=200)
+    parser.add_argument("--density", type=float, default=0.25, help="Share of paragraphs with a placeholder")
+    parser.add_argument("--fragmented", type=float, default=0.3, help="Share of placeholders split across runs")
+    parser.add_argument("--tables", type=int, default=5)
+    parser.add_argument("--no-nested-tables", action="store_true")
+    parser.add_argument("--text-boxes", type=int, default=5)
+    parser.add_argument("--keys", type=int, default=20, help="Distinct placeholder keys")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--convert", action="store_true", help="Also time PDF conversion")
+    parser.add_argument("--no-real", action="store_true", help="Skip the templates in templates/")
+    parser.add_argument("--output", "-o", help="Write JSON here instead of stdout")
+    parser.add_argument("--compare", help="Previous JSON result to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Slowdown ratio that counts as a regression")
+    args = parser.parse_args(argv)
+
+    config = {
+        "paragraphs": args.paragraphs, "density": args.density, "fragmented": args.fragmented,
+        "tables": args.tables, "nested_tables": not args.no_nested_tables,
+        "text_boxes": args.text_boxes, "keys": args.keys,
+    }
+    results = []
+    with tempfile.TemporaryDirectory() as scratch:
+        synthetic = os.path.join(scratch, "synthetic.docx")
+        keys = build_synthetic_template(
+            synthetic, paragraphs=args.paragraphs, density=args.density, fragmented=args.fragmented,
+            tables=args.tables, nested_tables=not args.no_nested_tables,
+            text_boxes=args.text_boxes, keys=args.keys)
+        result = benchmark_template(synthetic, keys, args.iterations, args.convert)
+        result["config"] = config
+        results.append(result)
+
+    if not args.no_real and os.path.isdir(TEMPLATE_DIR):
+        for name in sorted(os.listdir(TEMPLATE_DIR)):
+            if name.endswith(".docx"):
+                path = os.path.join(TEMPLATE_DIR, name)
+                results.append(benchmark_template(path, template_keys(path), args.iterations, args.convert))
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            return 1 if compare(report, json.load(f), args.threshold) else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
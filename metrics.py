@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) of the stage duration histogram buckets
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+logger = logging.getLogger("proposals.metrics")
+
+class Metrics:
+    """Thread-safe counters and stage-duration histograms with optional event hooks.
+
+    Hooks are called with a dict for every recorded stage and counter
+    increment, e.g. to write structured log lines.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self._counters = {}
+        self._histograms = {}
+        self._hooks = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self._hooks.append(hook)
+
+    def _emit(self, event):
+        for hook in self._hooks:
+            try:
+                hook(event)
+            except Exception:
+                logger.exception("Metrics hook failed")
+
+    def increment(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        if self._hooks:
+            self._emit({"event": "counter", "name": name, "value": value, **labels})
+
+    def observe(self, stage, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (stage, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(STAGE_BUCKETS), "count": 0, "sum": 0.0}
+            for i, bound in enumerate(STAGE_BUCKETS):
+                if seconds <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+        if self._hooks:
+            self._emit({"event": "stage", "stage": stage, "seconds": round(seconds, 6), **labels})
+
+    @contextmanager
+    def stage(self, stage, timings=None, **labels):
+        """Time the enclosed block as one observation of stage; failures are counted too.
+
+        The duration is also stored as timings[stage] when a dict is given,
+        whether or not recording is enabled.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.increment("proposal_errors_total", stage=stage, error=type(e).__name__, **labels)
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            if timings is not None:
+                timings[stage] = seconds
+            self.observe(stage, seconds, **labels)
+
+    def snapshot(self):
+        """All counters and histograms as plain data"""
+        with self._lock:
+            return {
+                "counters": [{"name": name, "labels": dict(labels), "value": value}
+                             for (name, labels), value in self._counters.items()],
+                "stages": [{"stage": stage, "labels": dict(labels), "count": h["count"], "sum": h["sum"],
+                            "buckets": list(h["buckets"])}
+                           for (stage, labels), h in self._histograms.items()],
+            }
+
+    def merge(self, snapshot):
+        """Add the counters and histograms of a snapshot taken elsewhere, e.g. in a worker process.
+
+        Hooks are not called; the process that recorded the events already did.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            for counter in snapshot["counters"]:
+                key = (counter["name"], tuple(sorted(counter["labels"].items())))
+                self._counters[key] = self._counters.get(key, 0) + counter["value"]
+            for stage in snapshot["stages"]:
+                key = (stage["stage"], tuple(sorted(stage["labels"].items())))
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = {"buckets": [0] * len(STAGE_BUCKETS), "count": 0, "sum": 0.0}
+                for i, count in enumerate(stage["buckets"]):
+                    histogram["buckets"][i] += count
+                histogram["count"] += stage["count"]
+                histogram["sum"] += stage["sum"]
+
+    def render_prometheus(self):
+        """Prometheus text exposition of everything recorded so far"""
+        def format_labels(labels):
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels) + "}"
+
+        lines = []
+        with self._lock:
+            counter_names = sorted({name for name, _ in self._counters})
+            for name in counter_names:
+                lines.append(f"# TYPE {name} counter")
+                for (counter, labels), value in sorted(self._counters.items()):
+                    if counter == name:
+                        lines.append(f"{name}{format_labels(labels)} {value}")
+
+            if self._histograms:
+                metric = "proposal_stage_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for (stage, labels), h in sorted(self._histograms.items()):
+                    base = (("stage", stage),) + labels
+                    for bound, count in zip(STAGE_BUCKETS, h["buckets"]):
+                        lines.append(f"{metric}_bucket{format_labels(base + (('le', bound),))} {count}")
+                    lines.append(f"{metric}_bucket{format_labels(base + (('le', '+Inf'),))} {h['count']}")
+                    lines.append(f"{metric}_sum{format_labels(base)} {h['sum']:.6f}")
+                    lines.append(f"{metric}_count{format_labels(base)} {h['count']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+metrics = Metrics()
+
+def json_log_hook(event):
+    """Write each metrics event as one JSON log line"""
+    logger.info(json.dumps(event, default=str))
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body, content_type = json.dumps(metrics.snapshot()).encode(), "application/json"
+        elif self.path.startswith("/metrics"):
+            body, content_type = metrics.render_prometheus().encode(), "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_server = None
+_server_lock = threading.Lock()
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serve /metrics (Prometheus) and /metrics.json from a daemon thread; safe to call repeatedly"""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, daemon=True, name="metrics-http").start()
+        return _server
+
+def configure_from_env():
+    """PROPOSAL_METRICS=off disables recording, PROPOSAL_METRICS_LOG=1 logs JSON lines,
+    PROPOSAL_METRICS_PORT serves the metrics over HTTP"""
+    if os.environ.get("PROPOSAL_METRICS", "").lower() in ("0", "off", "false"):
+        metrics.enabled = False
+        return
+    if os.environ.get("PROPOSAL_METRICS_LOG", "").lower() in ("1", "on", "true"):
+        metrics.add_hook(json_log_hook)
+    port = os.environ.get("PROPOSAL_METRICS_PORT")
+    if port:
+        try:
+            start_metrics_server(int(port), os.environ.get("PROPOSAL_METRICS_HOST", "127.0.0.1"))
+        except OSError:
+            # Another process (e.g. a second Streamlit worker) already owns the port
+            logger.warning("Metrics port %s is in use, not serving metrics", port)
+
+configure_from_env()
@@ -0,0 +1,1551 @@
+"""Render DOCX files to PDF without an office suite.
+
+Lays out the body of a document - paragraphs, tables, text boxes, pictures
+and DrawingML shapes - with the standard PDF fonts and writes the PDF
+directly. It understands the subset of WordprocessingML the proposal
+templates use rather than all of Word: headers, footers, footnotes and
+fields are left out, table rows are never split across pages and text is
+set in Helvetica, Times or Courier, whichever is closest to the font the
+document asks for. Those fonts only cover Windows-1252, so text outside it
+raises ConversionError instead of being drawn as question marks. In exchange
+it only needs lxml and Pillow and renders a proposal in tens of
+milliseconds, so it runs in-process on any platform. The app only uses it
+when PDF_CONVERTER=native:
+
+    python -m native_pdf "templates/DM Proposal.docx" proposal.pdf
+"""
+import io
+import re
+import sys
+import zlib
+import colorsys
+import time
+import hashlib
+import zipfile
+import argparse
+import functools
+import posixpath
+import threading
+import collections
+from lxml import etree
+from PIL import Image
+from pdf_converters import ConversionError, ConversionTimeout
+
+NAMESPACES = {
+    "w": "http://schemas.openxmlformats.org/wordprocessingml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+    "wp": "http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing",
+    "pic": "http://schemas.openxmlformats.org/drawingml/2006/picture",
+    "wps": "http://schemas.microsoft.com/office/word/2010/wordprocessingShape",
+    "wpg": "http://schemas.microsoft.com/office/word/2010/wordprocessingGroup",
+    "mc": "http://schemas.openxmlformats.org/markup-compatibility/2006",
+    "v": "urn:schemas-microsoft-com:vml",
+}
+REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+OFFICE_DOCUMENT_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+
+@functools.lru_cache(maxsize=None)
+def _q(name):
+    """Clark notation of a prefixed name, e.g. w:p"""
+    prefix, local = name.split(":")
+    return "{%s}%s" % (NAMESPACES[prefix], local)
+
+W_BODY, W_P, W_R, W_T, W_TBL, W_TR, W_TC, W_SDT, W_SDTCONTENT = map(
+    _q, ("w:body", "w:p", "w:r", "w:t", "w:tbl", "w:tr", "w:tc", "w:sdt", "w:sdtContent"))
+W_PPR, W_RPR, W_SECTPR, W_PSTYLE, W_RSTYLE, W_TBLPR, W_TRPR, W_TCPR, W_TBLGRID = map(
+    _q, ("w:pPr", "w:rPr", "w:sectPr", "w:pStyle", "w:rStyle", "w:tblPr", "w:trPr", "w:tcPr", "w:tblGrid"))
+W_TAB, W_BR, W_CR, W_SYM, W_DRAWING, W_PICT, W_NOBREAKHYPHEN, W_TXBXCONTENT = map(
+    _q, ("w:tab", "w:br", "w:cr", "w:sym", "w:drawing", "w:pict", "w:noBreakHyphen", "w:txbxContent"))
+W_HYPERLINK, W_INS, W_SMARTTAG, W_FLDSIMPLE, W_CUSTOMXML = map(
+    _q, ("w:hyperlink", "w:ins", "w:smartTag", "w:fldSimple", "w:customXml"))
+W_VAL, W_TYPE, W_W, W_H, W_ID = map(_q, ("w:val", "w:type", "w:w", "w:h", "w:id"))
+MC_ALTERNATE, MC_CHOICE = _q("mc:AlternateContent"), _q("mc:Choice")
+WP_INLINE, WP_ANCHOR, WP_EXTENT = _q("wp:inline"), _q("wp:anchor"), _q("wp:extent")
+A_GRAPHIC, A_GRAPHICDATA, A_XFRM, A_OFF, A_EXT, A_CHOFF, A_CHEXT = map(
+    _q, ("a:graphic", "a:graphicData", "a:xfrm", "a:off", "a:ext", "a:chOff", "a:chExt"))
+PIC_PIC, WPS_WSP, WPG_WGP, WPG_GRPSP = _q("pic:pic"), _q("wps:wsp"), _q("wpg:wgp"), _q("wpg:grpSp")
+R_EMBED, R_ID = _q("r:embed"), _q("r:id")
+
+EMU_PER_POINT = 12700.0
+# Line height of a single-spaced line as a multiple of the font size
+LINE_FACTORS = {"calibri": 1.22, "cambria": 1.17, "arial": 1.15, "times new roman": 1.15}
+ASCENT_SHARE = 0.78
+# Share of the page body that content may overflow into the bottom margin
+BOTTOM_SLACK = 0.02
+
+# Advance widths (1/1000 em) of the printable ASCII range 32..126 in the
+# standard PDF fonts; the italic faces are close enough to the upright ones
+_ASCII_WIDTHS = {
+    "Helvetica": (
+        "278 278 355 556 556 889 667 191 333 333 389 584 278 333 278 278 " + "556 " * 10 +
+        "278 278 584 584 584 556 1015 667 667 722 722 667 611 778 722 278 500 667 556 833 "
+        "722 778 667 778 722 667 611 722 667 944 667 667 611 278 278 278 469 556 333 556 556 "
+        "500 556 556 278 556 556 222 222 500 222 833 556 556 556 556 333 500 278 556 500 722 "
+        "500 500 500 334 260 334 584"),
+    "Helvetica-Bold": (
+        "278 333 474 556 556 889 722 238 333 333 389 584 278 333 278 278 " + "556 " * 10 +
+        "333 333 584 584 584 611 975 722 722 722 722 667 611 778 722 278 556 722 611 833 "
+        "722 778 667 778 722 667 611 722 667 944 667 667 611 333 278 333 584 556 333 556 611 "
+        "556 611 556 333 611 611 278 278 556 278 889 611 611 611 611 389 556 333 611 556 778 "
+        "556 556 500 389 280 389 584"),
+    "Times-Roman": (
+        "250 333 408 500 500 833 778 180 333 333 500 564 250 333 250 278 " + "500 " * 10 +
+        "278 278 564 564 564 444 921 722 667 667 722 611 556 722 722 333 389 722 611 889 "
+        "722 722 556 722 667 556 611 722 722 944 722 722 611 333 278 333 469 500 333 444 500 "
+        "444 500 444 333 500 500 278 278 500 278 778 500 500 500 500 333 389 278 500 500 722 "
+        "500 500 444 480 200 480 541"),
+    "Times-Bold": (
+        "250 333 555 500 500 1000 833 278 333 333 500 570 250 333 250 278 " + "500 " * 10 +
+        "333 333 570 570 570 500 930 722 667 722 722 667 611 778 778 389 500 778 667 944 "
+        "722 778 611 778 722 556 667 722 722 1000 722 722 667 333 278 333 581 500 333 500 556 "
+        "444 556 444 333 500 556 278 333 556 278 833 556 500 556 556 444 389 333 556 500 722 "
+        "500 500 444 394 220 394 520"),
+}
+# Characters outside ASCII are measured like a similar-looking ASCII string
+_LOOKALIKES = {"\u2018": "'", "\u2019": "'", "\u201c": '"', "\u201d": '"', "\u2013": "-",
+               "\u2014": "mm", "\u2026": "...", "\u2022": "-", "\xa0": " ", "\u20ac": "C",
+               "\xa9": "O", "\xae": "O", "\xb0": "o"}
+# Bullet glyphs of symbol fonts and shapes WinAnsiEncoding has no code for
+_CHAR_MAP = str.maketrans({"\uf0b7": "\u2022", "\uf0a7": "\u2022", "\uf0d8": "\u2022", "\uf076": "\u2022",
+                           "\uf0fc": "\u2022", "\u25cf": "\u2022", "\u25aa": "\u2022", "\u25a0": "\u2022",
+                           "\u2010": "-", "\u2011": "-", "\u2212": "-", "\u200b": None})
+
+def _font_resources():
+    """(family, bold, italic) -> (PDF base font, resource name) for the standard fonts"""
+    fonts = collections.OrderedDict()
+    for family in ("Helvetica", "Times", "Courier"):
+        for bold in (False, True):
+            for italic in (False, True):
+                if family == "Times":
+                    name = "Times-" + {(0, 0): "Roman", (1, 0): "Bold", (0, 1): "Italic", (1, 1): "BoldItalic"}[bold, italic]
+                else:
+                    name = family + ("-" if bold or italic else "") + ("Bold" if bold else "") + ("Oblique" if italic else "")
+                fonts[family, bold, italic] = (name, "F%d" % (len(fonts) + 1))
+    return fonts
+
+FONT_RESOURCES = _font_resources()
+
+HIGHLIGHT_COLORS = {"yellow": "FFFF00", "green": "00FF00", "cyan": "00FFFF", "magenta": "FF00FF",
+                    "blue": "0000FF", "red": "FF0000", "darkBlue": "000080", "darkCyan": "008080",
+                    "darkGreen": "008000", "darkMagenta": "800080", "darkRed": "800000",
+                    "darkYellow": "808000", "darkGray": "808080", "lightGray": "C0C0C0",
+                    "black": "000000", "white": "FFFFFF"}
+
+IMAGE_CACHE_SIZE = 32
+_image_cache = collections.OrderedDict()
+_image_cache_lock = threading.Lock()
+
+def _rgb(value):
+    if not value or value == "auto" or len(value) != 6:
+        return None
+    try:
+        return tuple(int(value[i:i + 2], 16) / 255 for i in (0, 2, 4))
+    except ValueError:
+        return None
+
+def _on(element):
+    return element.get(W_VAL) not in ("0", "false", "off", "none")
+
+def _number(element, attribute, scale=20.0):
+    value = element.get(attribute) if element is not None else None
+    if value is None:
+        return None
+    try:
+        return float(value) / scale
+    except ValueError:
+        return None
+
+def _pdf_string(text):
+    text = text.translate(_CHAR_MAP)
+    try:
+        data = text.encode("cp1252")
+    except UnicodeEncodeError as e:
+        raise ConversionError(f"The standard PDF fonts cannot show {text[e.start:e.end]!r}") from None
+    return data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)").replace(b"\r", b"\\r")
+
+def _font_family(name):
+    name = name.lower()
+    if any(key in name for key in ("courier", "mono", "consolas")):
+        return "Courier", False
+    if any(key in name for key in ("hand", "script")):
+        return "Times", True
+    if "sans" not in name and any(key in name for key in ("times", "cambria", "georgia", "garamond",
+                                                         "serif", "book", "palatino", "roman")):
+        return "Times", False
+    return "Helvetica", False
+
+class _TextStyle:
+    """Everything needed to measure and draw a piece of text"""
+
+    def __init__(self, props):
+        family, italic = _font_family(props["font"])
+        self.font = (family, props["bold"], props["italic"] or italic)
+        self.size = props["size"]
+        self.rise = 0.0
+        if props["vert"] in ("superscript", "subscript"):
+            self.rise = self.size * (0.33 if props["vert"] == "superscript" else -0.08)
+            self.size *= 0.65
+        self.color = props["color"]
+        self.underline = props["underline"]
+        self.strike = props["strike"]
+        self.spacing = props["spacing"]
+        self.scale = props["scale"]
+        self.caps = props["caps"]
+        self.highlight = props["highlight"]
+        natural = props["size"] * LINE_FACTORS.get(props["font"].lower(), 1.17)
+        self.ascent = natural * ASCENT_SHARE
+        self.descent = natural - self.ascent
+        if family == "Courier":
+            self.widths = collections.defaultdict(lambda: 600)
+        else:
+            metrics = _ascii_widths(family + ("-Bold" if props["bold"] else "-Roman" if family == "Times" else ""))
+            self.widths = collections.defaultdict(lambda: metrics["n"], metrics)
+        self.factor = self.size / 1000 * self.scale / 100
+
+    def width(self, text):
+        return sum(map(self.widths.__getitem__, text)) * self.factor + self.spacing * len(text)
+
+_metrics = {}
+
+def _ascii_widths(name):
+    if name not in _metrics:
+        widths = dict(zip(map(chr, range(32, 127)), map(int, _ASCII_WIDTHS[name].split())))
+        for ch, lookalike in _LOOKALIKES.items():
+            widths[ch] = sum(widths[c] for c in lookalike)
+        _metrics[name] = widths
+    return _metrics[name]
+
+RUN_DEFAULTS = {"font": "Times New Roman", "size": 10.0, "bold": False, "italic": False, "color": None,
+                "underline": False, "strike": False, "spacing": 0.0, "scale": 100, "caps": False,
+                "hidden": False, "vert": None, "highlight": None}
+PARAGRAPH_DEFAULTS = {"jc": "left", "left": 0.0, "right": 0.0, "first": 0.0, "before": 0.0, "after": 0.0,
+                      "line": 240.0, "rule": "auto", "tabs": (), "num": None, "page_break": False,
+                      "shading": None}
+
+def _run_props(rpr, props, theme):
+    """props updated with the run properties in rpr"""
+    if rpr is None:
+        return props
+    props = dict(props)
+    for child in rpr:
+        tag = child.tag
+        if tag == _q("w:rFonts"):
+            font = child.get(_q("w:ascii")) or child.get(_q("w:hAnsi"))
+            theme_font = child.get(_q("w:asciiTheme")) or child.get(_q("w:hAnsiTheme"))
+            if font is None and theme_font:
+                font = theme.fonts["major" if theme_font.startswith("major") else "minor"]
+            if font:
+                props["font"] = font
+        elif tag == _q("w:b"):
+            props["bold"] = _on(child)
+        elif tag == _q("w:i"):
+            props["italic"] = _on(child)
+        elif tag == _q("w:sz"):
+            props["size"] = _number(child, W_VAL, 2.0) or props["size"]
+        elif tag == _q("w:color"):
+            props["color"] = _rgb(child.get(W_VAL))
+        elif tag == _q("w:u"):
+            props["underline"] = child.get(W_VAL, "single") != "none"
+        elif tag in (_q("w:strike"), _q("w:dstrike")):
+            props["strike"] = _on(child)
+        elif tag == _q("w:spacing"):
+            props["spacing"] = _number(child, W_VAL) or 0.0
+        elif tag == W_W:
+            props["scale"] = int(_number(child, W_VAL, 1.0) or 100)
+        elif tag in (_q("w:caps"), _q("w:smallCaps")):
+            props["caps"] = _on(child)
+        elif tag in (_q("w:vanish"), _q("w:specVanish")):
+            props["hidden"] = _on(child)
+        elif tag == _q("w:vertAlign"):
+            props["vert"] = child.get(W_VAL)
+        elif tag == _q("w:highlight"):
+            props["highlight"] = _rgb(HIGHLIGHT_COLORS.get(child.get(W_VAL)))
+        elif tag == _q("w:shd"):
+            props["highlight"] = _rgb(child.get(_q("w:fill")))
+    return props
+
+def _para_props(ppr, props):
+    """props updated with the paragraph properties in ppr"""
+    if ppr is None:
+        return props
+    props = dict(props)
+    for child in ppr:
+        tag = child.tag
+        if tag == _q("w:jc"):
+            props["jc"] = child.get(W_VAL)
+        elif tag == _q("w:ind"):
+            for key, attributes in (("left", ("w:left", "w:start")), ("right", ("w:right", "w:end"))):
+                for attribute in attributes:
+                    value = _number(child, _q(attribute))
+                    if value is not None:
+                        props[key] = value
+                        break
+            hanging, first = _number(child, _q("w:hanging")), _number(child, _q("w:firstLine"))
+            if hanging is not None:
+                props["first"] = -hanging
+            elif first is not None:
+                props["first"] = first
+        elif tag == _q("w:spacing"):
+            for key, attribute in (("before", "w:before"), ("after", "w:after")):
+                value = _number(child, _q(attribute))
+                if value is not None:
+                    props[key] = value
+            line = _number(child, _q("w:line"), 1.0)
+            if line is not None:
+                props["line"] = line
+                props["rule"] = child.get(_q("w:lineRule"), "auto")
+        elif tag == _q("w:tabs"):
+            tabs = dict(props["tabs"])
+            for tab in child:
+                position = _number(tab, _q("w:pos"))
+                if position is None:
+                    continue
+                if tab.get(W_VAL) == "clear":
+                    tabs.pop(position, None)
+                else:
+                    tabs[position] = tab.get(W_VAL)
+            props["tabs"] = tuple(sorted(tabs.items()))
+        elif tag == _q("w:numPr"):
+            level, number = child.find(_q("w:ilvl")), child.find(_q("w:numId"))
+            if number is not None:
+                props["num"] = (number.get(W_VAL), int(level.get(W_VAL)) if level is not None else 0)
+        elif tag == _q("w:pageBreakBefore"):
+            props["page_break"] = _on(child)
+        elif tag == _q("w:shd"):
+            props["shading"] = _rgb(child.get(_q("w:fill")))
+    return props
+
+class _Theme:
+    """Theme fonts and colours"""
+
+    def __init__(self, root):
+        self.fonts = {"major": "Calibri Light", "minor": "Calibri"}
+        self.colors = {}
+        if root is None:
+            return
+        for key in ("major", "minor"):
+            latin = root.find(".//a:%sFont/a:latin" % key, NAMESPACES)
+            if latin is not None and latin.get("typeface"):
+                self.fonts[key] = latin.get("typeface")
+        scheme = root.find(".//a:clrScheme", NAMESPACES)
+        for entry in scheme if scheme is not None else ():
+            for color in entry:
+                value = color.get("lastClr") or color.get("val")
+                self.colors[etree.QName(entry).localname] = _rgb(value)
+
+    def color(self, name):
+        name = {"tx1": "dk1", "bg1": "lt1", "tx2": "dk2", "bg2": "lt2"}.get(name, name)
+        return self.colors.get(name)
+
+class _Styles:
+    """Paragraph, character and table styles with their basedOn chains resolved"""
+
+    def __init__(self, root, theme):
+        self.theme = theme
+        self.styles = {}
+        self.defaults = {}
+        self.run_defaults = dict(RUN_DEFAULTS)
+        self.paragraph_defaults = dict(PARAGRAPH_DEFAULTS)
+        self._resolved = {}
+        if root is None:
+            return
+        rpr = root.find("w:docDefaults/w:rPrDefault/w:rPr", NAMESPACES)
+        self.run_defaults = _run_props(rpr, self.run_defaults, theme)
+        ppr = root.find("w:docDefaults/w:pPrDefault/w:pPr", NAMESPACES)
+        self.paragraph_defaults = _para_props(ppr, self.paragraph_defaults)
+        for style in root.iter(_q("w:style")):
+            self.styles[style.get(_q("w:styleId"))] = style
+            if style.get(_q("w:default")) in ("1", "true"):
+                self.defaults[style.get(W_TYPE)] = style.get(_q("w:styleId"))
+
+    def chain(self, style_id, kind):
+        """Style elements from the root of the basedOn chain down to style_id"""
+        chain = []
+        style = self.styles.get(style_id or self.defaults.get(kind))
+        while style is not None and style not in chain:
+            chain.insert(0, style)
+            based_on = style.find(_q("w:basedOn"))
+            style = self.styles.get(based_on.get(W_VAL)) if based_on is not None else None
+        return chain
+
+    def paragraph(self, style_id):
+        """(paragraph props, run props) of a paragraph style"""
+        key = ("paragraph", style_id)
+        if key not in self._resolved:
+            pprops, rprops = self.paragraph_defaults, self.run_defaults
+            for style in self.chain(style_id, "paragraph"):
+                pprops = _para_props(style.find(W_PPR), pprops)
+                rprops = _run_props(style.find(W_RPR), rprops, self.theme)
+            self._resolved[key] = (pprops, rprops)
+        return self._resolved[key]
+
+    def properties(self, style_id, kind, tag):
+        """The tag elements (rPr, tblPr, ...) of a style chain, outermost first"""
+        key = (kind, style_id, tag)
+        if key not in self._resolved:
+            self._resolved[key] = [style.find(tag) for style in self.chain(style_id, kind)
+                                   if style.find(tag) is not None]
+        return self._resolved[key]
+
+class _Numbering:
+    """List levels and the running counters of numbered paragraphs"""
+
+    FORMATS = {
+        "decimal": str,
+        "lowerLetter": lambda n: chr(ord("a") + (n - 1) % 26),
+        "upperLetter": lambda n: chr(ord("A") + (n - 1) % 26),
+        "lowerRoman": lambda n: _roman(n).lower(),
+        "upperRoman": lambda n: _roman(n),
+    }
+
+    def __init__(self, root):
+        self.abstract = {}
+        self.nums = {}
+        self.counters = {}
+        if root is None:
+            return
+        for abstract in root.iter(_q("w:abstractNum")):
+            self.abstract[abstract.get(_q("w:abstractNumId"))] = {
+                int(level.get(_q("w:ilvl"))): level for level in abstract.iter(_q("w:lvl"))}
+        for num in root.iter(_q("w:num")):
+            abstract_id = num.find(_q("w:abstractNumId"))
+            if abstract_id is not None:
+                self.nums[num.get(_q("w:numId"))] = abstract_id.get(W_VAL)
+
+    def level(self, num_id, ilvl):
+        return self.abstract.get(self.nums.get(num_id), {}).get(ilvl)
+
+    def label(self, num_id, ilvl):
+        """The label of the next paragraph in a list, counting it"""
+        levels = self.abstract.get(self.nums.get(num_id), {})
+        level = levels.get(ilvl)
+        if level is None:
+            return ""
+        counters = self.counters.setdefault(num_id, {})
+        start = level.find(_q("w:start"))
+        counters[ilvl] = counters.get(ilvl, int(start.get(W_VAL)) - 1 if start is not None else 0) + 1
+        for deeper in [key for key in counters if key > ilvl]:
+            del counters[deeper]
+
+        text = level.find(_q("w:lvlText"))
+        text = text.get(W_VAL, "") if text is not None else ""
+        fmt = level.find(_q("w:numFmt"))
+        fmt = fmt.get(W_VAL) if fmt is not None else "decimal"
+        if fmt == "bullet":
+            return text.translate(_CHAR_MAP) or "\u2022"
+        for depth in range(ilvl + 1):
+            depth_level = levels.get(depth)
+            depth_fmt = depth_level.find(_q("w:numFmt")) if depth_level is not None else None
+            formatter = self.FORMATS.get(depth_fmt.get(W_VAL) if depth_fmt is not None else "decimal", str)
+            text = text.replace("%%%d" % (depth + 1), formatter(counters.get(depth, 1)))
+        return text
+
+def _roman(number):
+    result = ""
+    for value, numeral in ((1000, "M"), (900, "CM"), (500, "D"), (400, "CD"), (100, "C"), (90, "XC"),
+                           (50, "L"), (40, "XL"), (10, "X"), (9, "IX"), (5, "V"), (4, "IV"), (1, "I")):
+        while number >= value:
+            result += numeral
+            number -= value
+    return result
+
+class _Section:
+    """Page size, margins and columns of a document section, in points"""
+
+    def __init__(self, sect_pr):
+        size = sect_pr.find(_q("w:pgSz")) if sect_pr is not None else None
+        margins = sect_pr.find(_q("w:pgMar")) if sect_pr is not None else None
+        self.width = _number(size, W_W) or 612.0
+        self.height = _number(size, W_H) or 792.0
+        self.top, self.right, self.bottom, self.left = (
+            abs(_number(margins, _q("w:" + side)) or 72.0) for side in ("top", "right", "bottom", "left"))
+        start = sect_pr.find(W_TYPE) if sect_pr is not None else None
+        self.start = start.get(W_VAL) if start is not None else "nextPage"
+
+        body = self.width - self.left - self.right
+        self.columns = [(0.0, body)]
+        cols = sect_pr.find(_q("w:cols")) if sect_pr is not None else None
+        count = int(cols.get(_q("w:num"), "1")) if cols is not None else 1
+        if count > 1:
+            explicit = cols.findall(_q("w:col"))
+            if cols.get(_q("w:equalWidth")) in ("0", "false") and explicit:
+                self.columns, offset = [], 0.0
+                for col in explicit:
+                    width = _number(col, W_W) or body / count
+                    self.columns.append((offset, width))
+                    offset += width + (_number(col, _q("w:space")) or 0.0)
+            else:
+                space = _number(cols, _q("w:space")) or 36.0
+                width = (body - space * (count - 1)) / count
+                self.columns = [(i * (width + space), width) for i in range(count)]
+
+class _Page:
+    """Drawing operations of one page, split into layers behind, with and in front of the text"""
+
+    def __init__(self, section):
+        self.section = section
+        self.width, self.height = section.width, section.height
+        self.behind, self.body, self.front = [], [], []
+        self.ops = self.body
+        self.fonts = set()
+        self.images = set()
+
+    def text(self, x, baseline, text, style, word_spacing=0.0):
+        name, resource = FONT_RESOURCES[style.font]
+        self.fonts.add(style.font)
+        ops = [b"BT /%s %.2f Tf %s" % (resource.encode(), style.size, _fill_color(style.color))]
+        if style.spacing:
+            ops.append(b"%.3f Tc" % style.spacing)
+        if style.scale != 100:
+            ops.append(b"%d Tz" % style.scale)
+        if word_spacing:
+            ops.append(b"%.3f Tw" % word_spacing)
+        if style.rise:
+            ops.append(b"%.2f Ts" % style.rise)
+        ops.append(b"%.2f %.2f Td (%s) Tj" % (x, self.height - baseline, _pdf_string(text)))
+        if style.spacing:
+            ops.append(b"0 Tc")
+        if style.scale != 100:
+            ops.append(b"100 Tz")
+        if word_spacing:
+            ops.append(b"0 Tw")
+        if style.rise:
+            ops.append(b"0 Ts")
+        ops.append(b"ET")
+        self.ops.append(b" ".join(ops))
+
+    def rect(self, x, y, width, height, color):
+        self.ops.append(b"%s %.2f %.2f %.2f %.2f re f" % (
+            _fill_color(color), x, self.height - y - height, width, height))
+
+    def line(self, x1, y1, x2, y2, width, color):
+        self.ops.append(b"%s %.2f w %.2f %.2f m %.2f %.2f l S" % (
+            _stroke_color(color), width, x1, self.height - y1, x2, self.height - y2))
+
+    def image(self, resource, x, y, width, height, clip=None):
+        self.images.add(resource)
+        ops = b"%.2f 0 0 %.2f %.2f %.2f cm /%s Do" % (width, height, x, self.height - y - height, resource.encode())
+        if clip is not None:
+            cx, cy, cw, ch = clip
+            ops = b"%.2f %.2f %.2f %.2f re W n " % (cx, self.height - cy - ch, cw, ch) + ops
+        self.ops.append(b"q " + ops + b" Q")
+
+    def path(self, subpaths, fill, stroke, line_width):
+        if fill is None and stroke is None:
+            return
+        ops = []
+        for subpath in subpaths:
+            for command, points in subpath:
+                coordinates = b" ".join(b"%.2f %.2f" % (x, self.height - y) for x, y in points)
+                ops.append(coordinates + b" " + command if points else command)
+        paint = b"B" if fill is not None and stroke is not None else b"f" if fill is not None else b"S"
+        prefix = b""
+        if fill is not None:
+            prefix += _fill_color(fill) + b" "
+        if stroke is not None:
+            prefix += _stroke_color(stroke) + b" %.2f w " % line_width
+        self.ops.append(b"q " + prefix + b" ".join(ops) + b" " + paint + b" Q")
+
+    def content(self):
+        return b"\n".join(self.behind + self.body + self.front)
+
+def _fill_color(color):
+    return b"%.3f %.3f %.3f rg" % (color or (0, 0, 0))
+
+def _stroke_color(color):
+    return b"%.3f %.3f %.3f RG" % (color or (0, 0, 0))
+
+class _Spacer:
+    """Vertical space between blocks; dropped at a page or column break"""
+
+    blank = True
+
+    def __init__(self, height):
+        self.height = height
+
+    def draw(self, page, x, y):
+        pass
+
+class _Break:
+    """A page or column break"""
+
+    height = 0.0
+
+    def __init__(self, kind):
+        self.kind = kind
+
+class _Line:
+    """One laid-out line of a paragraph"""
+
+    def __init__(self, height, baseline, fragments, anchors=(), shading=None):
+        self.height = height
+        self.baseline = baseline
+        self.fragments = fragments
+        self.anchors = anchors
+        self.shading = shading
+        self.blank = not fragments and not anchors and shading is None
+
+    def draw(self, page, x, y):
+        if self.shading is not None:
+            left, right, color = self.shading
+            page.rect(x + left, y, right - left, self.height, color)
+        baseline = y + self.baseline
+        for kind, offset, value, style, width, word_spacing in self.fragments:
+            if kind == "object":
+                value.draw(page, x + offset, baseline - value.height)
+                continue
+            if style.highlight is not None:
+                page.rect(x + offset, baseline - style.ascent, width, style.ascent + style.descent, style.highlight)
+            page.text(x + offset, baseline - style.rise, value, style, word_spacing)
+            if style.underline:
+                page.rect(x + offset, baseline + style.size * 0.1, width, max(style.size * 0.05, 0.5), style.color)
+            if style.strike:
+                page.rect(x + offset, baseline - style.size * 0.3, width, max(style.size * 0.05, 0.5), style.color)
+        for anchor in self.anchors:
+            anchor.draw(page, x, y)
+
+class _Row:
+    """One table row; rows are never split across pages"""
+
+    blank = False
+
+    def __init__(self, height, cells):
+        self.height = height
+        self.cells = cells
+
+    def draw(self, page, x, y):
+        for cell in self.cells:
+            if cell.shading is not None:
+                page.rect(x + cell.x, y, cell.width, self.height, cell.shading)
+        for cell in self.cells:
+            cy = y + cell.margins[0]
+            if cell.align in ("center", "bottom"):
+                free = self.height - cell.content_height
+                cy += free / 2 if cell.align == "center" else free
+            _draw_items(page, cell.items, x + cell.x + cell.margins[3], cy)
+        for cell in self.cells:
+            left, top, right, bottom = x + cell.x, y, x + cell.x + cell.width, y + self.height
+            for side, (x1, y1, x2, y2) in (("top", (left, top, right, top)), ("bottom", (left, bottom, right, bottom)),
+                                           ("left", (left, top, left, bottom)), ("right", (right, top, right, bottom))):
+                border = cell.borders.get(side)
+                if border is not None:
+                    page.line(x1, y1, x2, y2, border[0], border[1])
+
+class _Cell:
+    def __init__(self, x, width, items, margins, borders, shading, align):
+        self.x, self.width, self.items = x, width, items
+        self.margins, self.borders, self.shading, self.align = margins, borders, shading, align
+        self.content_height = sum(item.height for item in items) + margins[0] + margins[2]
+
+def _draw_items(page, items, x, y):
+    for item in items:
+        if not isinstance(item, _Break):
+            item.draw(page, x, y)
+            y += item.height
+    return y
+
+class _Inline:
+    """A picture, shape or text box drawn in the line of text"""
+
+    def __init__(self, renderer, graphic, width, height):
+        self.renderer, self.graphic = renderer, graphic
+        self.width, self.height = width, height
+
+    def draw(self, page, x, y):
+        self.renderer.draw_graphic(page, self.graphic, (x, y, self.width, self.height))
+
+class _Anchor:
+    """A floating picture, shape or text box positioned relative to the page, margin or paragraph"""
+
+    def __init__(self, renderer, anchor, graphic, width, height):
+        self.renderer, self.graphic = renderer, graphic
+        self.width, self.height = width, height
+        self.behind = anchor.get("behindDoc") in ("1", "true")
+        self.horizontal = self._position(anchor.find(_q("wp:positionH")))
+        self.vertical = self._position(anchor.find(_q("wp:positionV")))
+        self.wrap = next((etree.QName(child).localname for child in anchor
+                          if etree.QName(child).localname.startswith("wrap")), "wrapNone")
+        self.paragraph_offset = 0.0
+
+    @staticmethod
+    def _position(position):
+        if position is None:
+            return "column", None, 0.0
+        offset = position.find(_q("wp:posOffset"))
+        align = position.find(_q("wp:align"))
+        return (position.get("relativeFrom"), align.text if align is not None else None,
+                int(offset.text) / EMU_PER_POINT if offset is not None and offset.text else 0.0)
+
+    @property
+    def pushes_text(self):
+        """Whether the text below has to move past this object (top-and-bottom wrapping)"""
+        return self.vertical[0] in ("paragraph", "line") and self.wrap == "wrapTopAndBottom"
+
+    def bottom(self):
+        """Bottom edge relative to the top of the paragraph"""
+        return self.vertical[2] + self.height
+
+    def draw(self, page, x, y):
+        section = page.section
+        relative, align, offset = self.horizontal
+        if relative == "page":
+            start, span = 0.0, page.width
+        elif relative in ("margin", "insideMargin", "outsideMargin"):
+            start, span = section.left, page.width - section.left - section.right
+        elif relative == "leftMargin":
+            start, span = 0.0, section.left
+        elif relative == "rightMargin":
+            start, span = page.width - section.right, section.right
+        else:
+            start, span = x, page.width - section.right - x
+        left = start + offset
+        if align == "center":
+            left = start + (span - self.width) / 2
+        elif align in ("right", "outside"):
+            left = start + span - self.width
+
+        relative, align, offset = self.vertical
+        if relative == "page":
+            start, span = 0.0, page.height
+        elif relative in ("margin", "insideMargin", "outsideMargin"):
+            start, span = section.top, page.height - section.top - section.bottom
+        elif relative == "topMargin":
+            start, span = 0.0, section.top
+        elif relative == "bottomMargin":
+            start, span = page.height - section.bottom, section.bottom
+        elif relative == "line":
+            start, span = y, 0.0
+        else:
+            start, span = max(y - self.paragraph_offset, 0.0), 0.0
+        top = start + offset
+        if align == "center":
+            top = start + (span - self.height) / 2
+        elif align == "bottom":
+            top = start + span - self.height
+
+        page.ops = page.behind if self.behind else page.front
+        try:
+            self.renderer.draw_graphic(page, self.graphic, (left, top, self.width, self.height))
+        finally:
+            page.ops = page.body
+
+class _Flow:
+    """Places laid-out items on pages, column by column"""
+
+    def __init__(self):
+        self.pages = []
+        self.page = None
+
+    def start_section(self, section):
+        self.section = section
+        if self.page is None or section.start not in ("continuous", "nextColumn"):
+            self.new_page()
+        else:
+            self.top = self.y = self.lowest
+            self.column = 0
+
+    def new_page(self):
+        self.page = _Page(self.section)
+        self.pages.append(self.page)
+        self.top = self.y = self.lowest = self.section.top
+        self.column = 0
+
+    def next_column(self):
+        if self.column + 1 < len(self.section.columns):
+            self.column += 1
+            self.y = self.top
+        else:
+            self.new_page()
+
+    @property
+    def x(self):
+        return self.section.left + self.section.columns[self.column][0]
+
+    @property
+    def width(self):
+        return self.section.columns[self.column][1]
+
+    def place(self, item):
+        if isinstance(item, _Break):
+            if item.kind == "column":
+                self.next_column()
+            else:
+                self.new_page()
+            return
+        section = self.section
+        # Standard-font metrics differ slightly from the fonts the document was laid out
+        # with, so tightly filled pages may run a little into the bottom margin
+        slack = min(section.bottom, BOTTOM_SLACK * (self.page.height - section.top - section.bottom))
+        if self.y + item.height > self.page.height - section.bottom + slack and self.y > self.top + 0.01:
+            if item.blank:
+                # Spacing and empty lines at the foot of a column never start a new one
+                return
+            self.next_column()
+        item.draw(self.page, self.x, self.y)
+        self.y += item.height
+        self.lowest = max(self.lowest, self.y)
+
+class _Renderer:
+    """Lays out one DOCX package"""
+
+    def __init__(self, docx_bytes, timeout=None):
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.zip = zipfile.ZipFile(io.BytesIO(docx_bytes))
+        self.names = set(self.zip.namelist())
+        package_rels = self._rels("")
+        self.part = next((target for target, kind in package_rels.values() if kind == OFFICE_DOCUMENT_REL),
+                         "word/document.xml")
+        self.rels = self._rels(self.part)
+        parts = {kind.rsplit("/", 1)[-1]: target for target, kind in self.rels.values()}
+        self.theme = _Theme(self._xml(parts.get("theme")))
+        self.styles = _Styles(self._xml(parts.get("styles")), self.theme)
+        self.numbering = _Numbering(self._xml(parts.get("numbering")))
+        settings = self._xml(parts.get("settings"))
+        tab = settings.find("w:defaultTabStop", NAMESPACES) if settings is not None else None
+        self.default_tab = _number(tab, W_VAL) or 36.0
+        self.document = self._xml(self.part)
+        self.images = {}
+        self.image_objects = []
+        self._text_styles = {}
+        self._run_styles = {}
+
+    def _xml(self, name):
+        if name is None or name not in self.names:
+            return None
+        return etree.fromstring(self.zip.read(name), etree.XMLParser(resolve_entities=False, huge_tree=True))
+
+    def _rels(self, part):
+        directory, name = posixpath.split(part)
+        rels_name = posixpath.join(directory, "_rels", name + ".rels")
+        rels = {}
+        root = self._xml(rels_name)
+        for rel in root.iter(REL_NS + "Relationship") if root is not None else ():
+            if rel.get("TargetMode") == "External":
+                continue
+            target = rel.get("Target")
+            target = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join(directory, target))
+            rels[rel.get("Id")] = (target, rel.get("Type"))
+        return rels
+
+    def render(self):
+        flow = _Flow()
+        for blocks, section in self._sections(self.document.find(W_BODY)):
+            flow.start_section(section)
+            for block in blocks:
+                self._check_deadline()
+                for item in self.block_items(block, flow.width):
+                    flow.place(item)
+        return _write_pdf(flow.pages, self.image_objects)
+
+    def _check_deadline(self):
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise ConversionTimeout(f"PDF conversion timed out after {self.timeout:g}s")
+
+    def _sections(self, body):
+        sections, blocks = [], []
+        for child in body:
+            if child.tag == W_SECTPR:
+                continue
+            blocks.append(child)
+            sect_pr = child.find("w:pPr/w:sectPr", NAMESPACES) if child.tag == W_P else None
+            if sect_pr is not None:
+                sections.append((blocks, _Section(sect_pr)))
+                blocks = []
+        sections.append((blocks, _Section(body.find(W_SECTPR))))
+        return sections
+
+    def block_items(self, block, width):
+        """Laid-out items of a body-level element (paragraph, table, content control)"""
+        if block.tag == W_P:
+            return self.paragraph_items(block, width)
+        if block.tag == W_TBL:
+            return self.table_items(block, width)
+        if block.tag in (W_SDT, W_CUSTOMXML):
+            content = block.find(W_SDTCONTENT) if block.tag == W_SDT else block
+            items = []
+            for child in content if content is not None else ():
+                items.extend(self.block_items(child, width))
+            return items
+        return []
+
+    def text_style(self, props):
+        key = tuple(props[name] for name in RUN_DEFAULTS)
+        style = self._text_styles.get(key)
+        if style is None:
+            style = self._text_styles[key] = _TextStyle(props)
+        return style
+
+    # Paragraphs
+
+    def paragraph_items(self, paragraph, width):
+        ppr = paragraph.find(W_PPR)
+        style = ppr.find(W_PSTYLE) if ppr is not None else None
+        pprops, rprops = self.styles.paragraph(style.get(W_VAL) if style is not None else None)
+        # List indents sit between the paragraph style and the paragraph's own properties
+        num = _para_props(ppr, pprops)["num"]
+        label = None
+        if num is not None and num[0] != "0":
+            level = self.numbering.level(*num)
+            if level is not None:
+                pprops = _para_props(level.find(W_PPR), pprops)
+                label = (self.numbering.label(*num), level.find(W_RPR))
+        pprops = _para_props(ppr, pprops)
+        mark = _run_props(ppr.find(W_RPR) if ppr is not None else None, rprops, self.theme)
+
+        tokens = []
+        if label is not None and label[0]:
+            label_style = self.text_style(_run_props(label[1], mark, self.theme))
+            tokens.append(["text", label[0], label_style, label_style.width(label[0])])
+            tokens.append(["tab", None, label_style, 0.0])
+        self._inline_tokens(paragraph, rprops, tokens)
+
+        items = []
+        if pprops["page_break"]:
+            items.append(_Break("page"))
+        if pprops["before"]:
+            items.append(_Spacer(pprops["before"]))
+        items.extend(self._lines(tokens, pprops, self.text_style(mark), width))
+        if pprops["after"]:
+            items.append(_Spacer(pprops["after"]))
+        return items
+
+    def _inline_tokens(self, element, rprops, tokens):
+        for child in element:
+            tag = child.tag
+            if tag == W_R:
+                self._run_tokens(child, rprops, tokens)
+            elif tag in (W_HYPERLINK, W_INS, W_SMARTTAG, W_FLDSIMPLE, W_CUSTOMXML):
+                self._inline_tokens(child, rprops, tokens)
+            elif tag == W_SDT:
+                content = child.find(W_SDTCONTENT)
+                if content is not None:
+                    self._inline_tokens(content, rprops, tokens)
+            elif tag == MC_ALTERNATE:
+                choice = child.find(MC_CHOICE)
+                if choice is not None:
+                    self._inline_tokens(choice, rprops, tokens)
+
+    def _run_tokens(self, run, rprops, tokens):
+        rpr = run.find(W_RPR)
+        # Runs repeat the same handful of formats, so resolve each one once per paragraph style
+        key = (id(rprops), tuple((child.tag, tuple(child.attrib.values())) for child in rpr) if rpr is not None else None)
+        if key not in self._run_styles:
+            props = rprops
+            if rpr is not None:
+                run_style = rpr.find(W_RSTYLE)
+                if run_style is not None:
+                    for style_rpr in self.styles.properties(run_style.get(W_VAL), "character", W_RPR):
+                        props = _run_props(style_rpr, props, self.theme)
+                props = _run_props(rpr, props, self.theme)
+            self._run_styles[key] = (rprops, None if props["hidden"] else self.text_style(props))
+        style = self._run_styles[key][1]
+        if style is not None:
+            self._content_tokens(run, style, tokens)
+
+    def _content_tokens(self, run, style, tokens):
+        for child in run:
+            tag = child.tag
+            if tag == W_T:
+                text = child.text or ""
+                if style.caps:
+                    text = text.upper()
+                for piece in _WORDS.findall(text):
+                    tokens.append(["space" if piece[0] == " " else "text", piece, style, style.width(piece)])
+            elif tag == W_TAB:
+                tokens.append(["tab", None, style, 0.0])
+            elif tag == W_BR:
+                kind = child.get(W_TYPE)
+                tokens.append(["break", kind if kind in ("page", "column") else "line", style, 0.0])
+            elif tag == W_CR:
+                tokens.append(["break", "line", style, 0.0])
+            elif tag == W_NOBREAKHYPHEN:
+                tokens.append(["text", "-", style, style.width("-")])
+            elif tag == W_SYM:
+                tokens.append(["text", "\u2022", style, style.width("\u2022")])
+            elif tag == W_DRAWING:
+                self._drawing_tokens(child, tokens)
+            elif tag == W_PICT:
+                self._vml_tokens(child, tokens)
+            elif tag == MC_ALTERNATE:
+                choice = child.find(MC_CHOICE)
+                if choice is not None:
+                    self._content_tokens(choice, style, tokens)
+
+    def _drawing_tokens(self, drawing, tokens):
+        for frame in drawing:
+            extent = frame.find(WP_EXTENT)
+            data = frame.find("a:graphic/a:graphicData", NAMESPACES)
+            if extent is None or data is None:
+                continue
+            width, height = int(extent.get("cx")) / EMU_PER_POINT, int(extent.get("cy")) / EMU_PER_POINT
+            if frame.tag == WP_INLINE:
+                inline = _Inline(self, data, width, height)
+                tokens.append(["object", inline, None, width])
+            elif frame.tag == WP_ANCHOR:
+                tokens.append(["anchor", _Anchor(self, frame, data, width, height), None, 0.0])
+
+    def _vml_tokens(self, pict, tokens):
+        """Legacy VML pictures and text boxes, drawn in line with the text"""
+        for shape in pict:
+            style = dict(part.split(":", 1) for part in (shape.get("style") or "").split(";") if ":" in part)
+            width, height = _css_length(style.get("width")), _css_length(style.get("height"))
+            if width and height:
+                tokens.append(["object", _Inline(self, shape, width, height), None, width])
+
+    def _lines(self, tokens, pprops, mark_style, width):
+        """Break a paragraph's tokens into lines"""
+        right_edge = width - pprops["right"]
+        items, line, line_anchors = [], [], []
+        first = True
+        x = start = pprops["left"] + pprops["first"]
+        offset = 0.0
+
+        def finish(last):
+            nonlocal line, line_anchors, x, start, first, offset
+            built = self._line(line, line_anchors, pprops, mark_style, width, start, last)
+            for anchor in line_anchors:
+                anchor.paragraph_offset = offset
+            items.append(built)
+            offset += built.height
+            for anchor in line_anchors:
+                if anchor.pushes_text and anchor.bottom() > offset:
+                    items.append(_Spacer(anchor.bottom() - offset))
+                    offset = anchor.bottom()
+            line, line_anchors = [], []
+            first = False
+            x = start = pprops["left"]
+
+        index, count = 0, len(tokens)
+        while index < count:
+            token = tokens[index]
+            kind = token[0]
+            if kind in ("text", "object", "anchor"):
+                # Runs without a space between them wrap as one word
+                end, group = index, 0.0
+                while end < count and tokens[end][0] in ("text", "object", "anchor"):
+                    group += tokens[end][3]
+                    end += 1
+                if x + group > right_edge + 0.01 and any(t[0] != "space" for t in line):
+                    finish(False)
+                for grouped in tokens[index:end]:
+                    if grouped[0] == "anchor":
+                        line_anchors.append(grouped[1])
+                    else:
+                        line.append(grouped)
+                x += group
+                index = end
+                continue
+            if kind == "space":
+                # Spaces are kept at the start of a paragraph but not of a wrapped line
+                if line or first:
+                    line.append(token)
+                    x += token[3]
+            elif kind == "tab":
+                token = list(token)
+                token[3] = max(self._tab_stop(x, pprops, tokens, index) - x, 0.0)
+                line.append(token)
+                x += token[3]
+            elif kind == "break":
+                finish(True)
+                if token[1] in ("page", "column"):
+                    items.append(_Break(token[1]))
+            index += 1
+        if line or line_anchors or not tokens or tokens[-1][0] == "break":
+            finish(True)
+        return items
+
+    def _tab_stop(self, x, pprops, tokens, index):
+        for position, align in pprops["tabs"]:
+            if position > x + 0.01 and align not in ("clear", "bar"):
+                break
+        else:
+            position, align = None, "left"
+        if pprops["first"] < 0 and x < pprops["left"] - 0.01 and (position is None or position > pprops["left"]):
+            return pprops["left"]  # the hanging indent of a list acts as a tab stop
+        if position is None:
+            return (int(x / self.default_tab) + 1) * self.default_tab
+        if align in ("right", "end", "center", "decimal"):
+            following = 0.0
+            for token in tokens[index + 1:]:
+                if token[0] in ("tab", "break"):
+                    break
+                following += token[3]
+            shift = following if align != "center" else following / 2
+            return max(position - shift, x)
+        return position
+
+    def _line(self, tokens, anchors, pprops, mark_style, width, start, last):
+        while tokens and tokens[-1][0] == "space":
+            tokens = tokens[:-1]
+        ascent = descent = 0.0
+        for kind, value, style, _ in tokens:
+            if kind == "object":
+                ascent = max(ascent, value.height)
+            elif kind != "tab" or len(tokens) == 1:
+                ascent, descent = max(ascent, style.ascent), max(descent, style.descent)
+        if not ascent and not descent:
+            ascent, descent = mark_style.ascent, mark_style.descent
+        natural = ascent + descent
+        line, rule = pprops["line"], pprops["rule"]
+        if rule == "exact":
+            height = line / 20
+            baseline = height - descent
+        elif rule == "atLeast":
+            height = max(natural, line / 20)
+            baseline = height - descent
+        else:
+            height = natural * line / 240
+            baseline = ascent
+
+        content = sum(token[3] for token in tokens)
+        available = width - pprops["right"] - start
+        jc = pprops["jc"]
+        offset, spacing = start, 0.0
+        if jc == "center":
+            offset += (available - content) / 2
+        elif jc in ("right", "end"):
+            offset += available - content
+        elif jc in ("both", "distribute") and not last:
+            spaces = sum(len(token[1]) for token in tokens if token[0] == "space")
+            if spaces and available > content:
+                spacing = (available - content) / spaces
+
+        fragments = []
+        x = offset
+        joinable = False  # a tab ends the fragment before it
+        for kind, value, style, token_width in tokens:
+            if kind == "space":
+                token_width += spacing * len(value)
+            if kind in ("text", "space") and joinable and fragments[-1][3] is style:
+                previous = fragments[-1]
+                fragments[-1] = ("text", previous[1], previous[2] + value, style, previous[4] + token_width, spacing)
+            elif kind in ("text", "space"):
+                fragments.append(("text", x, value, style, token_width, spacing))
+            elif kind == "object":
+                fragments.append(("object", x, value, None, token_width, 0.0))
+            joinable = kind in ("text", "space")
+            x += token_width
+        shading = (pprops["left"], width - pprops["right"], pprops["shading"]) if pprops["shading"] else None
+        return _Line(height, baseline, fragments, anchors, shading)
+
+    # Tables
+
+    def table_items(self, table, width):
+        tbl_pr = table.find(W_TBLPR)
+        style = tbl_pr.find(_q("w:tblStyle")) if tbl_pr is not None else None
+        chain = self.styles.properties(style.get(W_VAL) if style is not None else None, "table", W_TBLPR)
+        chain = chain + ([tbl_pr] if tbl_pr is not None else [])
+        borders, margins, indent, jc = {}, {"top": 0.0, "left": 5.4, "bottom": 0.0, "right": 5.4}, 0.0, None
+        for properties in chain:
+            borders.update(_borders(properties.find(_q("w:tblBorders"))))
+            margins.update(_margins(properties.find(_q("w:tblCellMar"))))
+            table_indent = properties.find(_q("w:tblInd"))
+            if table_indent is not None:
+                indent = _number(table_indent, W_W) or 0.0
+            align = properties.find(_q("w:jc"))
+            jc = align.get(W_VAL) if align is not None else jc
+
+        grid = [_number(col, W_W) or 0.0 for col in table.findall("w:tblGrid/w:gridCol", NAMESPACES)]
+        rows = [row for row in table.iterchildren(W_TR)]
+        if not grid or not sum(grid):
+            count = max((len(row.findall(W_TC)) for row in rows), default=1) or 1
+            grid = [width / count] * count
+        offsets = [sum(grid[:i]) for i in range(len(grid) + 1)]
+        table_x = indent
+        if jc == "center":
+            table_x = (width - offsets[-1]) / 2
+        elif jc in ("right", "end"):
+            table_x = width - offsets[-1]
+
+        layout = []
+        for row in rows:
+            tr_pr = row.find(W_TRPR)
+            before = tr_pr.find(_q("w:gridBefore")) if tr_pr is not None else None
+            column = int(before.get(W_VAL)) if before is not None else 0
+            cells = []
+            for cell in row.iterchildren(W_TC):
+                tc_pr = cell.find(W_TCPR)
+                span = tc_pr.find(_q("w:gridSpan")) if tc_pr is not None else None
+                span = int(span.get(W_VAL)) if span is not None else 1
+                merge = tc_pr.find(_q("w:vMerge")) if tc_pr is not None else None
+                merge = merge.get(W_VAL, "continue") if merge is not None else None
+                cells.append((cell, tc_pr, column, min(column + span, len(grid)), merge))
+                column += span
+            layout.append((row, tr_pr, cells))
+
+        items = []
+        for row_index, (row, tr_pr, cells) in enumerate(layout):
+            # One large table can take longer than the whole rest of the body
+            self._check_deadline()
+            built = []
+            for cell, tc_pr, first, last, merge in cells:
+                x, cell_width = table_x + offsets[first], offsets[last] - offsets[first]
+                cell_margins = dict(margins)
+                cell_borders = {
+                    "top": borders.get("top" if row_index == 0 else "insideH"),
+                    "bottom": borders.get("bottom" if row_index == len(layout) - 1 else "insideH"),
+                    "left": borders.get("left" if first == 0 else "insideV"),
+                    "right": borders.get("right" if last == len(grid) else "insideV"),
+                }
+                shading, align = None, "top"
+                if tc_pr is not None:
+                    cell_margins.update(_margins(tc_pr.find(_q("w:tcMar"))))
+                    cell_borders.update(_borders(tc_pr.find(_q("w:tcBorders"))))
+                    shd = tc_pr.find(_q("w:shd"))
+                    shading = _rgb(shd.get(_q("w:fill"))) if shd is not None else None
+                    valign = tc_pr.find(_q("w:vAlign"))
+                    align = valign.get(W_VAL) if valign is not None else "top"
+                if merge == "continue":
+                    cell_borders["top"] = None
+                if _continues_below(layout, row_index, first):
+                    cell_borders["bottom"] = None
+                inner = cell_width - cell_margins["left"] - cell_margins["right"]
+                content = []
+                if merge != "continue":
+                    for block in cell:
+                        content.extend(self.block_items(block, inner))
+                built.append(_Cell(x, cell_width, [item for item in content if not isinstance(item, _Break)],
+                                   (cell_margins["top"], cell_margins["right"], cell_margins["bottom"],
+                                    cell_margins["left"]), cell_borders, shading, align))
+            height = max((cell.content_height for cell in built), default=0.0)
+            row_height = tr_pr.find(_q("w:trHeight")) if tr_pr is not None else None
+            if row_height is not None:
+                value = _number(row_height, W_VAL) or 0.0
+                height = value if row_height.get(_q("w:hRule")) == "exact" else max(height, value)
+            items.append(_Row(height, built))
+        return items
+
+    # Pictures, shapes and text boxes
+
+    def draw_graphic(self, page, data, box):
+        if data.tag in (_q("v:shape"), _q("v:rect"), _q("v:roundrect"), _q("v:oval")):
+            self._draw_vml(page, data, box)
+            return
+        for child in data:
+            if child.tag == PIC_PIC:
+                self._draw_picture(page, child, box)
+            elif child.tag == WPS_WSP:
+                self._draw_shape(page, child, box)
+            elif child.tag in (WPG_WGP, WPG_GRPSP):
+                self._draw_group(page, child, box)
+
+    def _draw_group(self, page, group, box):
+        xfrm = group.find("*/a:xfrm", NAMESPACES)
+        child_offset = xfrm.find(A_CHOFF) if xfrm is not None else None
+        child_extent = xfrm.find(A_CHEXT) if xfrm is not None else None
+        if child_offset is None or child_extent is None:
+            origin, scale = (0.0, 0.0), (1 / EMU_PER_POINT, 1 / EMU_PER_POINT)
+        else:
+            origin = (int(child_offset.get("x")), int(child_offset.get("y")))
+            scale = (box[2] / max(int(child_extent.get("cx")), 1), box[3] / max(int(child_extent.get("cy")), 1))
+        for child in group:
+            if child.tag not in (PIC_PIC, WPS_WSP, WPG_GRPSP):
+                continue
+            child_xfrm = child.find("*/a:xfrm", NAMESPACES)
+            offset = child_xfrm.find(A_OFF) if child_xfrm is not None else None
+            extent = child_xfrm.find(A_EXT) if child_xfrm is not None else None
+            if offset is None or extent is None:
+                continue
+            child_box = (box[0] + (int(offset.get("x")) - origin[0]) * scale[0],
+                         box[1] + (int(offset.get("y")) - origin[1]) * scale[1],
+                         int(extent.get("cx")) * scale[0], int(extent.get("cy")) * scale[1])
+            if child.tag == PIC_PIC:
+                self._draw_picture(page, child, child_box)
+            elif child.tag == WPS_WSP:
+                self._draw_shape(page, child, child_box)
+            else:
+                self._draw_group(page, child, child_box)
+
+    def _draw_picture(self, page, picture, box):
+        blip = picture.find("pic:blipFill/a:blip", NAMESPACES)
+        resource = self.image(blip.get(R_EMBED) if blip is not None else None)
+        if resource is None:
+            return
+        crop = picture.find("pic:blipFill/a:srcRect", NAMESPACES)
+        x, y, width, height = box
+        if crop is None:
+            page.image(resource, x, y, width, height)
+            return
+        left, top, right, bottom = (int(crop.get(side, 0)) / 100000 for side in ("l", "t", "r", "b"))
+        full_width = width / max(1 - left - right, 0.01)
+        full_height = height / max(1 - top - bottom, 0.01)
+        page.image(resource, x - full_width * left, y - full_height * top, full_width, full_height,
+                   clip=(x, y, width, height))
+
+    def _draw_shape(self, page, shape, box):
+        properties = shape.find(_q("wps:spPr"))
+        style = shape.find(_q("wps:style"))
+        fill, stroke, line_width = None, None, 0.75
+        if properties is not None:
+            fill = self._fill(properties, style, "fillRef")
+            outline = properties.find(_q("a:ln"))
+            if outline is not None and outline.find(_q("a:noFill")) is None:
+                stroke = self._drawing_color(outline.find(_q("a:solidFill")))
+                if stroke is None and style is not None:
+                    stroke = self._drawing_color(style.find(_q("a:lnRef")))
+                line_width = int(outline.get("w", 9525)) / EMU_PER_POINT
+            elif outline is None and style is not None:
+                stroke = self._drawing_color(style.find(_q("a:lnRef")))
+            page.path(self._geometry(properties, box), fill, stroke, line_width)
+
+        content = shape.find("wps:txbx/w:txbxContent", NAMESPACES)
+        if content is not None:
+            body = shape.find(_q("wps:bodyPr"))
+            insets = [int(body.get(key, default)) / EMU_PER_POINT if body is not None else default / EMU_PER_POINT
+                      for key, default in (("lIns", 91440), ("tIns", 45720), ("rIns", 91440), ("bIns", 45720))]
+            self._draw_text_box(page, content, box, insets, body.get("anchor") if body is not None else None)
+
+    def _draw_text_box(self, page, content, box, insets, anchor=None):
+        x, y, width, height = box
+        items = []
+        for block in content:
+            items.extend(item for item in self.block_items(block, width - insets[0] - insets[2])
+                         if not isinstance(item, _Break))
+        top = y + insets[1]
+        if anchor in ("ctr", "b"):
+            free = height - insets[1] - insets[3] - sum(item.height for item in items)
+            top += free / 2 if anchor == "ctr" else free
+        _draw_items(page, items, x + insets[0], top)
+
+    def _fill(self, properties, style, reference):
+        if properties.find(_q("a:noFill")) is not None:
+            return None
+        for fill in (_q("a:solidFill"), _q("a:gradFill")):
+            element = properties.find(fill)
+            if element is not None:
+                if fill == _q("a:gradFill"):
+                    element = element.find("a:gsLst/a:gs", NAMESPACES)
+                return self._drawing_color(element)
+        if style is not None:
+            ref = style.find(_q("a:" + reference))
+            if ref is not None and ref.get("idx") != "0":
+                return self._drawing_color(ref)
+        return None
+
+    def _drawing_color(self, parent):
+        if parent is None:
+            return None
+        for child in parent:
+            name = etree.QName(child).localname
+            if name == "srgbClr":
+                color = _rgb(child.get("val"))
+            elif name == "schemeClr":
+                color = self.theme.color(child.get("val"))
+            elif name == "sysClr":
+                color = _rgb(child.get("lastClr"))
+            elif name == "prstClr":
+                color = _rgb(HIGHLIGHT_COLORS.get(child.get("val")))
+            else:
+                continue
+            if color is None:
+                return None
+            modifiers = {etree.QName(m).localname: int(m.get("val")) / 100000 for m in child}
+            if "lumMod" in modifiers or "lumOff" in modifiers:
+                h, l, s = colorsys.rgb_to_hls(*color)
+                l = min(max(l * modifiers.get("lumMod", 1) + modifiers.get("lumOff", 0), 0), 1)
+                color = colorsys.hls_to_rgb(h, l, s)
+            return color
+        return None
+
+    def _geometry(self, properties, box):
+        x, y, width, height = box
+        preset = properties.find(_q("a:prstGeom"))
+        custom = properties.find(_q("a:custGeom"))
+        if custom is not None:
+            subpaths = []
+            for path in custom.iterfind("a:pathLst/a:path", NAMESPACES):
+                scale_x = width / max(int(path.get("w", 0)) or width * EMU_PER_POINT, 1)
+                scale_y = height / max(int(path.get("h", 0)) or height * EMU_PER_POINT, 1)
+                commands = []
+                for command in path:
+                    points = [(x + int(pt.get("x")) * scale_x, y + int(pt.get("y")) * scale_y)
+                              for pt in command.iter(_q("a:pt"))]
+                    name = etree.QName(command).localname
+                    if name == "moveTo" and points:
+                        commands.append((b"m", points))
+                    elif name == "lnTo" and points:
+                        commands.append((b"l", points))
+                    elif name == "cubicBezTo" and len(points) == 3:
+                        commands.append((b"c", points))
+                    elif name == "quadBezTo" and len(points) == 2:
+                        commands.append((b"c", [points[0], points[0], points[1]]))
+                    elif name == "close":
+                        commands.append((b"h", []))
+                subpaths.append(commands)
+            return subpaths
+        shape = preset.get("prst") if preset is not None else "rect"
+        if shape in ("line", "straightConnector1"):
+            return [[(b"m", [(x, y)]), (b"l", [(x + width, y + height)])]]
+        if shape == "ellipse":
+            k = 0.5523
+            cx, cy, rx, ry = x + width / 2, y + height / 2, width / 2, height / 2
+            return [[(b"m", [(cx + rx, cy)]),
+                     (b"c", [(cx + rx, cy + k * ry), (cx + k * rx, cy + ry), (cx, cy + ry)]),
+                     (b"c", [(cx - k * rx, cy + ry), (cx - rx, cy + k * ry), (cx - rx, cy)]),
+                     (b"c", [(cx - rx, cy - k * ry), (cx - k * rx, cy - ry), (cx, cy - ry)]),
+                     (b"c", [(cx + k * rx, cy - ry), (cx + rx, cy - k * ry), (cx + rx, cy)]),
+                     (b"h", [])]]
+        return [[(b"m", [(x, y)]), (b"l", [(x + width, y)]), (b"l", [(x + width, y + height)]),
+                 (b"l", [(x, y + height)]), (b"h", [])]]
+
+    def _draw_vml(self, page, shape, box):
+        fill = _rgb((shape.get("fillcolor") or "").lstrip("#")[:6]) if shape.get("filled") not in ("f", "false") else None
+        if fill is not None:
+            page.rect(box[0], box[1], box[2], box[3], fill)
+        image = shape.find(_q("v:imagedata"))
+        if image is not None:
+            resource = self.image(image.get(R_ID))
+            if resource is not None:
+                page.image(resource, *box)
+        content = shape.find("v:textbox/w:txbxContent", NAMESPACES)
+        if content is not None:
+            self._draw_text_box(page, content, box, (7.2, 3.6, 7.2, 3.6))
+
+    def image(self, rel_id):
+        """PDF resource name of an embedded image, or None if it cannot be drawn"""
+        target = self.rels.get(rel_id, (None,))[0]
+        if target is None or target not in self.names:
+            return None
+        if target not in self.images:
+            encoded = _encode_image(self.zip.read(target))
+            if encoded is None:
+                self.images[target] = None
+            else:
+                self.images[target] = "Im%d" % (len(self.image_objects) + 1)
+                self.image_objects.append((self.images[target], encoded))
+        return self.images[target]
+
+_WORDS = re.compile(r"[^ ]+| +")
+
+def _css_length(value):
+    match = re.match(r"\s*([-\d.]+)\s*(pt|in|px|cm|mm)?", value or "")
+    if not match:
+        return None
+    return float(match.group(1)) * {"pt": 1, "in": 72, "px": 0.75, "cm": 28.3465, "mm": 2.83465, None: 0.75}[match.group(2)]
+
+def _borders(element):
+    borders = {}
+    for child in element if element is not None else ():
+        side = etree.QName(child).localname
+        side = {"start": "left", "end": "right"}.get(side, side)
+        if child.get(W_VAL) in ("nil", "none"):
+            borders[side] = None
+        else:
+            borders[side] = (max((_number(child, _q("w:sz"), 8.0) or 4 / 8.0), 0.25), _rgb(child.get(_q("w:color"))))
+    return borders
+
+def _margins(element):
+    margins = {}
+    for child in element if element is not None else ():
+        side = etree.QName(child).localname
+        side = {"start": "left", "end": "right"}.get(side, side)
+        value = _number(child, W_W)
+        if value is not None:
+            margins[side] = value
+    return margins
+
+def _continues_below(layout, row_index, column):
+    if row_index + 1 >= len(layout):
+        return False
+    return any(first == column and merge == "continue" for _, _, first, _, merge in layout[row_index + 1][2])
+
+def _encode_image(data):
+    """(dictionary, stream, soft mask) of a PDF image XObject for image bytes, or None"""
+    key = hashlib.sha1(data).digest()
+    with _image_cache_lock:
+        if key in _image_cache:
+            _image_cache.move_to_end(key)
+            return _image_cache[key]
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.format == "JPEG" and image.mode in ("L", "RGB", "CMYK"):
+            # JPEG data goes into the PDF as is
+            space = {"L": b"/DeviceGray", "RGB": b"/DeviceRGB", "CMYK": b"/DeviceCMYK /Decode [1 0 1 0 1 0 1 0]"}[image.mode]
+            encoded = (b"/Width %d /Height %d /ColorSpace %s /BitsPerComponent 8 /Filter /DCTDecode"
+                       % (image.width, image.height, space), data, None)
+        else:
+            image.load()
+            alpha = None
+            if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+                image = image.convert("RGBA" if image.mode != "LA" else "LA")
+                alpha = image.getchannel("A")
+                if alpha.getextrema()[0] == 255:
+                    alpha = None
+            gray = image.mode in ("L", "LA", "1", "I", "I;16")
+            image = image.convert("L" if gray else "RGB")
+            soft_mask = None
+            if alpha is not None:
+                soft_mask = (b"/Width %d /Height %d /ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode"
+                             % alpha.size, zlib.compress(alpha.tobytes(), 6))
+            encoded = (b"/Width %d /Height %d /ColorSpace %s /BitsPerComponent 8 /Filter /FlateDecode"
+                       % (image.width, image.height, b"/DeviceGray" if gray else b"/DeviceRGB"),
+                       zlib.compress(image.tobytes(), 6), soft_mask)
+    except Exception:
+        encoded = None  # EMF, WMF, SVG and anything else Pillow cannot decode
+    with _image_cache_lock:
+        _image_cache[key] = encoded
+        while len(_image_cache) > IMAGE_CACHE_SIZE:
+            _image_cache.popitem(last=False)
+    return encoded
+
+def _write_pdf(pages, images):
+    objects = [None, None]  # catalog and page tree, filled in last
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    def stream(dictionary, data):
+        return b"<< %s /Length %d >>\nstream\n%s\nendstream" % (dictionary, len(data), data)
+
+    fonts = set().union(*(page.fonts for page in pages))
+    font_refs = [b"/%s %d 0 R" % (resource.encode(), add(
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>" % name.encode()))
+        for key, (name, resource) in FONT_RESOURCES.items() if key in fonts]
+    image_refs = []
+    for resource, (dictionary, data, soft_mask) in images:
+        if soft_mask is not None:
+            dictionary += b" /SMask %d 0 R" % add(stream(b"/Type /XObject /Subtype /Image " + soft_mask[0], soft_mask[1]))
+        image_refs.append(b"/%s %d 0 R" % (resource.encode(), add(stream(b"/Type /XObject /Subtype /Image " + dictionary, data))))
+    resources = add(b"<< /ProcSet [/PDF /Text /ImageB /ImageC] /Font << %s >> /XObject << %s >> >>"
+                    % (b" ".join(font_refs), b" ".join(image_refs)))
+
+    kids = []
+    for page in pages:
+        contents = add(stream(b"/Filter /FlateDecode", zlib.compress(page.content(), 6)))
+        kids.append(add(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] /Resources %d 0 R /Contents %d 0 R >>"
+                        % (page.width, page.height, resources, contents)))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % kid for kid in kids), len(kids))
+
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    return bytes(out)
+
+def docx_to_pdf(docx_bytes, timeout=None):
+    """Render DOCX bytes to PDF bytes, raising ConversionTimeout once timeout seconds have passed"""
+    return _Renderer(docx_bytes, timeout).render()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a DOCX file to PDF without an office suite")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    args = parser.parse_args(argv)
+    with open(args.input, "rb") as f:
+        pdf_bytes = docx_to_pdf(f.read())
+    with open(args.output, "wb") as f:
+        f.write(pdf_bytes)
+    print(f"{args.output}: {len(pdf_bytes):,} bytes", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+OUTPUT_FORMATS = ("pdf", "docx")
+
+# Files generated from the templates (render plans, media-optimized copies) are
+# kept here rather than next to the templates, which may be read-only
+ARTIFACT_DIR = os.environ.get("PROPOSAL_CACHE_DIR") or os.path.join(
+    tempfile.gettempdir(), f"proposal-cache-{os.getuid()}" if hasattr(os, "getuid") else "proposal-cache")
+
+def artifact_dir(kind):
+    """Writable directory for one kind of generated file, or None when nothing can be cached on disk"""
+    path = os.path.join(ARTIFACT_DIR, kind)
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        # Plans are spliced into documents, so never trust a directory someone else planted
+        if hasattr(os, "getuid") and os.stat(path).st_uid != os.getuid():
+            return None
+    except OSError:
+        return None
+    return path if os.access(path, os.W_OK) else None
+
+def cache_key(template_version, proposal_type, replacements, output_format, render_mode=None, converter=None):
+    """Content address for a rendered proposal; replacements must already be normalized to text.
+
+    render_mode and converter name what produced the bytes, so switching the
+    DOCX renderer or PDF backend never serves output of the old one.
+    """
+    payload = json.dumps([template_version, proposal_type, sorted(replacements.items()), output_format,
+                          render_mode, converter], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class OutputCache:
+    """Rendered proposals keyed by content hash, in memory with an optional disk tier.
+
+    Both tiers are LRU and bounded by total size in bytes. Entries are
+    (bytes, output format) where the format is the file extension.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, disk_dir=None, disk_max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._disk_size = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key):
+        """Return (bytes, output format) for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._store(key, entry)
+        return entry
+
+    def put(self, key, data, output_format):
+        entry = (bytes(data), output_format)
+        with self._lock:
+            self._store(key, entry)
+        self._write_disk(key, entry)
+
+    def _store(self, key, entry):
+        if len(entry[0]) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous[0])
+        self._entries[key] = entry
+        self._size += len(entry[0])
+        while self._size > self.max_bytes:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def _disk_files(self):
+        for name in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, name)
+            if os.path.isfile(path) and not name.endswith(".tmp"):
+                yield path
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        for output_format in OUTPUT_FORMATS:
+            path = os.path.join(self.disk_dir, f"{key}.{output_format}")
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path)  # mtime marks recency for eviction
+            except OSError:
+                continue
+            return data, output_format
+        return None
+
+    def _write_disk(self, key, entry):
+        if not self.disk_dir:
+            return
+        data, output_format = entry
+        path = os.path.join(self.disk_dir, f"{key}.{output_format}")
+        temp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        try:
+            # Write then rename so other processes never see a partial file
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            return
+        with self._lock:
+            if self._disk_size is None:
+                self._disk_size = sum(os.path.getsize(p) for p in self._disk_files())
+            else:
+                self._disk_size += len(data)
+            if self._disk_size > self.disk_max_bytes:
+                self._evict_disk()
+
+    def _evict_disk(self):
+        files = sorted(self._disk_files(), key=os.path.getmtime)
+        self._disk_size = sum(os.path.getsize(p) for p in files)
+        for path in files:
+            if self._disk_size <= self.disk_max_bytes:
+                break
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self._disk_size -= size
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_output_cache():
+    """Process-wide output cache, configured from OUTPUT_CACHE_MB, OUTPUT_CACHE_DIR and OUTPUT_CACHE_DISK_MB"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = OutputCache(
+                max_bytes=int(float(os.environ.get("OUTPUT_CACHE_MB", 64)) * 1024 * 1024),
+                disk_dir=os.environ.get("OUTPUT_CACHE_DIR") or None,
+                disk_max_bytes=int(float(os.environ.get("OUTPUT_CACHE_DISK_MB", 512)) * 1024 * 1024))
+        return _cache
@@ -0,0 +1,489 @@
+import os
+import sys
+import time
+import queue
+import signal
+import shutil
+import atexit
+import pathlib
+import platform
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+
+class ConversionError(Exception):
+    """PDF conversion failed"""
+
+class ConversionTimeout(ConversionError):
+    """PDF conversion did not finish in time"""
+
+class _WorkerLost(ConversionError):
+    """The converter process failed to start or died mid-job"""
+
+class ConverterBackend:
+    """A converter kept alive inside one worker process.
+
+    start() runs once when the worker boots and should do the expensive
+    setup (launching Word, LibreOffice, ...); convert() is then called for
+    every job and stop() when the worker is recycled or shut down.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+
+    def start(self):
+        pass
+
+    def convert(self, input_path, output_path):
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+class WordBackend(ConverterBackend):
+    """Microsoft Word over COM (Windows only)"""
+
+    def start(self):
+        import pythoncom
+        import win32com.client
+        pythoncom.CoInitialize()
+        # DispatchEx gives each worker its own Word instance instead of sharing one
+        self.word = win32com.client.DispatchEx("Word.Application")
+        self.word.Visible = False
+        self.word.DisplayAlerts = 0
+
+    def convert(self, input_path, output_path):
+        doc = self.word.Documents.Open(os.path.abspath(input_path), ReadOnly=True)
+        try:
+            doc.SaveAs(os.path.abspath(output_path), FileFormat=17)  # wdFormatPDF = 17
+        finally:
+            doc.Close(False)
+
+    def stop(self):
+        import pythoncom
+        try:
+            self.word.Quit()
+        finally:
+            pythoncom.CoUninitialize()
+
+class LibreOfficeBackend(ConverterBackend):
+    """LibreOffice headless.
+
+    When the UNO bindings are importable a single soffice process is kept
+    running for the lifetime of the worker. Otherwise every job runs
+    ``soffice --convert-to pdf``, reusing the worker's profile directory so
+    only the first job pays for creating it.
+    """
+
+    def start(self):
+        self.binary = shutil.which("soffice") or shutil.which("libreoffice")
+        if not self.binary:
+            raise ConversionError("LibreOffice (soffice) was not found on PATH")
+        self.profile_dir = tempfile.mkdtemp(prefix="proposals-lo-")
+        self.profile_arg = f"-env:UserInstallation={pathlib.Path(self.profile_dir).as_uri()}"
+        self.process = None
+        self.desktop = None
+
+        try:
+            import uno
+        except ImportError:
+            return
+
+        pipe_name = f"proposals_{os.getpid()}"
+        self.process = subprocess.Popen(
+            [self.binary, "--headless", "--invisible", "--nologo", "--norestore",
+             self.profile_arg, f"--accept=pipe,name={pipe_name};urp;"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        local_context = uno.getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_context)
+        deadline = time.monotonic() + self.options.get("startup_timeout", 60)
+        while True:
+            try:
+                context = resolver.resolve(
+                    f"uno:pipe,name={pipe_name};urp;StarOffice.ComponentContext")
+                break
+            except Exception:
+                if time.monotonic() > deadline or self.process.poll() is not None:
+                    self.process.kill()
+                    raise ConversionError("LibreOffice did not start")
+                time.sleep(0.2)
+        self.desktop = context.ServiceManager.createInstanceWithContext(
+            "com.sun.star.frame.Desktop", context)
+
+    @staticmethod
+    def _properties(**values):
+        import uno
+        properties = []
+        for name, value in values.items():
+            prop = uno.createUnoStruct("com.sun.star.beans.PropertyValue")
+            prop.Name, prop.Value = name, value
+            properties.append(prop)
+        return tuple(properties)
+
+    def convert(self, input_path, output_path):
+        if self.desktop is None:
+            out_dir = os.path.dirname(os.path.abspath(output_path))
+            timeout = self.options.get("convert_timeout", 60)
+            try:
+                subprocess.run(
+                    [self.binary, "--headless", "--norestore", self.profile_arg,
+                     "--convert-to", "pdf", "--outdir", out_dir, input_path],
+                    check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=timeout)
+            except subprocess.TimeoutExpired:
+                raise ConversionTimeout(f"LibreOffice did not finish within {timeout:g}s")
+            produced = os.path.join(out_dir, os.path.splitext(os.path.basename(input_path))[0] + ".pdf")
+            if os.path.abspath(produced) != os.path.abspath(output_path):
+                os.replace(produced, output_path)
+            return
+
+        doc = self.desktop.loadComponentFromURL(
+            pathlib.Path(os.path.abspath(input_path)).as_uri(), "_blank", 0,
+            self._properties(Hidden=True))
+        try:
+            doc.storeToURL(pathlib.Path(os.path.abspath(output_path)).as_uri(),
+                           self._properties(FilterName="writer_pdf_Export"))
+        finally:
+            doc.close(True)
+
+    def stop(self):
+        try:
+            if self.desktop is not None:
+                self.desktop.terminate()
+        except Exception:
+            pass
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+class Docx2PdfBackend(ConverterBackend):
+    """docx2pdf, which drives Word on Windows and macOS"""
+
+    def start(self):
+        from docx2pdf import convert
+        self._convert = convert
+
+    def convert(self, input_path, output_path):
+        self._convert(input_path, output_path)
+
+class NativeBackend(ConverterBackend):
+    """native_pdf, a pure-Python renderer that needs no office suite.
+
+    It is cheap enough to run in the calling process, so get_converter_pool()
+    hands out an InProcessConverter instead of starting worker processes.
+    """
+
+    in_process = True
+
+    def start(self):
+        from native_pdf import docx_to_pdf
+        self._convert = docx_to_pdf
+
+    def convert_bytes(self, docx_bytes, timeout=None):
+        return self._convert(docx_bytes, timeout)
+
+    def convert(self, input_path, output_path):
+        with open(input_path, "rb") as f:
+            pdf_bytes = self.convert_bytes(f.read(), self.options.get("convert_timeout"))
+        with open(output_path, "wb") as f:
+            f.write(pdf_bytes)
+
+class StubBackend(ConverterBackend):
+    """Writes a blank one-page PDF; for tests and local development"""
+
+    def convert(self, input_path, output_path):
+        delay = self.options.get("delay", 0)
+        if delay:
+            time.sleep(delay)
+        with open(output_path, "wb") as f:
+            f.write(blank_pdf())
+
+BACKENDS = {
+    "word": WordBackend,
+    "libreoffice": LibreOfficeBackend,
+    "docx2pdf": Docx2PdfBackend,
+    "native": NativeBackend,
+    "stub": StubBackend,
+}
+
+def blank_pdf():
+    """Return a minimal valid single-page PDF"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+               b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] >>"]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    return bytes(out)
+
+def _worker_main(backend_name, options, conn):
+    """Converter worker process: start the backend once, then serve jobs until told to stop"""
+    if hasattr(os, "setpgrp"):
+        # Lead a process group of our own so that killing the group also takes
+        # down soffice and any other child the backend started
+        os.setpgrp()
+    work_dir = tempfile.mkdtemp(prefix="proposals-pdf-")
+    backend = BACKENDS[backend_name](**options)
+    try:
+        backend.start()
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return
+    conn.send(("ready", None))
+
+    input_path = os.path.join(work_dir, "proposal.docx")
+    output_path = os.path.join(work_dir, "proposal.pdf")
+    try:
+        while True:
+            try:
+                docx_bytes = conn.recv()
+            except EOFError:
+                break
+            if docx_bytes is None:
+                break
+            try:
+                with open(input_path, "wb") as f:
+                    f.write(docx_bytes)
+                backend.convert(input_path, output_path)
+                with open(output_path, "rb") as f:
+                    conn.send(("ok", f.read()))
+            except ConversionTimeout as e:
+                # Ask to be replaced: the backend's children may still be busy
+                conn.send(("timeout", str(e)))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+            finally:
+                for path in (input_path, output_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+    finally:
+        try:
+            backend.stop()
+        except Exception:
+            pass
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+class _Worker:
+    """Parent-side handle on one converter process"""
+
+    def __init__(self, context, backend_name, options):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main,
+                                       args=(backend_name, options, child_conn),
+                                       daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        self.jobs = 0
+
+    def _receive(self, timeout):
+        if not self.conn.poll(timeout):
+            raise ConversionTimeout(f"PDF conversion timed out after {timeout:.1f}s")
+        try:
+            return self.conn.recv()
+        except (EOFError, OSError):
+            raise _WorkerLost("PDF converter process exited unexpectedly")
+
+    def convert(self, docx_bytes, timeout, startup_timeout):
+        if not self.ready:
+            status, detail = self._receive(startup_timeout)
+            if status != "ready":
+                raise _WorkerLost(f"PDF converter failed to start: {detail}")
+            self.ready = True
+
+        try:
+            self.conn.send(docx_bytes)
+        except (BrokenPipeError, OSError):
+            raise _WorkerLost("PDF converter process exited unexpectedly")
+        self.jobs += 1
+        status, payload = self._receive(timeout)
+        if status == "timeout":
+            raise ConversionTimeout(payload)
+        if status != "ok":
+            raise ConversionError(payload)
+        return payload
+
+    def stop(self, grace=5):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(grace)
+        self.kill()
+
+    def kill(self):
+        if hasattr(os, "killpg"):
+            # The worker leads its own process group, which outlives it while
+            # any of its children (soffice, ...) is still running
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except OSError:
+                pass  # no such group: the worker never got that far or everything already exited
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+class ConverterPool:
+    """A fixed number of warm converter processes shared by all callers.
+
+    Callers block until a worker is free, so the idle queue doubles as the
+    job queue. A worker is replaced after ``max_jobs`` conversions, when it
+    crashes, and when a job exceeds ``timeout`` seconds.
+    """
+
+    def __init__(self, backend="stub", size=2, max_jobs=50, timeout=60,
+                 startup_timeout=120, backend_options=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown PDF converter backend: {backend!r}")
+        self.backend = backend
+        self.size = size
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        self.backend_options = dict(backend_options or {})
+        # Backends that shell out per job bound each run by the pool's timeout too
+        self.backend_options.setdefault("convert_timeout", timeout)
+        # spawn keeps COM and LibreOffice state out of the (threaded) parent process
+        self._context = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(size):
+            self._idle.put(self._new_worker())
+
+    def _new_worker(self):
+        return _Worker(self._context, self.backend, self.backend_options)
+
+    def convert(self, docx_bytes, timeout=None):
+        """Convert DOCX bytes to PDF bytes on the next free worker.
+
+        timeout bounds the whole call, waiting for a free worker included.
+        """
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise ConversionTimeout("No PDF converter became free in time")
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self._release(worker)
+            raise ConversionTimeout("No PDF converter became free in time")
+
+        try:
+            return worker.convert(docx_bytes, remaining, self.startup_timeout)
+        except (ConversionTimeout, _WorkerLost):
+            # Timed out, crashed or failed to start: never reuse a worker in an unknown state
+            worker.kill()
+            worker = None
+            raise
+        finally:
+            if worker is not None and worker.jobs >= self.max_jobs:
+                worker.stop()
+                worker = None
+            self._release(worker)
+
+    def _release(self, worker):
+        with self._lock:
+            if self._closed:
+                if worker is not None:
+                    worker.stop()
+                return
+            self._idle.put(worker if worker is not None else self._new_worker())
+
+    def close(self):
+        """Stop every worker"""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.stop()
+
+class InProcessConverter:
+    """Runs an in-process backend in the calling thread, in place of a ConverterPool.
+
+    Offers the same convert()/close() interface. There is no worker to kill,
+    so the backend checks ``timeout`` itself as it goes and raises
+    ConversionTimeout. Callers that must not spend the CPU in their own
+    process (render_service) run it on a worker process instead.
+    """
+
+    in_process = True
+
+    def __init__(self, backend="native", timeout=60, backend_options=None):
+        if not getattr(BACKENDS.get(backend), "in_process", False):
+            raise ValueError(f"PDF converter backend {backend!r} cannot run in-process")
+        self.backend = backend
+        self.timeout = timeout
+        self._backend = BACKENDS[backend](**(backend_options or {}))
+        self._backend.start()
+
+    def convert(self, docx_bytes, timeout=None):
+        """Convert DOCX bytes to PDF bytes"""
+        try:
+            return self._backend.convert_bytes(docx_bytes, timeout or self.timeout)
+        except ConversionError:
+            raise
+        except Exception as e:
+            raise ConversionError(f"{type(e).__name__}: {e}") from e
+
+    def close(self):
+        self._backend.stop()
+
+def default_backend():
+    """Pick the best backend for this machine, or None if PDFs cannot be produced
+
+    The native renderer leaves out headers, footers and fields, so it is only
+    used when asked for with PDF_CONVERTER=native.
+    """
+    configured = os.environ.get("PDF_CONVERTER")
+    if configured:
+        return None if configured == "none" else configured
+    if platform.system() == "Windows":
+        return "word"
+    if shutil.which("soffice") or shutil.which("libreoffice"):
+        return "libreoffice"
+    if sys.platform == "darwin":
+        return "docx2pdf"
+    return None
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_converter_pool():
+    """Return the process-wide converter pool, starting it on first use (None if unavailable)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            backend = default_backend()
+            if backend is None:
+                return None
+            timeout = float(os.environ.get("PDF_CONVERTER_TIMEOUT", 60))
+            if getattr(BACKENDS.get(backend), "in_process", False):
+                _pool = InProcessConverter(backend, timeout)
+            else:
+                _pool = ConverterPool(
+                    backend,
+                    size=int(os.environ.get("PDF_CONVERTER_WORKERS", 2)),
+                    max_jobs=int(os.environ.get("PDF_CONVERTER_MAX_JOBS", 50)),
+                    timeout=timeout)
+            atexit.register(_pool.close)
+        return _pool
@@ -1,53 +1,29 @@
+import io
 import os
-import tempfile
+import re
+import json
+import hashlib
+import copy
+import bisect
+import struct
+import zlib
+import time
+import sqlite3
+import zipfile
+import threading
+from collections import OrderedDict
+from xml.sax.saxutils import escape as xml_escape
+from lxml import etree
 from docx import Document
-import streamlit as st
-from docx2pdf import convert
-import platform
-
-# Check if running on Windows or cloud
-IS_WINDOWS = platform.system() == "Windows"
-
-# Import Windows-specific modules only on Windows
-if IS_WINDOWS:
-    import pythoncom
-    import win32com.client
-
-def convert_to_pdf(input_docx, output_pdf):
-    """Convert DOCX to PDF using win32com with explicit COM initialization"""
-    if not IS_WINDOWS:
-        st.warning("PDF conversion is only available in Windows. Downloading DOCX instead.")
-        return False
-
-    try:
-        # Initialize COM for this thread
-        pythoncom.CoInitialize()
-        
-        # Create Word application
-        word = win32com.client.dynamic.Dispatch('Word.Application')
-        word.Visible = False
-
-        try:
-            # Convert paths to absolute
-            input_path = os.path.abspath(input_docx)
-            output_path = os.path.abspath(output_pdf)
-            
-            # Open and convert
-            doc = word.Documents.Open(input_path)
-            doc.SaveAs(output_path, FileFormat=17)  # wdFormatPDF = 17
-            doc.Close()
-            
-            return os.path.exists(output_pdf)
-            
-        finally:
-            word.Quit()
-            
-    except Exception as e:
-        st.error(f"PDF Conversion error: {str(e)}")
-        return False
-        
-    finally:
-        pythoncom.CoUninitialize()
+from docx.oxml import parse_xml
+from docx.opc.oxml import serialize_part_xml
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+from pdf_converters import ConversionError, get_converter_pool
+from output_cache import artifact_dir, cache_key, get_output_cache
+from proposal_archive import get_archive
+from template_media import optimized_template_path
+from metrics import metrics
 
 # Define template paths
 TEMPLATE_DIR = "templates"
@@ -59,142 +35,581 @@ template_paths = {
     "IT Consultation": "Contract Agreement.docx"
 }
 
-def replace_text_preserve_formatting(doc, replacements):
-    """Replace text while preserving formatting and images"""
-    def replace_in_paragraph(paragraph, replacements):
-        paragraph_text = paragraph.text
-        runs = paragraph.runs
-        
-        for key, value in replacements.items():
-            if key in paragraph_text:
-                # Format price values if needed
-                if "price" in key.lower() or "amount" in key.lower() or key == "{Additional}":
-                    if isinstance(value, (int, float)):
-                        value = f"$ {value:,.2f}"
-                
-                # Special handling for Additional Features text box
-                if key == "{Additional}":
-                    for i, run in enumerate(runs):
-                        if "{Additional}" in run.text:
-                            # Preserve any text before the placeholder
-                            prefix = run.text[:run.text.find("{Additional}")]
-                            run.text = prefix + str(value)
-                            # Clear any remaining parts of the placeholder
-                            for j in range(i + 1, len(runs)):
-                                if "{" in runs[j].text or "}" in runs[j].text:
-                                    runs[j].text = ""
-                            return
-                
-                # Normal replacement logic for other fields
-                key_runs = []
-                start_index = -1
-                current_key_part = ""
-                
-                for i, run in enumerate(runs):
-                    if not run.text:
+# Parsed templates shared by every session, keyed by path and file version
+TEMPLATE_CACHE_SIZE = 16
+_template_cache = OrderedDict()
+_template_cache_lock = threading.Lock()
+
+def template_version(template_path):
+    """Cheap version stamp for a template file, changes whenever the file is replaced or edited"""
+    stat = os.stat(template_path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+def _cached_template(kind, template_path, loader):
+    """Return loader(template_path), calling it only once per template version and kind"""
+    template_key = (kind, os.path.abspath(template_path), template_version(template_path))
+
+    with _template_cache_lock:
+        template = _template_cache.get(template_key)
+        if template is not None:
+            _template_cache.move_to_end(template_key)
+    metrics.increment("proposal_template_cache_total", kind=kind, result="miss" if template is None else "hit")
+
+    if template is None:
+        template = loader(template_path)
+        with _template_cache_lock:
+            _template_cache[template_key] = template
+            _template_cache.move_to_end(template_key)
+            while len(_template_cache) > TEMPLATE_CACHE_SIZE:
+                _template_cache.popitem(last=False)
+    return template
+
+def load_template(template_path):
+    """Return a private copy of a parsed template, parsing each template version only once"""
+    # Deep copying the parsed package is much cheaper than unzipping and parsing it again
+    return copy.deepcopy(_cached_template("document", template_path, Document))
+
+def clear_template_cache():
+    """Drop all cached templates"""
+    with _template_cache_lock:
+        _template_cache.clear()
+
+# Render from copies of the templates whose images are downsampled and recompressed
+TEMPLATE_MEDIA_OPTIMIZATION = os.environ.get("TEMPLATE_MEDIA_OPTIMIZATION", "on").lower() not in ("0", "off", "false")
+
+def template_path_for(proposal_type):
+    """The file a proposal type renders from: its template's media-optimized copy, or the template itself"""
+    template_path = os.path.join(TEMPLATE_DIR, template_paths[proposal_type])
+    if not TEMPLATE_MEDIA_OPTIMIZATION:
+        return template_path
+    return _cached_template("optimized", template_path, optimized_template_path)
+
+# Matches any {placeholder}; only keys present in the replacements are substituted
+PLACEHOLDER_PATTERN = re.compile(r"\{[^{}]*\}")
+
+# Characters XML 1.0 does not allow; vertical tabs and form feeds (Word's manual
+# line and page breaks) become line breaks, everything else is dropped
+XML_INVALID_PATTERN = re.compile("[^\t\n\r\x20-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]")
+XML_LINE_BREAKS = str.maketrans({"\x0b": "\n", "\x0c": "\n"})
+
+def format_replacement_value(key, value):
+    """Format numeric price/amount values as currency, everything else as text that is valid in XML"""
+    if "price" in key.lower() or "amount" in key.lower() or key == "{Additional}":
+        if isinstance(value, (int, float)):
+            return f"$ {value:,.2f}"
+    text = str(value)
+    if XML_INVALID_PATTERN.search(text):
+        text = XML_INVALID_PATTERN.sub("", text.translate(XML_LINE_BREAKS))
+    return text
+
+def replace_in_paragraph(paragraph, replacements, unmatched=None):
+    """Replace every placeholder in a paragraph in one pass, returning the number replaced.
+
+    Placeholders with no replacement are appended to unmatched when it is given.
+    """
+    # Most paragraphs hold no placeholder; reject them from the raw XML text
+    # before paying for python-docx's per-run text extraction
+    if "{" not in etree.tostring(paragraph._p, method="text", encoding=str):
+        return 0
+
+    runs = paragraph.runs
+    texts = [run.text for run in runs]
+    paragraph_text = "".join(texts)
+    if "{" not in paragraph_text:
+        return 0
+
+    matches = []
+    for match in PLACEHOLDER_PATTERN.finditer(paragraph_text):
+        if match.group() in replacements:
+            matches.append(match)
+        elif unmatched is not None:
+            unmatched.append(match.group())
+    if not matches:
+        return 0
+
+    # Character offset where each run starts, used to map matches back to runs
+    run_starts = []
+    offset = 0
+    for text in texts:
+        run_starts.append(offset)
+        offset += len(text)
+
+    # Splice from the end so earlier offsets stay valid; placeholders split
+    # across runs keep the first run's formatting and empty the rest
+    new_texts = list(texts)
+    for match in reversed(matches):
+        value = format_replacement_value(match.group(), replacements[match.group()])
+        first = bisect.bisect_right(run_starts, match.start()) - 1
+        last = bisect.bisect_right(run_starts, match.end() - 1) - 1
+        head = match.start() - run_starts[first]
+        tail = match.end() - run_starts[last]
+        if first == last:
+            new_texts[first] = new_texts[first][:head] + value + new_texts[first][tail:]
+        else:
+            new_texts[first] = new_texts[first][:head] + value
+            for i in range(first + 1, last):
+                new_texts[i] = ""
+            new_texts[last] = new_texts[last][tail:]
+
+    for run, old_text, new_text in zip(runs, texts, new_texts):
+        if new_text != old_text:
+            run.text = new_text
+    return len(matches)
+
+# Every w:p in a story, including table cells, nested tables and text boxes
+W_PARAGRAPH = qn("w:p")
+
+def _iter_stories(doc):
+    """Yield (container, root element) for the body and each distinct header/footer"""
+    yield doc._body, doc.element.body
+    seen_parts = set()
+    for section in doc.sections:
+        for story in (section.header, section.first_page_header, section.even_page_header,
+                      section.footer, section.first_page_footer, section.even_page_footer):
+            # Linked headers/footers have no definition of their own; touching
+            # _element on them would add one
+            if story.is_linked_to_previous:
+                continue
+            part = story.part
+            if id(part) in seen_parts:
+                continue
+            seen_parts.add(id(part))
+            yield story, story._element
+
+def iter_paragraphs(doc):
+    """Yield every paragraph in the document exactly once, text boxes and headers/footers included"""
+    seen = set()
+    for container, root in _iter_stories(doc):
+        for element in root.iter(W_PARAGRAPH):
+            if element in seen:
+                continue
+            seen.add(element)
+            yield Paragraph(element, container)
+
+def replace_in_element(root, replacements, unmatched=None):
+    """Replace placeholders in every paragraph under a raw XML element"""
+    replaced = 0
+    for element in root.iter(W_PARAGRAPH):
+        replaced += replace_in_paragraph(Paragraph(element, None), replacements, unmatched)
+    return replaced
+
+def replace_text_preserve_formatting(doc, replacements, unmatched=None):
+    """Replace text while preserving formatting and images, returning the number replaced"""
+    replaced = 0
+    for paragraph in iter_paragraphs(doc):
+        replaced += replace_in_paragraph(paragraph, replacements, unmatched)
+    return replaced
+
+def render_document(proposal_type, replacements):
+    """Load the proposal's template and fill in the replacements"""
+    template_path = template_path_for(proposal_type)
+    with metrics.stage("load", proposal_type=proposal_type):
+        doc = load_template(template_path)
+
+    unmatched = []
+    with metrics.stage("replace", proposal_type=proposal_type):
+        replaced = replace_text_preserve_formatting(doc, replacements, unmatched)
+    _count_placeholders(proposal_type, replaced, unmatched)
+    return doc
+
+def _count_placeholders(proposal_type, replaced, unmatched):
+    # Unmatched placeholders left in the output usually mean a template and its form drifted apart
+    metrics.increment("proposal_placeholders_found_total", replaced + len(unmatched), proposal_type=proposal_type)
+    metrics.increment("proposal_placeholders_replaced_total", replaced, proposal_type=proposal_type)
+    if unmatched:
+        metrics.increment("proposal_placeholders_unmatched_total", len(unmatched), proposal_type=proposal_type)
+
+def save_docx_bytes(doc):
+    """Serialize a document to DOCX bytes without touching the filesystem"""
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    # getvalue() hands over BytesIO's internal buffer rather than copying it
+    return buffer.getvalue()
+
+# Parts that can hold placeholders; everything else in the package is copied verbatim
+STORY_PART_PATTERN = re.compile(r"^word/(document|header\d*|footer\d*)\.xml$")
+ZIP_DATA_DESCRIPTOR_FLAG = 0x08
+
+class PassthroughTemplate:
+    """A template's ZIP entries, split into raw compressed bytes and parsed story parts"""
+
+    def __init__(self, template_path):
+        with open(template_path, "rb") as f:
+            self.data = f.read()
+        view = memoryview(self.data)
+        self.entries = []
+        with zipfile.ZipFile(io.BytesIO(self.data)) as archive:
+            for info in archive.infolist():
+                if STORY_PART_PATTERN.match(info.filename):
+                    xml = archive.read(info)
+                    if PLACEHOLDER_PATTERN.search(xml.decode("utf-8")):
+                        self.entries.append((info, parse_xml(xml)))
                         continue
-                    
-                    current_key_part += run.text
-                    if key in current_key_part:
-                        for j in range(start_index if start_index >= 0 else i, i + 1):
-                            key_runs.append(runs[j])
-                        start_index = -1
-                        current_key_part = ""
-                    elif any(part in current_key_part for part in ["{", key[1:len(key)-1]]):
-                        if start_index < 0:
-                            start_index = i
-                    else:
-                        start_index = -1
-                        current_key_part = ""
-                
-                if key_runs:
-                    key_runs[0].text = str(value)
-                    for run in key_runs[1:]:
-                        run.text = ""
-
-    # Process text boxes first (they have priority)
-    for shape in doc.inline_shapes:
-        try:
-            if shape._inline.graphic.graphicData.pic is not None:
-                for element in shape._inline.graphic.graphicData.pic.xpath('.//w:txbxContent//w:p'):
-                    try:
-                        p = doc.paragraphs[0].__class__(element, doc.paragraphs[0]._parent)
-                        if p.text.strip():
-                            replace_in_paragraph(p, replacements)
-                    except:
-                        pass
-        except:
-            pass
-
-    # Process all paragraphs including those in text boxes
-    for element in doc._element.xpath('//w:txbxContent//w:p'):
-        try:
-            p = doc.paragraphs[0].__class__(element, doc.paragraphs[0]._parent)
-            if p.text.strip():
-                replace_in_paragraph(p, replacements)
-        except:
-            pass
-
-    # Process regular paragraphs
-    for paragraph in doc.paragraphs:
-        if paragraph.text.strip():
-            replace_in_paragraph(paragraph, replacements)
-
-    # Process tables
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for paragraph in cell.paragraphs:
-                    if paragraph.text.strip():
-                        replace_in_paragraph(paragraph, replacements)
-
-    # Final pass for any remaining text boxes
-    for element in doc._element.xpath('.//w:drawing//wp:anchor//w:txbxContent//w:p'):
-        try:
-            p = doc.paragraphs[0].__class__(element, doc.paragraphs[0]._parent)
-            if p.text.strip():
-                replace_in_paragraph(p, replacements)
-        except:
-            continue
-
-def generate_proposal(proposal_type, client_name, replacements):
-    """Generate proposal document with given replacements"""
+                self.entries.append((info, self._raw_bytes(view, info)))
+
+    @staticmethod
+    def _raw_bytes(view, info):
+        """Compressed bytes of an entry, sliced straight out of the archive"""
+        offset = info.header_offset
+        name_length, extra_length = struct.unpack("<HH", view[offset + 26:offset + 30])
+        start = offset + 30 + name_length + extra_length
+        return view[start:start + info.compress_size]
+
+# ZipFile internals the raw copy relies on; checked before every raw write so a
+# Python upgrade that renames them degrades to recompressing, not to corrupt output
+RAW_WRITE_ATTRIBUTES = ("fp", "filelist", "NameToInfo", "start_dir", "_didModify")
+
+def _write_raw_entry(archive, info, raw):
+    """Append an already-compressed entry to an open ZipFile without recompressing it"""
+    if not all(hasattr(archive, name) for name in RAW_WRITE_ATTRIBUTES) or not hasattr(info, "FileHeader"):
+        _write_inflated_entry(archive, info, raw)
+        return
+    entry = copy.copy(info)
+    # CRC and sizes are known, so they go in the local header instead of a data descriptor
+    entry.flag_bits &= ~ZIP_DATA_DESCRIPTOR_FLAG
+    entry.header_offset = archive.fp.tell()
+    archive.fp.write(entry.FileHeader())
+    archive.fp.write(raw)
+    archive.filelist.append(entry)
+    archive.NameToInfo[entry.filename] = entry
+    archive.start_dir = archive.fp.tell()
+    archive._didModify = True
+
+def _write_inflated_entry(archive, info, raw):
+    """Fallback for _write_raw_entry through the public API: decompress and write the entry again"""
+    if info.compress_type == zipfile.ZIP_DEFLATED:
+        data = zlib.decompress(raw, -zlib.MAX_WBITS)
+    elif info.compress_type == zipfile.ZIP_STORED:
+        data = bytes(raw)
+    else:
+        raise zipfile.BadZipFile(f"Unsupported compression method {info.compress_type} for {info.filename}")
+    entry = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+    entry.compress_type = info.compress_type
+    entry.external_attr = info.external_attr
+    archive.writestr(entry, data)
+
+def render_docx_passthrough(template_path, replacements, unmatched=None):
+    """Render DOCX bytes by rewriting only the story parts that hold placeholders.
+
+    Images, styles, fonts and every other entry are copied as raw compressed
+    bytes, so nothing is inflated or deflated except the rewritten XML.
+    Returns (docx bytes, number of placeholders replaced).
+    """
+    template = _cached_template("passthrough", template_path, PassthroughTemplate)
+    buffer = io.BytesIO()
+    replaced = 0
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for info, content in template.entries:
+            if isinstance(content, memoryview):
+                _write_raw_entry(archive, info, content)
+                continue
+            root = copy.deepcopy(content)
+            replaced += replace_in_element(root, replacements, unmatched)
+            entry = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+            entry.compress_type = zipfile.ZIP_DEFLATED
+            entry.external_attr = info.external_attr
+            archive.writestr(entry, serialize_part_xml(root))
+    return buffer.getvalue(), replaced
+
+# Compiled render plans: every placeholder ("slot") of a story part is normalized
+# into a single run, and the serialized XML is split into literal segments around
+# the slots, so rendering is string splicing with no tree walk or search
+PLAN_FORMAT_VERSION = 1
+SLOT_MARKER_PATTERN = re.compile("\ue000(\\d+)\ue001")
+W_TEXT = qn("w:t")
+XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+
+def plan_path_for(template_path):
+    """Where the compiled plan of a template is persisted, or None when plans cannot be written"""
+    directory = artifact_dir("plans")
+    if directory is None:
+        return None
+    stem = os.path.splitext(os.path.basename(template_path))[0]
+    # Templates of the same name in different directories get their own plans
+    location = hashlib.sha256(os.path.abspath(template_path).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(directory, f"{stem}.{location}.plan.json")
+
+def compile_template_plan(template_path, data=None):
+    """Compile a template into a render plan (a JSON-serializable dict)"""
+    if data is None:
+        with open(template_path, "rb") as f:
+            data = f.read()
+    slots = []
+    parts = {}
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        for info in archive.infolist():
+            if not STORY_PART_PATTERN.match(info.filename):
+                continue
+            root = parse_xml(archive.read(info))
+            locations = []
+            for element in root.iter(W_PARAGRAPH):
+                paragraph = Paragraph(element, None)
+                keys = PLACEHOLDER_PATTERN.findall("".join(run.text for run in paragraph.runs))
+                if not keys:
+                    continue
+                markers = {}
+                for key in keys:
+                    if key not in slots:
+                        slots.append(key)
+                    markers[key] = f"\ue000{slots.index(key)}\ue001"
+                # Splicing a marker in for each placeholder also merges placeholders
+                # that Word split across runs into the first run
+                replace_in_paragraph(paragraph, markers)
+                for text in element.iter(W_TEXT):
+                    if text.text and "\ue000" in text.text:
+                        # Values may start or end with spaces
+                        text.set(XML_SPACE, "preserve")
+                        for marker in SLOT_MARKER_PATTERN.finditer(text.text):
+                            locations.append({"slot": slots[int(marker.group(1))],
+                                              "path": root.getroottree().getpath(text)})
+            if not locations:
+                continue
+
+            pieces = SLOT_MARKER_PATTERN.split(serialize_part_xml(root).decode("utf-8"))
+            segments, slot_indices = pieces[0::2], [int(i) for i in pieces[1::2]]
+            offset = len(segments[0])
+            for location, segment in zip(locations, segments[1:]):
+                location["offset"] = offset
+                offset += len(segment)
+            parts[info.filename] = {"segments": segments, "slots": slot_indices, "locations": locations}
+
+    return {
+        "version": PLAN_FORMAT_VERSION,
+        "template": os.path.basename(template_path),
+        "template_sha256": hashlib.sha256(data).hexdigest(),
+        "slots": slots,
+        "parts": parts,
+    }
+
+def load_render_plan(template_path, data=None, persist=True):
+    """Return the template's plan, recompiling (and re-persisting) it when its content hash is stale"""
+    if data is None:
+        with open(template_path, "rb") as f:
+            data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    plan_path = plan_path_for(template_path)
     try:
-        template_path = os.path.join(TEMPLATE_DIR, template_paths[proposal_type])
-        doc = Document(template_path)
-        replace_text_preserve_formatting(doc, replacements)
-        
-        temp_dir = tempfile.mkdtemp()
-        output_docx = os.path.join(temp_dir, f"{proposal_type}_{client_name}.docx")
-        output_pdf = os.path.join(temp_dir, f"{proposal_type}_{client_name}.pdf")
-        
-        # Save DOCX
-        doc.save(output_docx)
-        
-        # Try PDF conversion
+        with open(plan_path, encoding="utf-8") as f:
+            plan = json.load(f)
+        if plan.get("version") == PLAN_FORMAT_VERSION and plan.get("template_sha256") == digest:
+            return plan
+    except (TypeError, OSError, ValueError):
+        pass
+
+    plan = compile_template_plan(template_path, data)
+    if persist and plan_path is not None:
+        temp_path = f"{plan_path}.{os.getpid()}-{threading.get_ident()}.tmp"
         try:
-            convert(output_docx, output_pdf)
-            with open(output_pdf, "rb") as pdf_file:
-                pdf_bytes = pdf_file.read()
-                st.success("PDF generated successfully!")
-                return (pdf_bytes, 
-                       f"{proposal_type}_{client_name}.pdf",
-                       "application/pdf")
-        except Exception as pdf_error:
-            st.warning("PDF conversion failed, providing DOCX instead")
-            with open(output_docx, "rb") as docx_file:
-                docx_bytes = docx_file.read()
-                return (docx_bytes,
-                       f"{proposal_type}_{client_name}.docx",
-                       "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
-            
-    except Exception as e:
-        st.error(f"Error generating proposal: {str(e)}")
+            # Write then rename so concurrent workers never read a partial plan
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(plan, f, ensure_ascii=False)
+            os.replace(temp_path, plan_path)
+        except OSError:
+            pass  # without a writable cache directory the plan just stays in memory
+    return plan
+
+class CompiledTemplate:
+    """A template's raw ZIP entries plus the render plan of its story parts"""
+
+    def __init__(self, template_path):
+        with open(template_path, "rb") as f:
+            self.data = f.read()
+        self.plan = load_render_plan(template_path, self.data)
+        view = memoryview(self.data)
+        self.entries = []
+        with zipfile.ZipFile(io.BytesIO(self.data)) as archive:
+            for info in archive.infolist():
+                part = self.plan["parts"].get(info.filename)
+                self.entries.append((info, part if part is not None
+                                     else PassthroughTemplate._raw_bytes(view, info)))
+
+def _slot_xml(key, replacements):
+    """XML for one slot inside a w:t element, matching python-docx's handling of tabs and newlines"""
+    if key not in replacements:
+        return xml_escape(key)
+    text = xml_escape(format_replacement_value(key, replacements[key]))
+    if "\t" in text or "\n" in text or "\r" in text:
+        text = (text.replace("\r", "\n")
+                    .replace("\t", '</w:t><w:tab/><w:t xml:space="preserve">')
+                    .replace("\n", '</w:t><w:br/><w:t xml:space="preserve">'))
+    return text
+
+def render_docx_compiled(template_path, replacements, unmatched=None):
+    """Render DOCX bytes by splicing values into the template's compiled plan.
+
+    Returns (docx bytes, number of placeholders replaced).
+    """
+    template = _cached_template("compiled", template_path, CompiledTemplate)
+    slots = template.plan["slots"]
+    values = [_slot_xml(key, replacements) for key in slots]
+    buffer = io.BytesIO()
+    replaced = 0
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for info, content in template.entries:
+            if isinstance(content, memoryview):
+                _write_raw_entry(archive, info, content)
+                continue
+            segments = content["segments"]
+            pieces = [segments[0]]
+            for index, segment in zip(content["slots"], segments[1:]):
+                pieces.append(values[index])
+                pieces.append(segment)
+                if slots[index] in replacements:
+                    replaced += 1
+                elif unmatched is not None:
+                    unmatched.append(slots[index])
+            entry = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+            entry.compress_type = zipfile.ZIP_DEFLATED
+            entry.external_attr = info.external_attr
+            archive.writestr(entry, "".join(pieces).encode("utf-8"))
+    return buffer.getvalue(), replaced
+
+# "compiled" splices values into a cached render plan, "passthrough" rewrites the
+# story parts' XML trees, "python-docx" re-saves the whole package
+DOCX_RENDER_MODE = os.environ.get("DOCX_RENDER_MODE", "compiled")
+RENDERERS = {
+    "compiled": render_docx_compiled,
+    "passthrough": render_docx_passthrough,
+}
+
+def render_docx_bytes(proposal_type, replacements):
+    """Fill the proposal's template and return DOCX bytes using DOCX_RENDER_MODE"""
+    renderer = RENDERERS.get(DOCX_RENDER_MODE)
+    if renderer is None:
+        doc = render_document(proposal_type, replacements)
+        with metrics.stage("save", proposal_type=proposal_type):
+            return save_docx_bytes(doc)
+
+    template_path = template_path_for(proposal_type)
+    unmatched = []
+    with metrics.stage("render", proposal_type=proposal_type):
+        docx_bytes, replaced = renderer(template_path, replacements, unmatched)
+    _count_placeholders(proposal_type, replaced, unmatched)
+    return docx_bytes
+
+def docx_bytes_to_pdf(docx_bytes, errors=None, timeout=None):
+    """Convert DOCX bytes to PDF bytes, or return None if conversion is unavailable or fails.
+
+    When errors is a list, the reason for a failed conversion is appended to it.
+    timeout overrides the converter pool's own limit for this conversion.
+    """
+    pool = get_converter_pool()
+    if pool is None:
+        return None
+    try:
+        return pool.convert(docx_bytes, timeout)
+    except ConversionError as e:
+        metrics.increment("proposal_converter_errors_total", backend=pool.backend, error=type(e).__name__)
+        if errors is not None:
+            errors.append(str(e) or type(e).__name__)
         return None
-    finally:
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+def normalize_replacements(replacements):
+    """Replacement values exactly as they will appear in the document"""
+    return {key: format_replacement_value(key, value) for key, value in replacements.items()}
+
+class ProposalResult:
+    """A rendered proposal: the file plus how it was produced"""
+
+    def __init__(self, data, file_name, mime_type, output_format, timings, warnings, cached=False):
+        self.data = data
+        self.file_name = file_name
+        self.mime_type = mime_type
+        self.output_format = output_format
+        # Stage name -> seconds
+        self.timings = timings
+        self.warnings = warnings
+        self.cached = cached
+        # Id in the proposal archive, when archiving is enabled
+        self.archive_id = None
+
+    @property
+    def is_pdf(self):
+        return self.output_format == "pdf"
+
+def _result(proposal_type, client_name, data, output_format, timings, warnings, cached=False):
+    mime_type = "application/pdf" if output_format == "pdf" else DOCX_MIME
+    return ProposalResult(data, f"{proposal_type}_{client_name}.{output_format}", mime_type,
+                          output_format, timings, warnings, cached)
+
+def render_proposal(proposal_type, client_name, replacements, output_format=None, render_docx=render_docx_bytes,
+                    convert=docx_bytes_to_pdf):
+    """Render a proposal and return a ProposalResult; never touches the UI.
+
+    output_format defaults to PDF whenever a converter is available, and
+    falls back to DOCX (with a warning) when conversion fails. render_docx
+    lets callers run the DOCX step elsewhere, e.g. in a worker process, and
+    convert the PDF step, e.g. under a deadline; it takes the same arguments
+    as docx_bytes_to_pdf.
+    When PROPOSAL_ARCHIVE is set the result is also archived with its inputs.
+    Safe to call concurrently from threads and processes: the only shared
+    state is the locked template, plan and output caches and the archive.
+    """
+    if proposal_type not in template_paths:
+        raise ValueError(f"Unknown proposal type: {proposal_type!r}")
+    template_path = template_path_for(proposal_type)
+    version = template_version(template_path)
+    normalized = normalize_replacements(replacements)
+    result = _render_proposal(proposal_type, client_name, replacements, output_format, render_docx, convert,
+                              template_path, version, normalized)
+
+    archive = get_archive()
+    if archive is not None:
         try:
-            if os.path.exists(temp_dir):
-                import shutil
-                shutil.rmtree(temp_dir)
-        except:
-            pass
\ No newline at end of file
+            with metrics.stage("archive", result.timings, proposal_type=proposal_type):
+                result.archive_id = archive.put(result.data, proposal_type, client_name, result.output_format,
+                                                normalized, result.file_name, version)
+        except (sqlite3.Error, OSError) as e:
+            result.warnings.append(f"The proposal could not be archived: {e}")
+    return result
+
+def _render_proposal(proposal_type, client_name, replacements, output_format, render_docx, convert,
+                     template_path, version, normalized):
+    timings = {}
+    warnings = []
+    with metrics.stage("total", timings, proposal_type=proposal_type):
+        pool = get_converter_pool()
+        unavailable = output_format is None and pool is None
+        if output_format is None:
+            output_format = "docx" if unavailable else "pdf"
+        if unavailable:
+            warnings.append("PDF conversion is not available on this server, providing DOCX instead")
+        cache = get_output_cache()
+        converter = pool.backend if pool is not None and output_format == "pdf" else None
+        key = cache_key(version, proposal_type, normalized, output_format, DOCX_RENDER_MODE, converter)
+
+        cached = cache.get(key)
+        metrics.increment("proposal_output_cache_total", result="miss" if cached is None else "hit")
+        if cached is not None:
+            data, cached_format = cached
+            return _result(proposal_type, client_name, data, cached_format, timings, warnings, cached=True)
+
+        start = time.perf_counter()
+        docx_bytes = render_docx(proposal_type, replacements)
+        timings["render"] = time.perf_counter() - start
+
+        if output_format == "pdf":
+            errors = []
+            with metrics.stage("convert", timings, proposal_type=proposal_type):
+                pdf_bytes = convert(docx_bytes, errors)
+            if pdf_bytes is not None:
+                cache.put(key, pdf_bytes, "pdf")
+                return _result(proposal_type, client_name, pdf_bytes, "pdf", timings, warnings)
+            metrics.increment("proposal_pdf_fallback_total", proposal_type=proposal_type, reason="failed")
+            if errors:
+                warnings.append(f"PDF conversion failed ({errors[0]}), providing DOCX instead")
+            else:
+                warnings.append("PDF conversion is not available on this server, providing DOCX instead")
+        else:
+            if unavailable:
+                metrics.increment("proposal_pdf_fallback_total", proposal_type=proposal_type, reason="unavailable")
+            # A failed conversion may be transient, so only cache DOCX when DOCX was the target
+            cache.put(key, docx_bytes, "docx")
+        return _result(proposal_type, client_name, docx_bytes, "docx", timings, warnings)
+
+if __name__ == "__main__":
+    import sys
+    from template_compiler import main
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,106 @@
+"""Live proposal previews that never build a DOCX.
+
+A template is flattened once per version into its paragraphs' text, with
+every placeholder ("slot") indexed by key. A Preview keeps one rendering
+of that and, on each update, re-renders only the slots whose values
+differ from the last update:
+
+    preview = Preview(get_preview_template("Digital Marketing"))
+    preview.update(replacements)   # -> keys that changed
+    preview.output                 # HTML (or plain text)
+"""
+import os
+from html import escape as html_escape
+from docx import Document
+
+from pdf_generator import (PLACEHOLDER_PATTERN, TEMPLATE_DIR, _cached_template, format_replacement_value,
+                           iter_paragraphs, template_paths)
+
+PREVIEW_STYLE = (
+    "<style>"
+    ".proposal-preview{font-family:serif;line-height:1.4;max-height:32rem;overflow-y:auto;"
+    "padding:1rem;border:1px solid #ddd;border-radius:.25rem}"
+    ".proposal-preview p{margin:0 0 .5rem;white-space:pre-wrap}"
+    ".proposal-preview .slot{background:#fff3bf}"
+    ".proposal-preview .slot.empty{color:#868e96}"
+    "</style>"
+)
+
+class PreviewTemplate:
+    """A template's paragraphs as literal pieces with the positions of each slot"""
+
+    def __init__(self, template_path, output_format="html"):
+        self.output_format = output_format
+        self.pieces = []
+        # Slot key -> indices into pieces where its value goes
+        self.slots = {}
+
+        document = _cached_template("document", template_path, Document)
+        if output_format == "html":
+            self.pieces.append(PREVIEW_STYLE + '<div class="proposal-preview">')
+        for paragraph in iter_paragraphs(document):
+            text = paragraph.text
+            if not text.strip():
+                continue
+            self.pieces.append("<p>" if output_format == "html" else "")
+            position = 0
+            for match in PLACEHOLDER_PATTERN.finditer(text):
+                self.pieces.append(self._escape(text[position:match.start()]))
+                self.slots.setdefault(match.group(0), []).append(len(self.pieces))
+                self.pieces.append(self.slot_text(match.group(0), None))
+                position = match.end()
+            self.pieces.append(self._escape(text[position:]))
+            self.pieces.append("</p>" if output_format == "html" else "\n")
+        if output_format == "html":
+            self.pieces.append("</div>")
+
+    def _escape(self, text):
+        return html_escape(text, quote=False) if self.output_format == "html" else text
+
+    def slot_text(self, key, value):
+        """Rendered text of one slot; unfilled slots show their placeholder"""
+        text = format_replacement_value(key, value) if value not in (None, "") else ""
+        if self.output_format != "html":
+            return text or key
+        if not text:
+            return f'<span class="slot empty">{html_escape(key, quote=False)}</span>'
+        return f'<span class="slot">{html_escape(text, quote=False)}</span>'
+
+def get_preview_template(proposal_type, output_format="html"):
+    """Flattened template for a proposal type, built once per template version"""
+    template_path = os.path.join(TEMPLATE_DIR, template_paths[proposal_type])
+    return _cached_template(f"preview-{output_format}", template_path,
+                            lambda path: PreviewTemplate(path, output_format))
+
+_UNSET = object()
+
+class Preview:
+    """One rep's rendering of a template, patched slot by slot as values change"""
+
+    def __init__(self, template):
+        self.template = template
+        self.pieces = list(template.pieces)
+        self.values = {}
+        self._output = "".join(self.pieces)
+
+    def update(self, replacements):
+        """Re-render the slots whose values differ from the last update; return their keys"""
+        changed = []
+        for key, positions in self.template.slots.items():
+            value = replacements.get(key)
+            if self.values.get(key, _UNSET) == value:
+                continue
+            self.values[key] = value
+            text = self.template.slot_text(key, value)
+            for position in positions:
+                self.pieces[position] = text
+            changed.append(key)
+        if changed:
+            self._output = None
+        return changed
+
+    @property
+    def output(self):
+        if self._output is None:
+            self._output = "".join(self.pieces)
+        return self._output
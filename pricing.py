@@ -0,0 +1,172 @@
+"""Quote pricing for every proposal type.
+
+Each proposal type is described by a PricingModel: the priced items a form
+collects, the adjustable parameters (tax rate, discount, maintenance
+percentage, ...) and the derived lines computed from them. Lines are plain
+arithmetic, so the same definition prices a single form with floats (without
+importing NumPy) or a whole pipeline of quotes at once as NumPy arrays,
+optionally under several what-if scenarios:
+
+    python -m pricing pipeline.csv --sweep tax_rate=0.18,0.12,0
+"""
+import sys
+import csv
+import argparse
+import itertools
+
+class PricingModel:
+    """Declarative pricing for one proposal type"""
+
+    def __init__(self, items, parameters, lines):
+        self.items = list(items)
+        self.parameters = dict(parameters)
+        # (name, function of the namespace built so far), evaluated in order
+        self.lines = list(lines)
+
+    def _check(self, parameters):
+        unknown = set(parameters) - set(self.parameters)
+        if unknown:
+            raise ValueError(f"Unknown pricing parameters: {', '.join(sorted(unknown))}")
+
+    def quote(self, items, **parameters):
+        """Price a single quote with plain floats, returning the same keys as evaluate()"""
+        self._check(parameters)
+        values = {item: float(items.get(item, 0.0)) for item in self.items}
+        values["subtotal"] = float(sum(values[item] for item in self.items))
+        for name, default in self.parameters.items():
+            values[name] = float(parameters.get(name, default))
+        for name, line in self.lines:
+            values[name] = float(line(values))
+        return values
+
+    def evaluate(self, quotes, **parameters):
+        """Price a batch of quotes.
+
+        quotes maps each item to a number or array of shape (N,); parameters
+        may be scalars or arrays that broadcast against them. Returns a dict
+        of arrays holding the items, parameters and every derived line.
+        """
+        import numpy as np
+        self._check(parameters)
+
+        values = {item: np.asarray(quotes.get(item, 0.0), dtype=float) for item in self.items}
+        values["subtotal"] = sum(values[item] for item in self.items) if self.items else np.zeros(1)
+        for name, default in self.parameters.items():
+            values[name] = np.asarray(parameters.get(name, default), dtype=float)
+        for name, line in self.lines:
+            values[name] = line(values)
+        return values
+
+def _discounted(v):
+    return v["subtotal"] * (1.0 - v["discount"])
+
+MAINTAINED_SERVICE_LINES = [
+    ("total", _discounted),
+    ("tax", lambda v: v["total"] * v["tax_rate"]),
+    ("total_with_tax", lambda v: v["total"] + v["tax"]),
+    ("annual_maintenance", lambda v: v["total"] * v["maintenance_rate"]),
+]
+
+PRICING_MODELS = {
+    "AI Automation": PricingModel(
+        items=["landing_page_price", "admin_panel_price", "crm_price",
+               "manychat_price", "social_media_price", "ai_calling_price"],
+        parameters={"discount": 0.0, "tax_rate": 0.0, "maintenance_rate": 0.20},
+        lines=MAINTAINED_SERVICE_LINES),
+    "AI Automation without LPW": PricingModel(
+        items=["ai_calling_price", "crm_price", "manychat_price"],
+        parameters={"discount": 0.0, "tax_rate": 0.0, "maintenance_rate": 0.20},
+        lines=MAINTAINED_SERVICE_LINES),
+    "Digital Marketing": PricingModel(
+        items=["social_media_posts", "research_and_dev", "monthly_cost"],
+        parameters={"discount": 0.0, "tax_rate": 0.18, "advance_rate": 0.5},
+        lines=[
+            ("net", _discounted),
+            ("gst", lambda v: v["net"] * v["tax_rate"]),
+            ("total_amount", lambda v: v["net"] + v["gst"]),
+            ("advance", lambda v: v["total_amount"] * v["advance_rate"]),
+            ("balance", lambda v: v["total_amount"] - v["advance"]),
+        ]),
+    "Business Automations": PricingModel(
+        items=["week1_price", "ai_auto_price", "whts_price", "crm_price", "email_price",
+               "make_price", "firefly_price", "chatbot_price", "pdf_gen_pr",
+               "ai_mdl_price", "cstm_ai_price"],
+        parameters={"discount": 0.0, "tax_rate": 0.0},
+        lines=[
+            ("total", _discounted),
+            ("tax", lambda v: v["total"] * v["tax_rate"]),
+            ("total_with_tax", lambda v: v["total"] + v["tax"]),
+        ]),
+}
+
+def quote(proposal_type, items, **parameters):
+    """Price a single quote, returning plain floats"""
+    return PRICING_MODELS[proposal_type].quote(items, **parameters)
+
+def sweep(proposal_type, quotes, **grids):
+    """Price a batch of quotes under every combination of the given parameter values.
+
+    Returns (scenarios, values) where scenarios is a list of parameter dicts
+    and every array in values has shape (len(scenarios), N).
+    """
+    import numpy as np
+    names = list(grids)
+    scenarios = [dict(zip(names, combo)) for combo in itertools.product(*grids.values())]
+    # Scenario parameters become (S, 1) columns that broadcast against (N,) quotes
+    parameters = {name: np.array([s[name] for s in scenarios], dtype=float)[:, None] for name in names}
+    model = PRICING_MODELS[proposal_type]
+    values = model.evaluate(quotes, **parameters)
+    shape = (len(scenarios), _batch_size(quotes, model))
+    return scenarios, {name: np.broadcast_to(value, shape) for name, value in values.items()}
+
+def _batch_size(quotes, model):
+    import numpy as np
+    sizes = [np.size(quotes[item]) for item in model.items if item in quotes]
+    return max(sizes) if sizes else 1
+
+def _parse_sweep(specs):
+    grids = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        grids[name] = [float(v) for v in values.split(",") if v]
+    return grids
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Price a pipeline of quotes from CSV")
+    parser.add_argument("input", help="CSV with a proposal_type column and one column per priced item")
+    parser.add_argument("--sweep", action="append", default=[], metavar="PARAM=V1,V2,...",
+                        help="Evaluate every combination of these parameter values")
+    parser.add_argument("--output", "-o", help="Output CSV (default: stdout)")
+    args = parser.parse_args(argv)
+    import numpy as np
+
+    with open(args.input, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    grids = _parse_sweep(args.sweep)
+
+    out = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+    try:
+        writer = None
+        for proposal_type, model in PRICING_MODELS.items():
+            indices = [i for i, row in enumerate(rows) if row.get("proposal_type") == proposal_type]
+            if not indices:
+                continue
+            quotes = {item: np.array([float(rows[i].get(item) or 0) for i in indices])
+                      for item in model.items}
+            model_grids = {name: values for name, values in grids.items() if name in model.parameters}
+            scenarios, values = sweep(proposal_type, quotes, **model_grids)
+            lines = [name for name, _ in model.lines]
+            if writer is None:
+                writer = csv.writer(out)
+                writer.writerow(["row", "proposal_type", "scenario", "line", "value"])
+            for s, scenario in enumerate(scenarios):
+                label = ";".join(f"{k}={v:g}" for k, v in scenario.items()) or "default"
+                for n, i in enumerate(indices):
+                    for line in lines:
+                        writer.writerow([i + 1, proposal_type, label, line, f"{values[line][s, n]:.2f}"])
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == "__main__":
+    main()
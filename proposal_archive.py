@@ -0,0 +1,359 @@
+"""Archive of generated proposals and the inputs they were rendered from.
+
+Everything lives in one SQLite file. Documents are keyed by the SHA-256 of
+their bytes and indexed by client name, proposal type and creation time.
+Their bytes are split into chunks that are stored once, compressed and
+shared between documents. For DOCX files each large ZIP entry (template
+images and other media) is its own chunk; for PDFs each large stream is.
+Archiving a thousand proposals from one template therefore stores its
+images once.
+
+    python -m proposal_archive find --client acme
+    python -m proposal_archive get <id> -o proposal.pdf
+    python -m proposal_archive rerender <id> -o proposal.pdf
+    python -m proposal_archive delete <id>
+    python -m proposal_archive stats
+"""
+import io
+import os
+import re
+import sys
+import json
+import zlib
+import sqlite3
+import hashlib
+import zipfile
+import argparse
+import threading
+from contextlib import closing, contextmanager
+from datetime import datetime, timezone
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Blocks smaller than this are merged with their neighbours rather than stored on their own
+MIN_CHUNK = 4096
+PDF_STREAM_PATTERN = re.compile(rb"(?<!end)stream\r?\n")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    hash TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    proposal_type TEXT NOT NULL,
+    client_name TEXT NOT NULL COLLATE NOCASE,
+    created_at TEXT NOT NULL,
+    output_format TEXT NOT NULL,
+    file_name TEXT,
+    size INTEGER NOT NULL,
+    template_version TEXT,
+    replacements TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS document_chunks (
+    document TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    chunk TEXT NOT NULL,
+    PRIMARY KEY (document, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS documents_by_client ON documents(client_name, created_at);
+CREATE INDEX IF NOT EXISTS documents_by_type ON documents(proposal_type, created_at);
+CREATE INDEX IF NOT EXISTS documents_by_date ON documents(created_at);
+CREATE INDEX IF NOT EXISTS document_chunks_by_chunk ON document_chunks(chunk);
+"""
+
+RECORD_COLUMNS = ("id", "proposal_type", "client_name", "created_at", "output_format",
+                  "file_name", "size", "template_version")
+
+class ArchiveError(Exception):
+    pass
+
+def _large_blocks(data):
+    """(start, end) spans of data that deserve a chunk of their own, in order"""
+    if data[:4] == b"PK\x03\x04":
+        try:
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                offsets = sorted(info.header_offset for info in archive.infolist())
+                offsets.append(archive.start_dir)
+        except zipfile.BadZipFile:
+            return []
+        # Each span is one entry's local header, data and descriptor
+        return [(start, end) for start, end in zip(offsets, offsets[1:]) if end - start >= MIN_CHUNK]
+
+    if data[:5] == b"%PDF-":
+        blocks = []
+        position = 0
+        while True:
+            match = PDF_STREAM_PATTERN.search(data, position)
+            if match is None:
+                break
+            end = data.find(b"endstream", match.end())
+            if end < 0:
+                break
+            if end - match.end() >= MIN_CHUNK:
+                blocks.append((match.end(), end))
+            position = end + len(b"endstream")
+        return blocks
+    return []
+
+def split_chunks(data):
+    """Split a document into chunks whose concatenation is exactly data"""
+    chunks = []
+    position = 0
+    for start, end in _large_blocks(data):
+        if start > position:
+            chunks.append(data[position:start])
+        chunks.append(data[start:end])
+        position = end
+    if position < len(data):
+        chunks.append(data[position:])
+    return chunks
+
+def _compress(data):
+    if zstandard is not None:
+        packed, codec = zstandard.ZstdCompressor(level=10).compress(data), "zstd"
+    else:
+        packed, codec = zlib.compress(data, 6), "zlib"
+    # Deflated ZIP entries and images barely shrink; keep them as they are
+    if len(packed) >= len(data) * 0.95:
+        return data, "raw"
+    return packed, codec
+
+def _decompress(codec, packed):
+    if codec == "raw":
+        return bytes(packed)
+    if codec == "zlib":
+        return zlib.decompress(packed)
+    if codec == "zstd":
+        if zstandard is None:
+            raise ArchiveError("This archive has zstd chunks; install zstandard to read them")
+        return zstandard.ZstdDecompressor().decompress(packed)
+    raise ArchiveError(f"Unknown chunk codec: {codec!r}")
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+class ProposalArchive:
+    """Generated proposals in a SQLite file, deduplicated by content-hashed chunks.
+
+    Every call opens its own connection, so one instance can be shared by
+    threads and several processes may use the same file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._transaction() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        with closing(sqlite3.connect(self.path, timeout=30)) as db:
+            with db:
+                yield db
+
+    def put(self, data, proposal_type, client_name, output_format, replacements=None,
+            file_name=None, template_version=None):
+        """Store a generated proposal and return its id; storing the same bytes again is a no-op"""
+        document_id = _digest(data)
+        chunks = [(_digest(chunk), chunk) for chunk in split_chunks(data)]
+        hashes = [chunk_hash for chunk_hash, _ in chunks]
+
+        with self._transaction() as db:
+            if db.execute("SELECT 1 FROM documents WHERE id = ?", (document_id,)).fetchone():
+                return document_id
+            placeholders = ",".join("?" * len(set(hashes)))
+            known = {row[0] for row in db.execute(
+                f"SELECT hash FROM chunks WHERE hash IN ({placeholders})", list(set(hashes)))}
+
+        # Compress outside the write transaction so other writers are not held up
+        new_chunks = {}
+        for chunk_hash, chunk in chunks:
+            if chunk_hash not in known and chunk_hash not in new_chunks:
+                packed, codec = _compress(chunk)
+                new_chunks[chunk_hash] = (codec, len(chunk), packed)
+
+        created_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        with self._transaction() as db:
+            if known:
+                # A concurrent delete may have dropped chunks that looked shared a moment ago
+                placeholders = ",".join("?" * len(known))
+                remaining = {row[0] for row in db.execute(
+                    f"SELECT hash FROM chunks WHERE hash IN ({placeholders})", list(known))}
+                for chunk_hash, chunk in chunks:
+                    if chunk_hash in known - remaining and chunk_hash not in new_chunks:
+                        packed, codec = _compress(chunk)
+                        new_chunks[chunk_hash] = (codec, len(chunk), packed)
+            db.executemany("INSERT OR IGNORE INTO chunks (hash, codec, size, data) VALUES (?, ?, ?, ?)",
+                           [(h, codec, size, packed) for h, (codec, size, packed) in new_chunks.items()])
+            cursor = db.execute(
+                "INSERT OR IGNORE INTO documents (id, proposal_type, client_name, created_at, output_format,"
+                " file_name, size, template_version, replacements) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (document_id, proposal_type, client_name or "", created_at, output_format, file_name,
+                 len(data), template_version, json.dumps(replacements or {}, ensure_ascii=False, default=str)))
+            if cursor.rowcount:
+                db.executemany("INSERT INTO document_chunks (document, position, chunk) VALUES (?, ?, ?)",
+                               [(document_id, position, h) for position, h in enumerate(hashes)])
+        return document_id
+
+    def get(self, document_id):
+        """The stored bytes of a document, or None if it is not archived"""
+        with self._transaction() as db:
+            if not db.execute("SELECT 1 FROM documents WHERE id = ?", (document_id,)).fetchone():
+                return None
+            rows = db.execute(
+                "SELECT c.codec, c.data FROM document_chunks d JOIN chunks c ON c.hash = d.chunk"
+                " WHERE d.document = ? ORDER BY d.position", (document_id,)).fetchall()
+        data = b"".join(_decompress(codec, packed) for codec, packed in rows)
+        if _digest(data) != document_id:
+            raise ArchiveError(f"Archived document {document_id} is corrupt")
+        return data
+
+    def record(self, document_id):
+        """Metadata and replacements of a document, or None"""
+        with self._transaction() as db:
+            row = db.execute(f"SELECT {', '.join(RECORD_COLUMNS)}, replacements FROM documents WHERE id = ?",
+                             (document_id,)).fetchone()
+        if row is None:
+            return None
+        record = dict(zip(RECORD_COLUMNS, row))
+        record["replacements"] = json.loads(row[-1])
+        return record
+
+    def find(self, client_name=None, proposal_type=None, since=None, until=None, limit=50):
+        """Newest-first metadata of documents matching every given filter.
+
+        client_name matches as a case-insensitive prefix; since and until
+        are ISO dates or timestamps (UTC).
+        """
+        conditions, params = [], []
+        if client_name:
+            escaped = client_name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conditions.append("client_name LIKE ? ESCAPE '\\'")
+            params.append(escaped + "%")
+        if proposal_type:
+            conditions.append("proposal_type = ?")
+            params.append(proposal_type)
+        if since:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        if until:
+            conditions.append("created_at < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._transaction() as db:
+            rows = db.execute(f"SELECT {', '.join(RECORD_COLUMNS)} FROM documents {where}"
+                              " ORDER BY created_at DESC LIMIT ?", params + [limit]).fetchall()
+        return [dict(zip(RECORD_COLUMNS, row)) for row in rows]
+
+    def resolve(self, prefix):
+        """Ids of up to two documents whose id starts with prefix"""
+        with self._transaction() as db:
+            return [row[0] for row in db.execute(
+                "SELECT id FROM documents WHERE id GLOB ? LIMIT 2", (prefix.lower().strip("*?[") + "*",))]
+
+    def delete(self, document_id):
+        """Remove a document and any chunks no other document uses"""
+        with self._transaction() as db:
+            chunks = [row[0] for row in db.execute(
+                "SELECT DISTINCT chunk FROM document_chunks WHERE document = ?", (document_id,))]
+            db.execute("DELETE FROM document_chunks WHERE document = ?", (document_id,))
+            deleted = db.execute("DELETE FROM documents WHERE id = ?", (document_id,)).rowcount
+            db.executemany("DELETE FROM chunks WHERE hash = ? AND NOT EXISTS"
+                           " (SELECT 1 FROM document_chunks WHERE chunk = ?)", [(h, h) for h in chunks])
+        return bool(deleted)
+
+    def stats(self):
+        with self._transaction() as db:
+            documents, logical_bytes = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM documents").fetchone()
+            chunks, stored_bytes = db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM chunks").fetchone()
+        return {
+            "documents": documents,
+            "chunks": chunks,
+            "logical_bytes": logical_bytes,
+            "stored_bytes": stored_bytes,
+            "ratio": round(logical_bytes / stored_bytes, 2) if stored_bytes else None,
+        }
+
+_archive = None
+_archive_lock = threading.Lock()
+
+def get_archive():
+    """Process-wide archive at PROPOSAL_ARCHIVE (a SQLite file path), or None when archiving is off"""
+    global _archive
+    path = os.environ.get("PROPOSAL_ARCHIVE")
+    if not path:
+        return None
+    with _archive_lock:
+        if _archive is None or _archive.path != path:
+            _archive = ProposalArchive(path)
+        return _archive
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Look up and retrieve archived proposals")
+    parser.add_argument("--archive", default=os.environ.get("PROPOSAL_ARCHIVE"),
+                        help="Archive file (default: $PROPOSAL_ARCHIVE)")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    find_parser = subcommands.add_parser("find", help="List archived proposals, newest first")
+    find_parser.add_argument("--client", help="Client name prefix (case-insensitive)")
+    find_parser.add_argument("--type", dest="proposal_type")
+    find_parser.add_argument("--since", help="ISO date, e.g. 2025-01-31")
+    find_parser.add_argument("--until", help="ISO date (exclusive)")
+    find_parser.add_argument("--limit", type=int, default=50)
+    for name, help_text in (("get", "Write an archived proposal's bytes"),
+                            ("rerender", "Render an archived proposal's inputs again with the current templates")):
+        sub = subcommands.add_parser(name, help=help_text)
+        sub.add_argument("id", help="Document id (a unique prefix is enough)")
+        sub.add_argument("--output", "-o", help="Output file (default: the archived file name)")
+    delete_parser = subcommands.add_parser("delete", help="Remove an archived proposal")
+    delete_parser.add_argument("id", help="Document id (a unique prefix is enough)")
+    subcommands.add_parser("stats", help="Show document count and storage savings")
+    args = parser.parse_args(argv)
+
+    if not args.archive:
+        parser.error("no archive given; pass --archive or set PROPOSAL_ARCHIVE")
+    archive = ProposalArchive(args.archive)
+
+    if args.command == "find":
+        for record in archive.find(args.client, args.proposal_type, args.since, args.until, args.limit):
+            print(f"{record['id'][:12]}  {record['created_at']}  {record['proposal_type']:<26} "
+                  f"{record['client_name']:<24} {record['output_format']}  {record['size'] / 1024:.0f} KB")
+        return 0
+    if args.command == "stats":
+        print(json.dumps(archive.stats(), indent=2))
+        return 0
+
+    matches = archive.resolve(args.id)
+    if len(matches) != 1:
+        print(f"{'No' if not matches else 'More than one'} archived proposal matches {args.id!r}", file=sys.stderr)
+        return 1
+    if args.command == "delete":
+        archive.delete(matches[0])
+        print(f"Deleted {matches[0]}")
+        return 0
+    record = archive.record(matches[0])
+    if args.command == "get":
+        data, file_name = archive.get(record["id"]), record["file_name"]
+    else:
+        from pdf_generator import render_proposal
+        result = render_proposal(record["proposal_type"], record["client_name"], record["replacements"],
+                                 record["output_format"])
+        data, file_name = result.data, result.file_name
+        for warning in result.warnings:
+            print(warning, file=sys.stderr)
+    output = args.output or file_name or f"{record['id'][:12]}.{record['output_format']}"
+    with open(output, "wb") as f:
+        f.write(data)
+    print(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
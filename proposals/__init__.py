@@ -1,11 +1,33 @@
-from .ai_automation import render_ai_automation_form
-from .digital_marketing import render_dm_form
-from .business_automation import render_ba_form
-from .contract import render_contract_form
+import importlib
+
+# Proposal type -> (module, render function). Form modules, and through them
+# python-docx and the PDF converters, are only imported when first needed.
+FORM_REGISTRY = {
+    "AI Automation": ("proposals.ai_automation", "render_ai_automation_form"),
+    "AI Automation without LPW": ("proposals.ai_automation_without_lpw", "render_ai_automation_without_lpw_form"),
+    "Digital Marketing": ("proposals.digital_marketing", "render_dm_form"),
+    "Business Automations": ("proposals.business_automation", "render_ba_form"),
+    "IT Consultation": ("proposals.contract", "render_contract_form"),
+}
+
+_RENDERERS = {function: module for module, function in FORM_REGISTRY.values()}
+
+def get_form_renderer(proposal_type):
+    """Import (on first use) and return the render function for a proposal type"""
+    module_name, function_name = FORM_REGISTRY[proposal_type]
+    return getattr(importlib.import_module(module_name), function_name)
+
+def __getattr__(name):
+    if name in _RENDERERS:
+        return getattr(importlib.import_module(_RENDERERS[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 __all__ = [
+    'FORM_REGISTRY',
+    'get_form_renderer',
     'render_ai_automation_form',
+    'render_ai_automation_without_lpw_form',
     'render_dm_form',
     'render_ba_form',
     'render_contract_form'
-] 
\ No newline at end of file
+]
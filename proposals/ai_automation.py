@@ -1,82 +1,113 @@
 import streamlit as st
 import datetime
-from pdf_generator import generate_proposal
+from pricing import quote
+from render_jobs import start_render_job, show_render_job
+from proposals.form_state import field_values, memoize, show_preview, sync_preview
+
+PRICE_FIELDS = {
+    "landing_page_price": "ai_landing_page",
+    "admin_panel_price": "ai_admin_panel",
+    "crm_price": "ai_crm",
+    "manychat_price": "ai_manychat",
+    "social_media_price": "ai_social_media",
+    "ai_calling_price": "ai_calling",
+}
 
 def render_ai_automation_form():
     st.header("AI Automation")
-    
+    # Each section is a fragment: editing a field only reruns its own section
+    _client_section()
+    _pricing_section()
+    _signature_section()
+    _generate_section()
+    show_render_job("ai", label="Download Proposal")
+    show_preview("ai", "AI Automation", _replacements)
+
+@st.fragment
+def _client_section():
     # Client Information
     st.subheader("Client Information")
     col1, col2 = st.columns(2)
     with col1:
-        client_name = st.text_input("Client Name", key="ai_name")
-        email = st.text_input("Email", key="ai_email")
-        phone = st.text_input("Phone", key="ai_phone")
-    with col2:    
-        country = st.text_input("Country", key="ai_country")
+        st.text_input("Client Name", key="ai_name")
+        st.text_input("Email", key="ai_email")
+        st.text_input("Phone", key="ai_phone")
+    with col2:
+        st.text_input("Country", key="ai_country")
         proposal_date = st.date_input("Proposal Date", key="ai_date")
-        validity_date = st.date_input("Validity Date", 
-                                    value=proposal_date + datetime.timedelta(days=365),  # Default 1 year validity
-                                    min_value=proposal_date,
-                                    help="Proposal validity end date")
-    
+        st.date_input("Validity Date",
+                      value=proposal_date + datetime.timedelta(days=365),  # Default 1 year validity
+                      min_value=proposal_date,
+                      help="Proposal validity end date",
+                      key="ai_validity")
+    sync_preview("ai", _replacements)
+
+@st.fragment
+def _pricing_section():
     # Project Pricing
     st.header("Project Pricing")
     col1, col2 = st.columns(2)
     with col1:
-        landing_page_price = st.number_input("Landing Page Website", min_value=0.0, step=0.01, format="%.2f")
-        admin_panel_price = st.number_input("Admin Panel", min_value=0.0, step=0.01, format="%.2f")
-        crm_price = st.number_input("CRM Automations", min_value=0.0, step=0.01, format="%.2f")
+        st.number_input("Landing Page Website", min_value=0.0, step=0.01, format="%.2f", key="ai_landing_page")
+        st.number_input("Admin Panel", min_value=0.0, step=0.01, format="%.2f", key="ai_admin_panel")
+        st.number_input("CRM Automations", min_value=0.0, step=0.01, format="%.2f", key="ai_crm")
     with col2:
-        manychat_price = st.number_input("ManyChat & Make Automation", min_value=0.0, step=0.01, format="%.2f")
-        social_media_price = st.number_input("Social Media Automation", min_value=0.0, step=0.01, format="%.2f")
-        ai_calling_price = st.number_input("AI Calling", min_value=0.0, step=0.01, format="%.2f")
-    
-    additional_features_price = st.number_input(
-        "Additional Features & Enhancements (USD per week)", 
-        min_value=0.0, 
-        step=0.01, 
+        st.number_input("ManyChat & Make Automation", min_value=0.0, step=0.01, format="%.2f", key="ai_manychat")
+        st.number_input("Social Media Automation", min_value=0.0, step=0.01, format="%.2f", key="ai_social_media")
+        st.number_input("AI Calling", min_value=0.0, step=0.01, format="%.2f", key="ai_calling")
+
+    st.number_input(
+        "Additional Features & Enhancements (USD per week)",
+        min_value=0.0,
+        step=0.01,
         format="%.2f",
-        value=250.00
+        value=250.00,
+        key="ai_additional"
     )
-    
-    total_price = (landing_page_price + admin_panel_price + crm_price + 
-                  manychat_price + social_media_price + ai_calling_price)
-    annual_maintenance = total_price * 0.20
-    
+    sync_preview("ai", _replacements)
+
+@st.fragment
+def _signature_section():
     st.header("Signature Details")
-    company_representative = st.text_input("Company Representative")
+    st.text_input("Company Representative", key="ai_representative")
+    sync_preview("ai", _replacements)
+
+def _totals():
+    prices = {item: st.session_state.get(key) or 0.0 for item, key in PRICE_FIELDS.items()}
+    return memoize("ai_totals", prices, lambda: quote("AI Automation", prices))
 
-    replacements = {
-        "{client_name}": client_name,
-        "{Email_address}": email,
-        "{Phone_no}": phone,
-        "{country_name}": country,
-        "{date}": proposal_date.strftime("%d/%m/%Y"),
-        "{validity_date}": validity_date.strftime("%d/%m/%Y"),
-        "{landing page price}": landing_page_price,
-        "{admin panel price}": admin_panel_price,
-        "{CRM Automation price}": crm_price,
-        "{Manychat price}": manychat_price,
-        "{SMP price}": social_media_price,
-        "{AI calling price}": ai_calling_price,
-        "{Total amount}": total_price,
-        "{AM price}": annual_maintenance,
-        "{Additional}": additional_features_price,
-        "{company_representative}": company_representative,
-    }
+def _replacements():
+    values = field_values("ai_name", "ai_email", "ai_phone", "ai_country", "ai_date", "ai_validity",
+                          "ai_additional", "ai_representative", *PRICE_FIELDS.values())
+    totals = _totals()
 
-    if st.button("Generate Proposal"):
+    def build():
+        return {
+            "{client_name}": values["ai_name"],
+            "{Email_address}": values["ai_email"],
+            "{Phone_no}": values["ai_phone"],
+            "{country_name}": values["ai_country"],
+            "{date}": values["ai_date"].strftime("%d/%m/%Y"),
+            "{validity_date}": values["ai_validity"].strftime("%d/%m/%Y"),
+            "{landing page price}": values["ai_landing_page"],
+            "{admin panel price}": values["ai_admin_panel"],
+            "{CRM Automation price}": values["ai_crm"],
+            "{Manychat price}": values["ai_manychat"],
+            "{SMP price}": values["ai_social_media"],
+            "{AI calling price}": values["ai_calling"],
+            "{Total amount}": totals["total"],
+            "{AM price}": totals["annual_maintenance"],
+            "{Additional}": values["ai_additional"],
+            "{company_representative}": values["ai_representative"],
+        }
+    return memoize("ai_replacements", (values, totals), build)
+
+@st.fragment
+def _generate_section():
+    if st.button("Generate Proposal", key="ai_generate"):
+        client_name = st.session_state.get("ai_name")
         if not client_name:
             st.error("Please enter client name")
             return
-            
-        result = generate_proposal("AI Automation", client_name, replacements)
-        if result:
-            file_data, file_name, mime_type = result
-            st.download_button(
-                label="Download Proposal",
-                data=file_data,
-                file_name=file_name,
-                mime=mime_type
-            ) 
\ No newline at end of file
+
+        start_render_job("ai", "AI Automation", client_name, _replacements())
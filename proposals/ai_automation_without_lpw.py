@@ -1,70 +1,89 @@
 import streamlit as st
 import datetime
-from pdf_generator import generate_proposal
+from pricing import quote
+from render_jobs import start_render_job, show_render_job
+from proposals.form_state import field_values, memoize, show_preview, sync_preview
+
+PRICE_FIELDS = {"ai_calling_price": "ai_lpw_calling", "crm_price": "ai_lpw_crm", "manychat_price": "ai_lpw_manychat"}
 
 def render_ai_automation_without_lpw_form():
     st.header("AI Automation without LPW")
-    
+    # Each section is a fragment: editing a field only reruns its own section
+    _client_section()
+    _pricing_section()
+    _generate_section()
+    show_render_job("ai_lpw", label="Download Proposal")
+    show_preview("ai_lpw", "AI Automation without LPW", _replacements)
+
+@st.fragment
+def _client_section():
     # Client Information
     st.subheader("Client Information")
     col1, col2 = st.columns(2)
     with col1:
-        client_name = st.text_input("Client Name")
-        email = st.text_input("Email")
-        phone = st.text_input("Phone")
-    with col2:    
-        country = st.text_input("Country")
-        proposal_date = st.date_input("Proposal Date")
-        validity_date = st.date_input("Validity Date", 
-                                    value=proposal_date + datetime.timedelta(days=365),
-                                    min_value=proposal_date,
-                                    help="Proposal validity end date")
+        st.text_input("Client Name", key="ai_lpw_name")
+        st.text_input("Email", key="ai_lpw_email")
+        st.text_input("Phone", key="ai_lpw_phone")
+    with col2:
+        st.text_input("Country", key="ai_lpw_country")
+        proposal_date = st.date_input("Proposal Date", key="ai_lpw_date")
+        st.date_input("Validity Date",
+                      value=proposal_date + datetime.timedelta(days=365),
+                      min_value=proposal_date,
+                      help="Proposal validity end date",
+                      key="ai_lpw_validity")
+    sync_preview("ai_lpw", _replacements)
 
+@st.fragment
+def _pricing_section():
     # Project Pricing
     st.subheader("Project Pricing")
     col1, col2 = st.columns(2)
     with col1:
-        ai_calling_price = st.number_input("AI Calling", min_value=0.0, step=0.01)
-        crm_price = st.number_input("CRM Automations", min_value=0.0, step=0.01)
+        st.number_input("AI Calling", min_value=0.0, step=0.01, key="ai_lpw_calling")
+        st.number_input("CRM Automations", min_value=0.0, step=0.01, key="ai_lpw_crm")
     with col2:
-        manychat_price = st.number_input("ManyChat & Make Automation", min_value=0.0, step=0.01)
-        additional_price = st.number_input("Additional Features & Enhancements", min_value=0.0, step=0.01)
-
-    # Calculate totals
-    total_price = ai_calling_price + crm_price + manychat_price
-    annual_maintenance = total_price * 0.20
+        st.number_input("ManyChat & Make Automation", min_value=0.0, step=0.01, key="ai_lpw_manychat")
+        st.number_input("Additional Features & Enhancements", min_value=0.0, step=0.01, key="ai_lpw_additional")
 
     # Display totals
-    st.subheader(f"Total Amount: ${total_price:,.2f}")
-    st.subheader(f"Annual Maintenance: ${annual_maintenance:,.2f}")
+    totals = _totals()
+    st.subheader(f"Total Amount: ${totals['total']:,.2f}")
+    st.subheader(f"Annual Maintenance: ${totals['annual_maintenance']:,.2f}")
+    sync_preview("ai_lpw", _replacements)
+
+def _totals():
+    prices = {item: st.session_state.get(key) or 0.0 for item, key in PRICE_FIELDS.items()}
+    return memoize("ai_lpw_totals", prices, lambda: quote("AI Automation without LPW", prices))
 
-    if st.button("Generate Proposal"):
+def _replacements():
+    values = field_values("ai_lpw_name", "ai_lpw_email", "ai_lpw_phone", "ai_lpw_country", "ai_lpw_date",
+                          "ai_lpw_validity", "ai_lpw_calling", "ai_lpw_crm", "ai_lpw_manychat", "ai_lpw_additional")
+    totals = _totals()
+
+    def build():
+        return {
+            "{client_name}": values["ai_lpw_name"],
+            "{Email_address}": values["ai_lpw_email"],
+            "{Phone_no}": values["ai_lpw_phone"],
+            "{country_name}": values["ai_lpw_country"],
+            "{date}": values["ai_lpw_date"].strftime("%d/%m/%Y"),
+            "{validity_date}": values["ai_lpw_validity"].strftime("%d/%m/%Y"),
+            "{AI calling price}": f"$ {values['ai_lpw_calling']:,.2f}",
+            "{CRM Automation price}": f"$ {values['ai_lpw_crm']:,.2f}",
+            "{Manychat price}": f"$ {values['ai_lpw_manychat']:,.2f}",
+            "{Total amount}": f"$ {totals['total']:,.2f}",
+            "{AM price}": f"$ {totals['annual_maintenance']:,.2f}",
+            "{Additional}": f"$ {values['ai_lpw_additional']:,.2f}"
+        }
+    return memoize("ai_lpw_replacements", (values, totals), build)
+
+@st.fragment
+def _generate_section():
+    if st.button("Generate Proposal", key="ai_lpw_generate"):
+        client_name = st.session_state.get("ai_lpw_name")
         if not client_name:
             st.error("Please enter client name")
             return
-            
-        replacements = {
-            "{client_name}": client_name,
-            "{Email_address}": email,
-            "{Phone_no}": phone,
-            "{country_name}": country,
-            "{date}": proposal_date.strftime("%d/%m/%Y"),
-            "{validity_date}": validity_date.strftime("%d/%m/%Y"),
-            "{AI calling price}": f"$ {ai_calling_price:,.2f}",
-            "{CRM Automation price}": f"$ {crm_price:,.2f}",
-            "{Manychat price}": f"$ {manychat_price:,.2f}",
-            "{Total amount}": f"$ {total_price:,.2f}",
-            "{AM price}": f"$ {annual_maintenance:,.2f}",
-            "{Additional}": f"$ {additional_price:,.2f}"
-        }
-        
-        result = generate_proposal("AI Automation without LPW", client_name, replacements)
-        
-        if result:
-            file_data, file_name, mime_type = result
-            st.download_button(
-                label="Download Proposal",
-                data=file_data,
-                file_name=file_name,
-                mime=mime_type
-            ) 
\ No newline at end of file
+
+        start_render_job("ai_lpw", "AI Automation without LPW", client_name, _replacements())
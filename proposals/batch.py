@@ -0,0 +1,152 @@
+"""Render proposals in bulk from a CSV or JSONL file.
+
+Each row needs a ``proposal_type`` (one of the keys of ``template_paths``) and
+a ``client_name``. Every other column/field is a placeholder value; names may
+be given with or without braces, e.g. ``date`` or ``{date}``. JSONL rows may
+instead carry a ``replacements`` object. Usage:
+
+    python -m proposals.batch rows.csv --output proposals.zip
+"""
+import os
+import csv
+import sys
+import json
+import time
+import zipfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from pdf_generator import render_docx_bytes, template_paths
+
+DOCX_SUFFIX = ".docx"
+
+def available_cores():
+    """Number of CPUs this process may run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def read_rows(path):
+    """Read batch rows from a .csv or .jsonl file, in file order"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            return list(csv.DictReader(f))
+        return [json.loads(line) for line in f if line.strip()]
+
+def _coerce(key, value):
+    """Turn numeric CSV strings for price/amount placeholders into numbers"""
+    if isinstance(value, str) and ("price" in key.lower() or "amount" in key.lower()):
+        try:
+            return float(value.replace(",", ""))
+        except ValueError:
+            return value
+    return value
+
+def row_replacements(row):
+    """Build the placeholder mapping for one batch row"""
+    if isinstance(row.get("replacements"), dict):
+        fields = dict(row["replacements"])
+        # An explicit {client_name} placeholder wins over the row's client name
+        if "client_name" not in fields and "{client_name}" not in fields:
+            fields["client_name"] = row.get("client_name", "")
+    else:
+        fields = {k: v for k, v in row.items() if k != "proposal_type"}
+
+    replacements = {}
+    for name, value in fields.items():
+        key = name if name.startswith("{") else "{" + name + "}"
+        replacements[key] = _coerce(key, "" if value is None else value)
+    return replacements
+
+def output_name(index, row):
+    """Unique, stable file name for a row"""
+    client_name = str(row.get("client_name") or "client").strip()
+    safe_client = "".join(c if c.isalnum() or c in " -_." else "_" for c in client_name)
+    return f"{index:04d}_{row['proposal_type']}_{safe_client}{DOCX_SUFFIX}"
+
+def render_row(job):
+    """Render one row in a worker process; returns (index, name, bytes, error)"""
+    index, row = job
+    try:
+        proposal_type = row.get("proposal_type")
+        if proposal_type not in template_paths:
+            raise ValueError(f"Unknown proposal type: {proposal_type!r}")
+        docx_bytes = render_docx_bytes(proposal_type, row_replacements(row))
+        return index, output_name(index, row), docx_bytes, None
+    except Exception as e:
+        return index, None, None, f"{type(e).__name__}: {e}"
+
+class _DirectoryWriter:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, name, data):
+        with open(os.path.join(self.path, name), "wb") as f:
+            f.write(data)
+
+    def close(self):
+        pass
+
+class _ZipWriter:
+    def __init__(self, path):
+        # DOCX files are already deflated, storing them avoids a second compression pass
+        self.archive = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED)
+
+    def write(self, name, data):
+        self.archive.writestr(name, data)
+
+    def close(self):
+        self.archive.close()
+
+def run_batch(rows, output, workers=None, report=None, log=sys.stdout):
+    """Render all rows and stream them into output (a .zip path or a directory)"""
+    workers = workers or available_cores()
+    writer = _ZipWriter(output) if output.lower().endswith(".zip") else _DirectoryWriter(output)
+    results = []
+    started = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(rows) // (workers * 4))
+            # map() yields in submission order, so output and report are deterministic
+            for index, name, data, error in executor.map(render_row, enumerate(rows, 1),
+                                                         chunksize=chunksize):
+                if error is None:
+                    writer.write(name, data)
+                    print(f"row {index}: ok {name} ({len(data):,} bytes)", file=log)
+                else:
+                    print(f"row {index}: FAILED {error}", file=log)
+                results.append({"row": index, "status": "ok" if error is None else "failed",
+                                "file": name or "", "error": error or ""})
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - started
+
+    if report:
+        with open(report, "w", newline="", encoding="utf-8") as f:
+            report_writer = csv.DictWriter(f, fieldnames=["row", "status", "file", "error"])
+            report_writer.writeheader()
+            report_writer.writerows(results)
+
+    succeeded = sum(1 for r in results if r["status"] == "ok")
+    rate = succeeded / elapsed if elapsed > 0 else 0.0
+    print(f"{succeeded}/{len(results)} proposals rendered in {elapsed:.2f}s "
+          f"({rate:.1f} docs/s, {workers} workers)", file=log)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render proposals in bulk from CSV or JSONL")
+    parser.add_argument("input", help="CSV or JSONL file with one proposal per row")
+    parser.add_argument("--output", "-o", default="proposals.zip",
+                        help="ZIP file or directory to write documents to")
+    parser.add_argument("--workers", "-w", type=int, default=None,
+                        help="Worker processes (default: available cores)")
+    parser.add_argument("--report", help="Write a per-row CSV report to this path")
+    args = parser.parse_args(argv)
+
+    results = run_batch(read_rows(args.input), args.output, args.workers, args.report)
+    return 0 if all(r["status"] == "ok" for r in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
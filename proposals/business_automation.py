@@ -1,70 +1,91 @@
 import streamlit as st
 import datetime
-from pdf_generator import generate_proposal
+from render_jobs import start_render_job, show_render_job
+from proposals.form_state import field_values, memoize, show_preview, sync_preview
+
+PRICE_KEYS = ("ba_week1_price", "ba_ai_auto", "ba_whts", "ba_crm", "ba_email", "ba_make",
+              "ba_firefly", "ba_chatbot", "ba_pdf", "ba_ai_mdl", "ba_cstm_ai")
 
 def render_ba_form():
+    # Each section is a fragment: editing a field only reruns its own section
+    _client_section()
+    _week1_section()
+    _pricing_section()
+    _generate_section()
+    show_render_job("ba")
+    show_preview("ba", "Business Automations", _replacements)
+
+@st.fragment
+def _client_section():
     st.header("Client Information")
     col1, col2 = st.columns(2)
     with col1:
-        client_name = st.text_input("Client Name", key="ba_name")
-        contact_no = st.text_input("Contact Number", key="ba_contact")
-        email_id = st.text_input("Email ID", key="ba_email_id")
+        st.text_input("Client Name", key="ba_name")
+        st.text_input("Contact Number", key="ba_contact")
+        st.text_input("Email ID", key="ba_email_id")
     with col2:
-        proposal_date = st.date_input("Date", datetime.datetime.now(), key="ba_date")
-        validity_date = st.date_input("Validity Date", key="ba_validity")
+        st.date_input("Date", datetime.datetime.now(), key="ba_date")
+        st.date_input("Validity Date", key="ba_validity")
 
     # Mutually Agreed Points
-    mutually_agreed_points = st.text_area("Mutually Agreed Points", key="ba_points")
-    
+    st.text_area("Mutually Agreed Points", key="ba_points")
+    sync_preview("ba", _replacements)
+
+@st.fragment
+def _week1_section():
     # Week 1 Details
     st.header("Week 1 Details")
-    week1_descrptn = st.text_area("Week 1 Description", key="ba_week1_desc")
-    week1_price = st.number_input("Week 1 Price", min_value=0.0, step=0.01, format="%.2f", key="ba_week1_price")
+    st.text_area("Week 1 Description", key="ba_week1_desc")
+    st.number_input("Week 1 Price", min_value=0.0, step=0.01, format="%.2f", key="ba_week1_price")
+    sync_preview("ba", _replacements)
 
+@st.fragment
+def _pricing_section():
     # Future Services Pricing
     st.header("Future Services Pricing")
     col1, col2 = st.columns(2)
     with col1:
-        ai_auto_price = st.number_input("AI Automations Price", min_value=0.0, step=0.01, format="%.2f", key="ba_ai_auto")
-        whts_price = st.number_input("WhatsApp Automation Price", min_value=0.0, step=0.01, format="%.2f", key="ba_whts")
-        crm_price = st.number_input("CRM Setup Price", min_value=0.0, step=0.01, format="%.2f", key="ba_crm")
-        email_price = st.number_input("Email Marketing Setup Price", min_value=0.0, step=0.01, format="%.2f", key="ba_email")
-        make_price = st.number_input("Make/Zapier Automation Price", min_value=0.0, step=0.01, format="%.2f", key="ba_make")
+        st.number_input("AI Automations Price", min_value=0.0, step=0.01, format="%.2f", key="ba_ai_auto")
+        st.number_input("WhatsApp Automation Price", min_value=0.0, step=0.01, format="%.2f", key="ba_whts")
+        st.number_input("CRM Setup Price", min_value=0.0, step=0.01, format="%.2f", key="ba_crm")
+        st.number_input("Email Marketing Setup Price", min_value=0.0, step=0.01, format="%.2f", key="ba_email")
+        st.number_input("Make/Zapier Automation Price", min_value=0.0, step=0.01, format="%.2f", key="ba_make")
     with col2:
-        firefly_price = st.number_input("Firefly Meeting Price", min_value=0.0, step=0.01, format="%.2f", key="ba_firefly")
-        chatbot_price = st.number_input("AI Chatbot Price", min_value=0.0, step=0.01, format="%.2f", key="ba_chatbot")
-        pdf_gen_pr = st.number_input("PDF Generation Price", min_value=0.0, step=0.01, format="%.2f", key="ba_pdf")
-        ai_mdl_price = st.number_input("AI Social Media Price", min_value=0.0, step=0.01, format="%.2f", key="ba_ai_mdl")
-        cstm_ai_price = st.number_input("Custom AI Models Price", min_value=0.0, step=0.01, format="%.2f", key="ba_cstm_ai")
+        st.number_input("Firefly Meeting Price", min_value=0.0, step=0.01, format="%.2f", key="ba_firefly")
+        st.number_input("AI Chatbot Price", min_value=0.0, step=0.01, format="%.2f", key="ba_chatbot")
+        st.number_input("PDF Generation Price", min_value=0.0, step=0.01, format="%.2f", key="ba_pdf")
+        st.number_input("AI Social Media Price", min_value=0.0, step=0.01, format="%.2f", key="ba_ai_mdl")
+        st.number_input("Custom AI Models Price", min_value=0.0, step=0.01, format="%.2f", key="ba_cstm_ai")
+    sync_preview("ba", _replacements)
+
+def _replacements():
+    values = field_values("ba_name", "ba_contact", "ba_email_id", "ba_date", "ba_validity", "ba_points",
+                          "ba_week1_desc", *PRICE_KEYS)
 
-    replacements = {
-        "{client_name}": client_name,
-        "{contact_no}": contact_no,
-        "{email_id}": email_id,
-        "{date}": proposal_date.strftime("%d/%m/%Y"),
-        "{validity_date}": validity_date.strftime("%d/%m/%Y"),
-        "{mutually_agreed_points}": mutually_agreed_points,
-        "{week1_descrptn}": week1_descrptn,
-        "{week1_price}": f"$ {week1_price:,.2f}",
-        "{ai_auto_price}": f"$ {ai_auto_price:,.2f}",
-        "{whts_price}": f"$ {whts_price:,.2f}",
-        "{crm_price}": f"$ {crm_price:,.2f}",
-        "{email_price}": f"$ {email_price:,.2f}",
-        "{make_price}": f"$ {make_price:,.2f}",
-        "{firefly_price}": f"$ {firefly_price:,.2f}",
-        "{chatbot_price}": f"$ {chatbot_price:,.2f}",
-        "{pdf_gen_pr}": f"$ {pdf_gen_pr:,.2f}",
-        "{ai_mdl_price}": f"$ {ai_mdl_price:,.2f}",
-        "{cstm_ai_price}": f"$ {cstm_ai_price:,.2f}"
-    }
+    def build():
+        return {
+            "{client_name}": values["ba_name"],
+            "{contact_no}": values["ba_contact"],
+            "{email_id}": values["ba_email_id"],
+            "{date}": values["ba_date"].strftime("%d/%m/%Y"),
+            "{validity_date}": values["ba_validity"].strftime("%d/%m/%Y"),
+            "{mutually_agreed_points}": values["ba_points"],
+            "{week1_descrptn}": values["ba_week1_desc"],
+            "{week1_price}": f"$ {values['ba_week1_price']:,.2f}",
+            "{ai_auto_price}": f"$ {values['ba_ai_auto']:,.2f}",
+            "{whts_price}": f"$ {values['ba_whts']:,.2f}",
+            "{crm_price}": f"$ {values['ba_crm']:,.2f}",
+            "{email_price}": f"$ {values['ba_email']:,.2f}",
+            "{make_price}": f"$ {values['ba_make']:,.2f}",
+            "{firefly_price}": f"$ {values['ba_firefly']:,.2f}",
+            "{chatbot_price}": f"$ {values['ba_chatbot']:,.2f}",
+            "{pdf_gen_pr}": f"$ {values['ba_pdf']:,.2f}",
+            "{ai_mdl_price}": f"$ {values['ba_ai_mdl']:,.2f}",
+            "{cstm_ai_price}": f"$ {values['ba_cstm_ai']:,.2f}"
+        }
+    return memoize("ba_replacements", values, build)
 
+@st.fragment
+def _generate_section():
     if st.button("Generate BA Proposal", key="ba_generate"):
-        result = generate_proposal("Business Automations", client_name, replacements)
-        if result:
-            file_data, file_name, mime_type = result
-            st.download_button(
-                label=f"Download {file_name}",
-                data=file_data,
-                file_name=file_name,
-                mime=mime_type
-            ) 
\ No newline at end of file
+        start_render_job("ba", "Business Automations", st.session_state.get("ba_name"), _replacements())
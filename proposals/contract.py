@@ -1,29 +1,38 @@
 import streamlit as st
 import datetime
-from pdf_generator import generate_proposal
+from render_jobs import start_render_job, show_render_job
+from proposals.form_state import field_values, memoize, show_preview, sync_preview
 
 def render_contract_form():
+    # Typing in the contract fields only reruns this form, not the whole app
+    _contract_section()
+    _generate_section()
+    show_render_job("contract")
+    show_preview("contract", "IT Consultation", _replacements)
+
+@st.fragment
+def _contract_section():
     st.header("Contract Information")
     col1, col2 = st.columns(2)
     with col1:
-        client_name = st.text_input("Client Name", key="contract_name")
-        client_company_address = st.text_area("Company Address", key="contract_address")
+        st.text_input("Client Name", key="contract_name")
+        st.text_area("Company Address", key="contract_address")
     with col2:
-        contract_date = st.date_input("Contract Date", datetime.datetime.now(), key="contract_date")
+        st.date_input("Contract Date", datetime.datetime.now(), key="contract_date")
+    sync_preview("contract", _replacements)
+
+def _replacements():
+    values = field_values("contract_name", "contract_address", "contract_date")
 
-    replacements = {
-        "{date}": contract_date.strftime("%d/%m/%Y"),
-        "{client_name}": client_name,
-        "{client_company_address}": client_company_address
-    }
+    def build():
+        return {
+            "{date}": values["contract_date"].strftime("%d/%m/%Y"),
+            "{client_name}": values["contract_name"],
+            "{client_company_address}": values["contract_address"]
+        }
+    return memoize("contract_replacements", values, build)
 
+@st.fragment
+def _generate_section():
     if st.button("Generate Contract", key="contract_generate"):
-        result = generate_proposal("IT Consultation", client_name, replacements)
-        if result:
-            file_data, file_name, mime_type = result
-            st.download_button(
-                label=f"Download {file_name}",
-                data=file_data,
-                file_name=file_name,
-                mime=mime_type
-            ) 
\ No newline at end of file
+        start_render_job("contract", "IT Consultation", st.session_state.get("contract_name"), _replacements())
@@ -1,60 +1,76 @@
 import streamlit as st
 import datetime
-from pdf_generator import generate_proposal
+from pricing import quote
+from render_jobs import start_render_job, show_render_job
+from proposals.form_state import field_values, memoize, show_preview, sync_preview
+
+PRICE_FIELDS = {"social_media_posts": "dm_smp", "research_and_dev": "dm_rnd", "monthly_cost": "dm_monthly"}
 
 def render_dm_form():
+    # Each section is a fragment: editing a field only reruns its own section
+    _client_section()
+    _pricing_section()
+    _generate_section()
+    show_render_job("dm")
+    show_preview("dm", "Digital Marketing", _replacements)
+
+@st.fragment
+def _client_section():
     st.header("Client Information")
     col1, col2 = st.columns(2)
     with col1:
-        client_name = st.text_input("Client Name", key="dm_name")
-        designation = st.text_input("Designation", key="dm_designation")
-        contact_no = st.text_input("Contact Number", key="dm_contact")
+        st.text_input("Client Name", key="dm_name")
+        st.text_input("Designation", key="dm_designation")
+        st.text_input("Contact Number", key="dm_contact")
     with col2:
-        email_id = st.text_input("Email ID", key="dm_email")
-        proposal_date = st.date_input("Date", datetime.datetime.now(), key="dm_date")
-    
+        st.text_input("Email ID", key="dm_email")
+        st.date_input("Date", datetime.datetime.now(), key="dm_date")
+
     # Mutually Agreed Points
-    mutually_agreed_points = st.text_area("Mutually Agreed Points")
-    
+    st.text_area("Mutually Agreed Points", key="dm_points")
+    sync_preview("dm", _replacements)
+
+@st.fragment
+def _pricing_section():
     # Digital Marketing Services Pricing
     st.header("Digital Marketing Services Pricing")
     col1, col2 = st.columns(2)
     with col1:
-        social_media_posts = st.number_input("30 Creative Social Media Posts", min_value=0.0, step=0.01, format="%.2f", key="dm_smp")
-        research_and_dev = st.number_input("Marketing Research + 1 Month Ads", min_value=0.0, step=0.01, format="%.2f", key="dm_rnd")
+        st.number_input("30 Creative Social Media Posts", min_value=0.0, step=0.01, format="%.2f", key="dm_smp")
+        st.number_input("Marketing Research + 1 Month Ads", min_value=0.0, step=0.01, format="%.2f", key="dm_rnd")
     with col2:
-        monthly_cost = st.number_input("Monthly Maintenance", min_value=0.0, step=0.01, format="%.2f", key="dm_monthly")
-    
-    # Calculate totals
-    subtotal = social_media_posts + research_and_dev + monthly_cost
-    gst = subtotal * 0.18  # 18% GST
-    total_amount = subtotal + gst
-    advance = total_amount * 0.5
-    balance = total_amount * 0.5
-    
-    replacements = {
-        "{client_name}": client_name,
-        "{designation}": designation,
-        "{contact_no}": contact_no,
-        "{email_id}": email_id,
-        "{date}": proposal_date.strftime("%d/%m/%Y"),
-        "{Mutually_agreed_points}": mutually_agreed_points,
-        "{3d_SMP}": f"$ {social_media_posts:,.2f}",
-        "{R&D}": f"$ {research_and_dev:,.2f}",
-        "{monthly_cost}": f"$ {monthly_cost:,.2f}",
-        "{gst}": f"$ {gst:,.2f}",
-        "{total_amount}": f"$ {total_amount:,.2f}",
-        "{Advance}": f"$ {advance:,.2f}",
-        "{balance}": f"$ {balance:,.2f}"
-    }
+        st.number_input("Monthly Maintenance", min_value=0.0, step=0.01, format="%.2f", key="dm_monthly")
+    sync_preview("dm", _replacements)
+
+def _totals():
+    # 18% GST, split 50/50 into advance and balance
+    prices = {item: st.session_state.get(key) or 0.0 for item, key in PRICE_FIELDS.items()}
+    return memoize("dm_totals", prices, lambda: quote("Digital Marketing", prices))
+
+def _replacements():
+    values = field_values("dm_name", "dm_designation", "dm_contact", "dm_email", "dm_date", "dm_points",
+                          "dm_smp", "dm_rnd", "dm_monthly")
+    totals = _totals()
+
+    def build():
+        return {
+            "{client_name}": values["dm_name"],
+            "{designation}": values["dm_designation"],
+            "{contact_no}": values["dm_contact"],
+            "{email_id}": values["dm_email"],
+            "{date}": values["dm_date"].strftime("%d/%m/%Y"),
+            "{Mutually_agreed_points}": values["dm_points"],
+            "{3d_SMP}": f"$ {values['dm_smp']:,.2f}",
+            "{R&D}": f"$ {values['dm_rnd']:,.2f}",
+            "{monthly_cost}": f"$ {values['dm_monthly']:,.2f}",
+            "{gst}": f"$ {totals['gst']:,.2f}",
+            "{total_amount}": f"$ {totals['total_amount']:,.2f}",
+            "{Advance}": f"$ {totals['advance']:,.2f}",
+            "{balance}": f"$ {totals['balance']:,.2f}"
+        }
+    return memoize("dm_replacements", (values, totals), build)
 
+@st.fragment
+def _generate_section():
     if st.button("Generate DM Proposal", key="dm_generate"):
-        result = generate_proposal("Digital Marketing", client_name, replacements)
-        if result:
-            file_data, file_name, mime_type = result
-            st.download_button(
-                label=f"Download {file_name}",
-                data=file_data,
-                file_name=file_name,
-                mime=mime_type
-            ) 
\ No newline at end of file
+        start_render_job("dm", "Digital Marketing", st.session_state.get("dm_name"), _replacements())
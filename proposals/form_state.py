@@ -0,0 +1,59 @@
+import streamlit as st
+
+def memoize(key, inputs, compute):
+    """Return compute(), kept in session state under key and recomputed only when inputs change"""
+    cached = st.session_state.get(key)
+    if cached is not None and cached[0] == inputs:
+        return cached[1]
+    value = compute()
+    st.session_state[key] = (inputs, value)
+    return value
+
+def field_values(*keys):
+    """Current values of the widgets with these keys, by key.
+
+    Lets one fragment read what the user entered in another without
+    rerunning it.
+    """
+    return {key: st.session_state.get(key) for key in keys}
+
+def show_preview(form_key, proposal_type, replacements):
+    """Optional live preview of the filled template; replacements is called for the current mapping.
+
+    The preview is redrawn on app reruns only; section fragments call
+    sync_preview so that editing a field reruns the app while it is open.
+    """
+    if not st.toggle("Live preview", key=f"{form_key}_preview_on"):
+        st.session_state.pop(_previewed_key(form_key), None)
+        return
+    # Deferred so that drawing a form never pays for importing python-docx
+    from preview import Preview, get_preview_template
+
+    try:
+        template = get_preview_template(proposal_type)
+    except OSError:
+        st.info("No preview is available for this proposal type")
+        return
+    preview = st.session_state.get(f"{form_key}_preview")
+    if preview is None or preview.template is not template:
+        preview = st.session_state[f"{form_key}_preview"] = Preview(template)
+    mapping = replacements()
+    preview.update(mapping)
+    st.session_state[_previewed_key(form_key)] = mapping
+    st.session_state.pop(f"{form_key}_preview_requested", None)
+    st.html(preview.output)
+
+def sync_preview(form_key, replacements):
+    """Call at the end of a section fragment: rerun the app when the open preview no longer matches the inputs"""
+    previewed = st.session_state.get(_previewed_key(form_key))
+    if previewed is None:
+        return  # preview closed
+    mapping = replacements()
+    # Rerun once per new mapping; a full rerun reaches the sections before the
+    # preview, and must not trigger another
+    if mapping != previewed and st.session_state.get(f"{form_key}_preview_requested") != mapping:
+        st.session_state[f"{form_key}_preview_requested"] = mapping
+        st.rerun()
+
+def _previewed_key(form_key):
+    return f"{form_key}_previewed"
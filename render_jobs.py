@@ -0,0 +1,156 @@
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+
+# Shared by every session; sized independently of the number of connected users
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", 4))
+# Finished results are dropped after this many seconds if nobody downloads them
+JOB_TTL = 3600
+POLL_INTERVAL = 0.5
+
+class RenderJob:
+    """A proposal render running (or finished) on the shared pool"""
+
+    def __init__(self, job_id, future):
+        self.job_id = job_id
+        self.future = future
+        self.submitted_at = time.monotonic()
+        self.finished_at = None
+        future.add_done_callback(self._mark_finished)
+
+    def _mark_finished(self, future):
+        self.finished_at = time.monotonic()
+
+    @property
+    def status(self):
+        if self.future.done():
+            return "failed" if self.future.exception() is not None else "done"
+        return "running" if self.future.running() else "queued"
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.monotonic()) - self.submitted_at
+
+class RenderJobStore:
+    """Bounded render pool plus the jobs submitted to it"""
+
+    def __init__(self, workers=RENDER_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="proposal-render")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        job_id = uuid.uuid4().hex
+        job = RenderJob(job_id, self.executor.submit(fn, *args))
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = job
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            # Also pruned here, so results nobody downloads expire even if no one submits again
+            self._prune()
+            return self._jobs.get(job_id)
+
+    def discard(self, job_id):
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None:
+            job.future.cancel()
+
+    def _prune(self):
+        now = time.monotonic()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and now - job.finished_at > JOB_TTL]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+@st.cache_resource
+def get_job_store():
+    """Process-wide job store, shared across sessions and reruns"""
+    return RenderJobStore()
+
+def _session_key(form_key):
+    return f"{form_key}_render_job"
+
+def start_render_job(form_key, proposal_type, client_name, replacements):
+    """Queue a proposal render for this form, replacing any earlier job of the same form.
+
+    Reruns the app so that show_render_job starts polling the new job.
+    """
+    # Deferred so that drawing a form never pays for importing python-docx
+    from pdf_generator import render_proposal
+
+    store = get_job_store()
+    previous = st.session_state.get(_session_key(form_key))
+    if previous:
+        store.discard(previous)
+    st.session_state[_session_key(form_key)] = store.submit(
+        render_proposal, proposal_type, client_name, dict(replacements))
+    st.rerun()
+
+def forget_render_job(form_key):
+    """Release this form's job and its result"""
+    job_id = st.session_state.pop(_session_key(form_key), None)
+    if job_id:
+        get_job_store().discard(job_id)
+
+def show_render_job(form_key, label=None):
+    """Show the status of this form's render job, or its download button once finished.
+
+    Call it outside any fragment. Only a pending job is polled, by a fragment
+    of its own, so waiting never holds the script thread and idle forms never
+    rerun on a timer.
+    """
+    job_id = st.session_state.get(_session_key(form_key))
+    if not job_id:
+        return
+
+    job = get_job_store().get(job_id)
+    if job is None:
+        st.session_state.pop(_session_key(form_key), None)
+        st.warning("This proposal has expired, please generate it again")
+        return
+
+    status = job.status
+    if status in ("queued", "running"):
+        _poll_render_job(job_id)
+        return
+
+    if status == "failed":
+        st.error(f"Error generating proposal: {str(job.future.exception())}")
+        forget_render_job(form_key)
+        return
+
+    result = job.future.result()
+    show_result_messages(result)
+    st.download_button(
+        label=label or f"Download {result.file_name}",
+        data=result.data,
+        file_name=result.file_name,
+        mime=result.mime_type,
+        key=f"{form_key}_download",
+        on_click=forget_render_job,
+        args=(form_key,)
+    )
+
+@st.fragment(run_every=POLL_INTERVAL)
+def _poll_render_job(job_id):
+    job = get_job_store().get(job_id)
+    if job is not None and job.status in ("queued", "running"):
+        st.info(f"Generating proposal ({job.status}, {job.elapsed:.0f}s)...")
+        return
+    # Finished or discarded: rerun the app so the form shows the outcome; the
+    # fragment is not called again, which is what stops its timer
+    st.rerun()
+
+def show_result_messages(result):
+    """Report a rendered proposal's outcome in the UI"""
+    if result.is_pdf:
+        st.success("PDF generated successfully!")
+    for warning in result.warnings:
+        st.warning(warning)
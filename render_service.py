@@ -0,0 +1,334 @@
+"""Headless HTTP API for rendering proposals.
+
+Accepts a proposal type plus placeholder values as JSON and answers with the
+rendered PDF (or DOCX) bytes, so that other systems never have to drive the
+Streamlit UI:
+
+    python -m render_service --port 8503 --workers 4 --queue 32
+
+    curl -s localhost:8503/render -o proposal.pdf -d '{"proposal_type": "Digital Marketing",
+         "client_name": "Acme", "replacements": {"date": "1 May 2025", "total_amount": 1200}}'
+
+DOCX rendering runs on a pool of worker processes and PDF conversion on the
+shared converter pool (or on the same workers for the in-process native
+converter), both within the request's timeout. At most workers +
+queue requests are admitted at once; beyond that the service answers 429 with
+Retry-After instead of queueing without bound. GET /healthz reports capacity
+and load, GET /metrics exposes the proposal metrics of the service and its
+workers.
+"""
+import os
+import sys
+import json
+import math
+import time
+import logging
+import argparse
+import threading
+import multiprocessing
+from urllib.parse import quote
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pdf_generator import docx_bytes_to_pdf, render_docx_bytes, render_proposal, template_paths
+from pdf_converters import get_converter_pool
+from output_cache import OUTPUT_FORMATS
+from proposals.batch import available_cores, row_replacements
+from metrics import metrics
+
+SERVICE_WORKERS = int(os.environ.get("RENDER_SERVICE_WORKERS", min(4, available_cores())))
+SERVICE_QUEUE = int(os.environ.get("RENDER_SERVICE_QUEUE", 32))
+SERVICE_TIMEOUT = float(os.environ.get("RENDER_SERVICE_TIMEOUT", 60))
+MAX_REQUEST_BYTES = 1024 * 1024
+RETRY_AFTER = 1
+
+logger = logging.getLogger("proposals.service")
+
+class RenderTimeout(Exception):
+    pass
+
+def run_in_worker(fn, *args):
+    """Call fn(*args) on a worker process.
+
+    Returns (result, exception, metrics snapshot) so that the service can
+    fold what the worker recorded into its own metrics.
+    """
+    # A worker runs one job at a time, so everything recorded since the reset belongs to it
+    metrics.reset()
+    try:
+        return fn(*args), None, metrics.snapshot()
+    except Exception as e:
+        return None, e, metrics.snapshot()
+
+def convert_in_worker(docx_bytes, timeout):
+    """docx_bytes_to_pdf for a worker process; returns (pdf bytes or None, errors)"""
+    errors = []
+    return docx_bytes_to_pdf(docx_bytes, errors, timeout), errors
+
+def _merge_worker_metrics(future):
+    if not future.cancelled() and future.exception() is None:
+        metrics.merge(future.result()[2])
+
+class _Slot:
+    """One admitted request's place in the service, released exactly once"""
+
+    def __init__(self, service):
+        self._service = service
+        self._released = False
+        self.handed_off = False
+
+    def release(self, *args):
+        if not self._released:
+            self._released = True
+            self._service._release()
+
+    def hold_until(self, future):
+        # A render that outlived its request still occupies a worker, so keep
+        # counting it against capacity until it actually finishes
+        self.handed_off = True
+        future.add_done_callback(self.release)
+
+class RenderService:
+    """Worker processes for DOCX rendering plus the admission limit in front of them"""
+
+    def __init__(self, workers=SERVICE_WORKERS, queue_size=SERVICE_QUEUE, timeout=SERVICE_TIMEOUT):
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.timeout = timeout
+        self.started_at = time.monotonic()
+        self.in_flight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._executor = self._new_executor()
+
+    def _new_executor(self):
+        # spawn: forking a process that is already running request threads is unsafe
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def admit(self):
+        """Return a slot for a new request, or None when the service is saturated"""
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.rejected += 1
+                return None
+            self.in_flight += 1
+        return _Slot(self)
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def render_docx(self, slot, deadline, proposal_type, replacements):
+        """Render DOCX bytes on a worker process, giving up at deadline"""
+        return self._run(slot, deadline, render_docx_bytes, proposal_type, replacements)
+
+    def _run(self, slot, deadline, fn, *args):
+        executor = self._executor
+        try:
+            future = executor.submit(run_in_worker, fn, *args)
+        except BrokenProcessPool:
+            future = self._replace_executor(executor).submit(run_in_worker, fn, *args)
+        # Merged when the job finishes, even if the request gave up on it
+        future.add_done_callback(_merge_worker_metrics)
+        try:
+            result, error, _ = future.result(timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeout:
+            if not future.cancel():
+                slot.hold_until(future)
+            raise RenderTimeout(f"Rendering took longer than {self.timeout:g}s")
+        except BrokenProcessPool:
+            self._replace_executor(executor)
+            raise
+        if error is not None:
+            raise error
+        return result
+
+    def convert(self, slot, deadline, docx_bytes, errors):
+        """Convert to PDF within what is left of the deadline"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise RenderTimeout(f"Rendering took longer than {self.timeout:g}s")
+        pool = get_converter_pool()
+        if getattr(pool, "in_process", False):
+            # An in-process converter would hold the GIL of the request threads; use a render worker
+            pdf_bytes, worker_errors = self._run(slot, deadline, convert_in_worker, docx_bytes, remaining)
+            errors.extend(worker_errors)
+        else:
+            pdf_bytes = docx_bytes_to_pdf(docx_bytes, errors, timeout=remaining)
+        if pdf_bytes is None and time.monotonic() >= deadline:
+            raise RenderTimeout(f"Rendering took longer than {self.timeout:g}s")
+        return pdf_bytes
+
+    def _replace_executor(self, broken):
+        with self._lock:
+            if self._executor is broken:
+                logger.warning("Render worker died, starting a new worker pool")
+                self._executor = self._new_executor()
+                broken.shutdown(wait=False, cancel_futures=True)
+            return self._executor
+
+    def render(self, slot, request):
+        """Build the proposal described by a request body"""
+        proposal_type = request.get("proposal_type")
+        output_format = request.get("format")
+        if output_format is not None and output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown format: {output_format!r}")
+        client_name = str(request.get("client_name") or "client")
+        replacements = request.get("replacements")
+        if replacements is None:
+            replacements = {}
+        elif not isinstance(replacements, dict):
+            raise ValueError("replacements must be a JSON object")
+        replacements = row_replacements({"client_name": client_name, "replacements": replacements})
+
+        timeout = self._timeout(request.get("timeout"))
+        deadline = time.monotonic() + timeout
+        def render_docx(proposal_type, replacements):
+            return self.render_docx(slot, deadline, proposal_type, replacements)
+        def convert(docx_bytes, errors):
+            return self.convert(slot, deadline, docx_bytes, errors)
+        try:
+            return render_proposal(proposal_type, client_name, replacements, output_format, render_docx, convert)
+        except RenderTimeout:
+            raise RenderTimeout(f"Rendering took longer than {timeout:g}s") from None
+
+    def _timeout(self, requested):
+        """The request's timeout in seconds, never longer than the service's own"""
+        if requested is None:
+            return self.timeout
+        try:
+            if isinstance(requested, bool):
+                raise ValueError
+            requested = float(requested)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid timeout: {requested!r}")
+        if not math.isfinite(requested) or requested <= 0:
+            raise ValueError(f"Invalid timeout: {requested!r}, must be a positive number of seconds")
+        return min(requested, self.timeout)
+
+    def health(self):
+        with self._lock:
+            in_flight, rejected = self.in_flight, self.rejected
+        pool = get_converter_pool()
+        return {
+            "status": "ok",
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "in_flight": in_flight,
+            "rejected": rejected,
+            "converter": pool.backend if pool is not None else None,
+            "proposal_types": list(template_paths),
+            "uptime_s": round(time.monotonic() - self.started_at, 1),
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def do_GET(self):
+        if self.path.startswith("/healthz"):
+            self._send_json(200, self.service.health())
+        elif self.path.startswith("/metrics"):
+            self._send(200, metrics.render_prometheus().encode(), "text/plain; version=0.0.4")
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if not self.path.startswith("/render"):
+            self._send_json(404, {"error": "Not found"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_REQUEST_BYTES:
+            self._send_json(413, {"error": "Request body too large"})
+            return
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("Request body must be a JSON object")
+        except ValueError as e:
+            self._send_json(400, {"error": f"Invalid JSON: {e}"})
+            return
+
+        slot = self.service.admit()
+        if slot is None:
+            metrics.increment("proposal_service_rejected_total")
+            self._send_json(429, {"error": "Too many requests"}, {"Retry-After": str(RETRY_AFTER)})
+            return
+        try:
+            result = self.service.render(slot, request)
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+        except RenderTimeout as e:
+            self._send_json(504, {"error": str(e)})
+        except BrokenProcessPool:
+            self._send_json(503, {"error": "Render worker crashed, please retry"}, {"Retry-After": str(RETRY_AFTER)})
+        except Exception as e:
+            logger.exception("Render request failed")
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+        else:
+            headers = {
+                "Content-Disposition": f"attachment; filename*=UTF-8''{quote(result.file_name)}",
+                "X-Proposal-Format": result.output_format,
+                "Server-Timing": ", ".join(f"{stage};dur={seconds * 1000:.1f}"
+                                           for stage, seconds in result.timings.items()),
+            }
+            if result.archive_id:
+                headers["X-Proposal-Archive-Id"] = result.archive_id
+            if result.warnings:
+                headers["X-Proposal-Warnings"] = quote("; ".join(result.warnings), safe=" ;,()")
+            self._send(200, result.data, result.mime_type, headers)
+        finally:
+            if not slot.handed_off:
+                slot.release()
+
+    def _send_json(self, status, payload, headers=None):
+        self._send(status, json.dumps(payload).encode(), "application/json", headers)
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class RenderHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Let bursts reach admission control (and a 429) rather than being refused by the kernel
+    request_queue_size = 128
+
+def make_server(host="127.0.0.1", port=8503, service=None):
+    """HTTP server bound to host:port that renders with service"""
+    handler = type("Handler", (RenderRequestHandler,), {"service": service or RenderService()})
+    return RenderHTTPServer((host, port), handler)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve proposal rendering over HTTP")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind (default: localhost only)")
+    parser.add_argument("--port", type=int, default=8503)
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS, help="DOCX render processes")
+    parser.add_argument("--queue", type=int, default=SERVICE_QUEUE, help="Requests admitted beyond the workers")
+    parser.add_argument("--timeout", type=float, default=SERVICE_TIMEOUT, help="Seconds per render request")
+    args = parser.parse_args(argv)
+
+    service = RenderService(args.workers, args.queue, args.timeout)
+    server = make_server(args.host, args.port, service)
+    print(f"Serving proposals on http://{args.host}:{args.port} with {args.workers} workers", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
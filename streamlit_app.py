@@ -1,32 +1,17 @@
 import streamlit as st
-from proposals.ai_automation import render_ai_automation_form
-from proposals.digital_marketing import render_dm_form
-from proposals.business_automation import render_ba_form
-from proposals.contract import render_contract_form
-from proposals.ai_automation_without_lpw import render_ai_automation_without_lpw_form
+from proposals import FORM_REGISTRY, get_form_renderer
 
 def main():
     st.title("Proposal Generator")
     
     proposal_type = st.radio(
         "Select Proposal Type",
-        ["AI Automation",
-         "AI Automation without LPW",
-         "Digital Marketing", 
-         "Business Automations", 
-         "IT Consultation"]
+        list(FORM_REGISTRY)
     )
 
-    if proposal_type == "AI Automation":
-        render_ai_automation_form()
-    elif proposal_type == "AI Automation without LPW":
-        render_ai_automation_without_lpw_form()
-    elif proposal_type == "Digital Marketing":
-        render_dm_form()
-    elif proposal_type == "Business Automations":
-        render_ba_form()
-    else:  # IT Consultation
-        render_contract_form()
+    # Only the selected form is imported; python-docx and the PDF converters
+    # load on the first Generate click
+    get_form_renderer(proposal_type)()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
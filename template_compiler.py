@@ -0,0 +1,98 @@
+"""Compile templates into render plans and check them against the forms.
+
+    python -m pdf_generator compile templates/
+    python -m pdf_generator compile templates/ --strict   # exit 1 on missing keys
+
+For every template this writes ``<template>.<hash>.plan.json`` to the plans
+directory of the artifact cache (``PROPOSAL_CACHE_DIR``, see
+``pdf_generator.compile_template_plan``) and reports, for templates used
+by a form, placeholders the form never fills ("missing") and keys the
+form sends that the template does not contain ("unused").
+"""
+import os
+import ast
+import sys
+import json
+import argparse
+
+from pdf_generator import TEMPLATE_DIR, PLACEHOLDER_PATTERN, load_render_plan, plan_path_for, template_paths
+from proposals import FORM_REGISTRY
+
+def form_keys(module_name):
+    """Placeholder keys a form module emits, read from its source without importing it"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), *module_name.split(".")) + ".py"
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    keys = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Dict):
+            for key in node.keys:
+                if (isinstance(key, ast.Constant) and isinstance(key.value, str)
+                        and PLACEHOLDER_PATTERN.fullmatch(key.value)):
+                    keys.add(key.value)
+    return keys
+
+def validate_plan(plan, keys):
+    """Return (missing, unused) placeholder keys for a plan and the keys its form emits"""
+    slots = set(plan["slots"])
+    return sorted(slots - keys), sorted(keys - slots)
+
+def _template_files(targets):
+    for target in targets:
+        if os.path.isdir(target):
+            for name in sorted(os.listdir(target)):
+                if name.endswith(".docx") and not name.startswith("~$"):
+                    yield os.path.join(target, name)
+        else:
+            yield target
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pdf_generator",
+                                     description="Compile DOCX templates into render plans")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    compile_parser = subcommands.add_parser("compile", help="Compile templates and validate them against the forms")
+    compile_parser.add_argument("targets", nargs="*", default=[TEMPLATE_DIR],
+                                help="Template files or directories (default: templates/)")
+    compile_parser.add_argument("--strict", action="store_true",
+                                help="Exit with status 1 when a template has placeholders its form never fills")
+    compile_parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    # Proposal type for each template file name, to find the form that fills it
+    proposal_types = {file_name: proposal_type for proposal_type, file_name in template_paths.items()}
+    report = []
+    for path in _template_files(args.targets):
+        plan = load_render_plan(path)
+        entry = {
+            "template": os.path.basename(path),
+            "plan": plan_path_for(path),
+            "slots": len(plan["slots"]),
+            "locations": sum(len(part["locations"]) for part in plan["parts"].values()),
+            "parts": sorted(plan["parts"]),
+        }
+        proposal_type = proposal_types.get(os.path.basename(path))
+        if proposal_type in FORM_REGISTRY:
+            missing, unused = validate_plan(plan, form_keys(FORM_REGISTRY[proposal_type][0]))
+            entry.update(proposal_type=proposal_type, missing=missing, unused=unused)
+        report.append(entry)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for entry in report:
+            print(f"{entry['template']}: {entry['slots']} slots at {entry['locations']} locations "
+                  f"in {', '.join(entry['parts']) or 'no parts'} -> {entry['plan'] or 'not persisted'}")
+            if "proposal_type" not in entry:
+                print("  no form uses this template")
+                continue
+            for key in entry["missing"]:
+                print(f"  missing: {key} is in the template but the {entry['proposal_type']} form never fills it")
+            for key in entry["unused"]:
+                print(f"  unused:  {key} is sent by the {entry['proposal_type']} form but not in the template")
+
+    if args.strict and any(entry.get("missing") for entry in report):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+"""Shrink the images embedded in DOCX templates.
+
+Every image is downsampled to TARGET_DPI at the largest size it is drawn
+at in the document and recompressed. Lossless images stay lossless (PNG), as
+logos and screenshots show JPEG artifacts at text edges; with
+TEMPLATE_MEDIA_PNG_TO_JPEG=on, opaque photographic ones become JPEG when that
+is at most half the size. A new image is only kept when it is meaningfully
+smaller. The optimized copy of a template is written once per
+template version to TEMPLATE_MEDIA_DIR or the ``optimized`` directory of the
+artifact cache (see output_cache), together with a JSON report of the
+savings; without a writable directory the template is used as is:
+
+    python -m template_media templates/            # report per template
+    python -m template_media templates/ --dpi 150  # try another target
+"""
+import io
+import os
+import re
+import sys
+import json
+import math
+import hashlib
+import zipfile
+import argparse
+import posixpath
+from lxml import etree
+from PIL import Image
+
+from output_cache import artifact_dir
+
+TARGET_DPI = int(os.environ.get("TEMPLATE_MEDIA_DPI", 200))
+JPEG_QUALITY = int(os.environ.get("TEMPLATE_MEDIA_QUALITY", 85))
+# Bump whenever the optimizer's output changes, so cached copies are rebuilt
+OPTIMIZER_VERSION = 2
+# Lossy re-encoding of PNG, BMP and TIFF images is opt-in
+PNG_TO_JPEG = os.environ.get("TEMPLATE_MEDIA_PNG_TO_JPEG", "off").lower() in ("1", "on", "true")
+# ...and even then only used when the JPEG is at most this share of the PNG
+JPEG_MAX_SHARE = 0.5
+# Keep a recompressed image only if it saves at least this share of the original
+MIN_SAVING = 0.05
+
+EMU_PER_INCH = 914400
+NAMESPACES = {
+    "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "wp": "http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing",
+    "pic": "http://schemas.openxmlformats.org/drawingml/2006/picture",
+}
+REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+CONTENT_TYPES_NS = "{http://schemas.openxmlformats.org/package/2006/content-types}"
+IMAGE_REL_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"
+R_EMBED = "{%s}embed" % NAMESPACES["r"]
+XML_PART_PATTERN = re.compile(r"^word/[^/]+\.xml$")
+
+def _rels_name(part_name):
+    directory, name = posixpath.split(part_name)
+    return posixpath.join(directory, "_rels", name + ".rels")
+
+def _image_targets(rels_xml, part_name):
+    """Relationship id -> media entry name for the image relationships of a part"""
+    targets = {}
+    for rel in etree.fromstring(rels_xml).iter(REL_NS + "Relationship"):
+        if rel.get("Type") == IMAGE_REL_TYPE and rel.get("TargetMode") != "External":
+            targets[rel.get("Id")] = posixpath.normpath(
+                posixpath.join(posixpath.dirname(part_name), rel.get("Target")))
+    return targets
+
+def displayed_sizes(entries):
+    """Largest drawn size in inches of every media entry, or None where it cannot be scaled safely"""
+    sizes = {}
+    for part_name, data in entries.items():
+        rels_name = _rels_name(part_name)
+        if not XML_PART_PATTERN.match(part_name) or rels_name not in entries:
+            continue
+        targets = _image_targets(entries[rels_name], part_name)
+        if not targets:
+            continue
+        root = etree.fromstring(data)
+        for blip in root.iter("{%s}blip" % NAMESPACES["a"]):
+            target = targets.get(blip.get(R_EMBED))
+            if target is None:
+                continue
+            extent = blip.xpath("ancestor::wp:inline/wp:extent | ancestor::wp:anchor/wp:extent",
+                                namespaces=NAMESPACES)
+            cropped = blip.xpath("ancestor::pic:blipFill/a:srcRect[@l or @t or @r or @b]",
+                                 namespaces=NAMESPACES)
+            if not extent or cropped or sizes.get(target, ()) is None:
+                # Cropped pictures show only part of the image at that size
+                sizes[target] = None
+                continue
+            width = int(extent[-1].get("cx")) / EMU_PER_INCH
+            height = int(extent[-1].get("cy")) / EMU_PER_INCH
+            previous = sizes.get(target, (0, 0))
+            sizes[target] = (max(previous[0], width), max(previous[1], height))
+        # Pictures referenced some other way (VML shapes, fills) are only recompressed
+        for target in targets.values():
+            sizes.setdefault(target, None)
+    return sizes
+
+def _has_alpha(image):
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        alpha = image.convert("RGBA").getchannel("A")
+        return alpha.getextrema()[0] < 255
+    return False
+
+def optimize_image(data, display_size, target_dpi=TARGET_DPI, quality=JPEG_QUALITY, png_to_jpeg=PNG_TO_JPEG):
+    """Return (bytes, format, pixel size) of a smaller version of an image, or None to keep it"""
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception:
+        return None  # EMF, WMF, SVG and anything else Pillow cannot decode
+    source_format = image.format
+    if source_format not in ("JPEG", "PNG", "BMP", "TIFF"):
+        return None
+
+    if display_size is not None:
+        needed = (math.ceil(display_size[0] * target_dpi), math.ceil(display_size[1] * target_dpi))
+        scale = max(needed[0] / image.width, needed[1] / image.height)
+        if scale < 1 - MIN_SAVING:
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            image = image.resize(size, Image.LANCZOS)
+
+    if source_format == "JPEG":
+        optimized, output_format = _encode_jpeg(image, quality), "JPEG"
+    else:
+        if image.mode in ("RGBA", "LA") and not _has_alpha(image):
+            image = image.convert(image.mode[:-1])
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG", optimize=True)
+        optimized, output_format = buffer.getvalue(), "PNG"
+        if png_to_jpeg and image.getcolors(256) is None and not _has_alpha(image):
+            jpeg = _encode_jpeg(image, quality)
+            if len(jpeg) <= len(optimized) * JPEG_MAX_SHARE:
+                optimized, output_format = jpeg, "JPEG"
+
+    if len(optimized) > len(data) * (1 - MIN_SAVING):
+        return None
+    return optimized, output_format, image.size
+
+def _encode_jpeg(image, quality):
+    if image.mode not in ("RGB", "L", "CMYK"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+def optimize_template(data, target_dpi=TARGET_DPI, quality=JPEG_QUALITY):
+    """Return (optimized DOCX bytes, report) for the bytes of a DOCX template"""
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        infos = archive.infolist()
+        entries = {info.filename: archive.read(info) for info in infos}
+
+    sizes = displayed_sizes(entries)
+    report = {"original_bytes": len(data), "target_dpi": target_dpi, "quality": quality, "images": []}
+    renamed = {}
+    for name in sorted(sizes):
+        if name not in entries:
+            continue
+        result = optimize_image(entries[name], sizes[name], target_dpi, quality)
+        original = entries[name]
+        item = {"name": name, "format": None, "size": None, "bytes": len(original)}
+        try:
+            with Image.open(io.BytesIO(original)) as image:
+                item.update(format=image.format, size=list(image.size))
+        except Exception:
+            pass
+        if result is not None:
+            optimized, output_format, size = result
+            new_name = name
+            extension = ".jpeg" if output_format == "JPEG" else ".png"
+            if output_format != item["format"] and not name.lower().endswith(extension):
+                new_name = posixpath.splitext(name)[0] + extension
+                while new_name in entries:
+                    new_name = posixpath.splitext(new_name)[0] + "_opt" + extension
+                renamed[name] = new_name
+            entries[new_name] = optimized
+            item.update(new_name=new_name, new_format=output_format, new_size=list(size), new_bytes=len(optimized))
+        report["images"].append(item)
+
+    if renamed:
+        _rename_media(entries, renamed)
+    for old_name in renamed:
+        del entries[old_name]
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for info in infos:
+            name = renamed.get(info.filename, info.filename)
+            entry = zipfile.ZipInfo(name, date_time=info.date_time)
+            entry.compress_type = info.compress_type
+            entry.external_attr = info.external_attr
+            archive.writestr(entry, entries[name])
+    optimized = buffer.getvalue()
+    report["optimized_bytes"] = len(optimized)
+    report["saved_bytes"] = len(data) - len(optimized)
+    report["saved_percent"] = round(100 * report["saved_bytes"] / len(data), 1) if data else 0
+    return optimized, report
+
+def _rename_media(entries, renamed):
+    """Point relationships and content types at media entries that changed extension"""
+    for name in list(entries):
+        if not name.endswith(".rels"):
+            continue
+        part_name = posixpath.join(posixpath.dirname(posixpath.dirname(name)), posixpath.basename(name)[:-5])
+        root = etree.fromstring(entries[name])
+        changed = False
+        for rel in root.iter(REL_NS + "Relationship"):
+            if rel.get("TargetMode") == "External" or not rel.get("Target"):
+                continue
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(part_name), rel.get("Target")))
+            if target in renamed:
+                directory = posixpath.dirname(rel.get("Target"))
+                rel.set("Target", posixpath.join(directory, posixpath.basename(renamed[target])))
+                changed = True
+        if changed:
+            entries[name] = etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+    content_types = etree.fromstring(entries["[Content_Types].xml"])
+    defaults = {element.get("Extension").lower() for element in content_types.iter(CONTENT_TYPES_NS + "Default")}
+    for element in content_types.iter(CONTENT_TYPES_NS + "Override"):
+        part_name = element.get("PartName", "").lstrip("/")
+        if part_name in renamed:
+            element.set("PartName", "/" + renamed[part_name])
+    for new_name in renamed.values():
+        extension = posixpath.splitext(new_name)[1][1:]
+        if extension not in defaults:
+            default = etree.Element(CONTENT_TYPES_NS + "Default")
+            default.set("Extension", extension)
+            default.set("ContentType", "image/jpeg" if extension == "jpeg" else "image/png")
+            content_types.insert(0, default)
+            defaults.add(extension)
+    entries["[Content_Types].xml"] = etree.tostring(content_types, xml_declaration=True,
+                                                    encoding="UTF-8", standalone=True)
+
+def optimized_dir_for():
+    return os.environ.get("TEMPLATE_MEDIA_DIR") or artifact_dir("optimized")
+
+def optimized_template_path(template_path, target_dpi=TARGET_DPI, quality=JPEG_QUALITY):
+    """Path of the media-optimized copy of a template, building it if this template version has none yet.
+
+    Falls back to the template itself when the copy cannot be written.
+    """
+    with open(template_path, "rb") as f:
+        data = f.read()
+    settings = f"{OPTIMIZER_VERSION}:{target_dpi}:{quality}"
+    digest = hashlib.sha256(data + settings.encode()).hexdigest()[:16]
+    directory = optimized_dir_for()
+    if directory is None:
+        return template_path
+    # Templates with the same name in different folders must not prune each other's copies
+    location = hashlib.sha256(os.path.abspath(template_path).encode()).hexdigest()[:12]
+    stem = f"{os.path.splitext(os.path.basename(template_path))[0]}.{location}"
+    path = os.path.join(directory, f"{stem}.{digest}.docx")
+    if os.path.exists(path):
+        return path
+
+    optimized, report = optimize_template(data, target_dpi, quality)
+    report["template"] = os.path.basename(template_path)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.splitext(path)[0] + ".report.json", "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        # Write then rename so concurrent workers never read a partial template
+        with open(temp_path, "wb") as f:
+            f.write(optimized)
+        os.replace(temp_path, path)
+    except OSError:
+        return template_path
+    _prune(directory, stem, digest)
+    return path
+
+def _prune(directory, stem, digest):
+    """Remove copies (and their reports) built from older versions of a template"""
+    pattern = re.compile(rf"^{re.escape(stem)}\.([0-9a-f]{{16}})\.")
+    for name in os.listdir(directory):
+        match = pattern.match(name)
+        if match and match.group(1) != digest:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report how much the template media optimization saves")
+    parser.add_argument("targets", nargs="*", default=["templates"], help="Template files or directories")
+    parser.add_argument("--dpi", type=int, default=TARGET_DPI)
+    parser.add_argument("--quality", type=int, default=JPEG_QUALITY, help="JPEG quality")
+    parser.add_argument("--json", action="store_true", help="Print the full reports as JSON")
+    args = parser.parse_args(argv)
+
+    reports = []
+    for target in args.targets:
+        names = sorted(os.listdir(target)) if os.path.isdir(target) else [os.path.basename(target)]
+        directory = target if os.path.isdir(target) else os.path.dirname(target)
+        for name in names:
+            if not name.endswith(".docx") or name.startswith("~$"):
+                continue
+            with open(os.path.join(directory, name), "rb") as f:
+                _, report = optimize_template(f.read(), args.dpi, args.quality)
+            report["template"] = name
+            reports.append(report)
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return 0
+    for report in reports:
+        print(f"{report['template']}: {report['original_bytes'] / 1024:.0f} KB -> "
+              f"{report['optimized_bytes'] / 1024:.0f} KB ({report['saved_percent']}% smaller)")
+        for image in report["images"]:
+            if "new_bytes" in image:
+                print(f"  {image['name']}: {image['format']} {image['size'][0]}x{image['size'][1]}, "
+                      f"{image['bytes'] / 1024:.0f} KB -> {image['new_format']} "
+                      f"{image['new_size'][0]}x{image['new_size'][1]}, {image['new_bytes'] / 1024:.0f} KB")
+            else:
+                print(f"  {image['name']}: kept ({image['bytes'] / 1024:.0f} KB)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())